@@ -0,0 +1,81 @@
+# Request deadlines with an artificially slow query: how long a request holds
+# its threadpool thread and connection with and without a deadline, and what
+# the sqlite progress handler costs a query that finishes in time
+# python -m benchmarks.bench_deadlines
+import os
+import sqlite3
+import tempfile
+import time
+
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from deadlines import current_deadline, interrupt_sqlite
+
+# counts to ROWS without touching a table
+SLOW_QUERY = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < {})"
+    " SELECT count(*) FROM c"
+)
+ROWS = 3_000_000
+REPEAT = 3
+
+
+def query_seconds(connection: sqlite3.Connection) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        connection.execute(SLOW_QUERY.format(ROWS)).fetchone()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def handler_overhead():
+    print(f"query counting to {ROWS:,}, best of {REPEAT}")
+    connection = sqlite3.connect(":memory:")
+    base = query_seconds(connection)
+    print(f"{'no progress handler':<32}{base * 1000:>8.0f} ms")
+    token = current_deadline.set(time.monotonic() + 3600)
+    try:
+        for instructions in (100, 1000, 10_000):
+            interrupt_sqlite(connection, instructions)
+            seconds = query_seconds(connection)
+            label = f"handler every {instructions} ops"
+            print(f"{label:<32}{seconds * 1000:>8.0f} ms {seconds / base - 1:>+7.1%}")
+    finally:
+        current_deadline.reset(token)
+
+
+def slow_request():
+    from sql_app.main import create_app, get_db, router
+
+    @router.get("/slow")
+    def slow(db=Depends(get_db)):
+        return db.session(0).execute(text(SLOW_QUERY.format(ROWS * 10))).scalar()
+
+    print(f"\nGET /slow in sql_app, a query counting to {ROWS * 10:,}")
+    with TestClient(create_app()) as client:
+        for timeout in (None, 0.5):
+            headers = {} if timeout is None else {"x-request-timeout": str(timeout)}
+            start = time.perf_counter()
+            response = client.get("/slow", headers=headers)
+            label = f"X-Request-Timeout: {timeout}" if timeout else "no deadline"
+            seconds = time.perf_counter() - start
+            print(f"{label:<32}{response.status_code:>8}{seconds:>8.2f} s")
+
+
+def main():
+    handler_overhead()
+    cwd = os.getcwd()
+    # sql_app's databases are relative to the working directory
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            slow_request()
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Fan-out of change feed events to many subscribers: the Broadcaster's shared
+# ring of pre-serialized events against a queue and a json.dumps per subscriber
+# python -m benchmarks.bench_feed
+import asyncio
+import json
+import threading
+import time
+
+from change_feed import Broadcaster
+
+SUBSCRIBERS = [100, 1000, 5000]
+EVENTS = 200
+ITEM = {"id": 1, "title": "x" * 100, "description": None, "owner_id": 1}
+
+
+async def broadcaster_fanout(subscribers: int) -> float:
+    feed = Broadcaster()
+    received = [0] * subscribers
+
+    async def subscriber(i):
+        async for events in feed.subscribe():
+            received[i] += len(b"".join(event.sse for event in events))
+            if events and events[-1].seq == EVENTS:
+                return
+
+    tasks = [asyncio.create_task(subscriber(i)) for i in range(subscribers)]
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    publisher = threading.Thread(
+        target=lambda: [feed.publish("item_created", ITEM) for _ in range(EVENTS)]
+    )
+    publisher.start()
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start
+
+
+async def queue_fanout(subscribers: int) -> float:
+    loop = asyncio.get_running_loop()
+    queues = [asyncio.Queue() for _ in range(subscribers)]
+
+    async def subscriber(queue):
+        for _ in range(EVENTS):
+            event = await queue.get()
+            json.dumps(event).encode()
+
+    def publish():
+        for _ in range(EVENTS):
+            for queue in queues:
+                loop.call_soon_threadsafe(queue.put_nowait, ITEM)
+
+    tasks = [asyncio.create_task(subscriber(queue)) for queue in queues]
+    start = time.perf_counter()
+    threading.Thread(target=publish).start()
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{EVENTS} events")
+    print(f"{'subscribers':>12}{'queues s':>12}{'broadcaster s':>15}")
+    for subscribers in SUBSCRIBERS:
+        queues = asyncio.run(queue_fanout(subscribers))
+        broadcaster = asyncio.run(broadcaster_fanout(subscribers))
+        print(f"{subscribers:>12}{queues:>12.3f}{broadcaster:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
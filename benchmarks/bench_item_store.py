@@ -0,0 +1,89 @@
+# Read throughput while other threads write: ItemStore's lock-free snapshot
+# reads against a dict guarded by a lock, both logging writes to disk
+# python -m benchmarks.bench_item_store
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import orjson
+
+from item_store import ItemStore
+
+ITEMS = 10_000
+READERS = 4
+WRITERS = [0, 1, 4]
+SECONDS = 2
+
+
+class LockedStore:
+    """A module level dict made safe the usual way: one lock for everything."""
+
+    def __init__(self, path: Path):
+        self.items: dict[str, bytes] = {}
+        self.lock = threading.Lock()
+        self.log = open(path / "log.jsonl", "ab")
+
+    def get(self, item_id: str):
+        with self.lock:
+            return self.items.get(item_id)
+
+    def put(self, item_id: str, value) -> None:
+        encoded = orjson.dumps(value)
+        with self.lock:
+            self.log.write(encoded + b"\n")
+            self.log.flush()
+            self.items[item_id] = encoded
+
+
+def run(store, writers: int) -> tuple[float, float]:
+    for i in range(ITEMS):
+        store.put(f"item-{i}", {"name": f"Item {i}", "price": i})
+    stop = threading.Event()
+    reads = [0] * READERS
+    writes = [0] * writers
+
+    def reader(n):
+        i = 0
+        while not stop.is_set():
+            for _ in range(1000):
+                store.get(f"item-{i % ITEMS}")
+                i += 7
+            reads[n] += 1000
+
+    def writer(n):
+        i = n
+        while not stop.is_set():
+            store.put(f"item-{i % ITEMS}", {"name": "changed", "price": i})
+            writes[n] += 1
+            i += 13
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(READERS)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / SECONDS, sum(writes) / SECONDS
+
+
+def main():
+    print(f"{ITEMS} items, {READERS} reader threads, {SECONDS}s per run")
+    print(f"{'store':>12}{'writers':>9}{'reads/s':>14}{'writes/s':>12}")
+    for writers in WRITERS:
+        for name, make_store in [
+            ("locked dict", LockedStore),
+            ("ItemStore", lambda path: ItemStore(path, snapshot_every=10_000)),
+        ]:
+            with tempfile.TemporaryDirectory() as tmp:
+                store = make_store(Path(tmp))
+                reads, writes = run(store, writers)
+                if isinstance(store, ItemStore):
+                    store.close()
+            print(f"{name:>12}{writers:>9}{reads:>14,.0f}{writes:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
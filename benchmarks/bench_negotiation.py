@@ -0,0 +1,46 @@
+# Encode/decode cost and payload size of dict[int, float] bodies: JSON vs MessagePack/CBOR
+# python -m benchmarks.bench_negotiation
+import json
+import random
+import time
+
+import orjson
+
+from negotiation import cbor2, msgpack, unpack_msgpack
+
+ENTRIES = 100_000
+ROUNDS = 10
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = fn(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1000, result
+
+
+def main():
+    weights = {i: random.random() for i in range(ENTRIES)}
+    formats = [
+        ("json", lambda data: json.dumps(data).encode(), json.loads),
+        (
+            "orjson",
+            lambda data: orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS),
+            orjson.loads,
+        ),
+    ]
+    if msgpack is not None:
+        formats.append(("msgpack", msgpack.packb, unpack_msgpack))
+    if cbor2 is not None:
+        formats.append(("cbor", cbor2.dumps, cbor2.loads))
+
+    print(f"dict[int, float] with {ENTRIES} entries")
+    print(f"{'format':<10}{'size':>12}{'encode ms':>12}{'decode ms':>12}")
+    for name, encode, decode in formats:
+        encode_ms, payload = timed(encode, weights)
+        decode_ms, _ = timed(decode, payload)
+        print(f"{name:<10}{len(payload):>12}{encode_ms:>12.1f}{decode_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
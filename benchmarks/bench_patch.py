@@ -0,0 +1,64 @@
+# Patch throughput on large items: the tutorial's PATCH vs item_patch.PatchStore
+# python -m benchmarks.bench_patch
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from body_updates import Item
+from item_patch import PatchStore
+
+TAGS = 10_000
+ROUNDS = 200
+
+
+def large_item() -> dict:
+    return {
+        "name": "Foo",
+        "description": "A very large item",
+        "price": 50.2,
+        "tags": [f"tag-{i}" for i in range(TAGS)],
+    }
+
+
+def bench(label: str, fn) -> None:
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {ROUNDS / elapsed:>10.0f} patches/s")
+
+
+def main():
+    print(f"item with {TAGS} tags, one field changed per patch")
+
+    items = {"foo": large_item()}
+
+    def tutorial_patch(i: int):
+        # body_updates.update_item before the patch engine
+        stored_item_model = Item(**items["foo"])
+        update_data = Item(price=i).dict(exclude_unset=True)
+        updated_item = stored_item_model.copy(update=update_data)
+        items["foo"] = jsonable_encoder(updated_item)
+
+    store = PatchStore(Item, {"foo": large_item()})
+
+    def store_patch(i: int):
+        store.patch("foo", Item(price=i).dict(exclude_unset=True), validated=True)
+        store.get_encoded("foo")
+
+    def store_patch_raw(i: int):
+        store.patch("foo", {"price": str(i)})
+        store.get_encoded("foo")
+
+    bench("re-validate + jsonable_encoder", tutorial_patch)
+    bench("PatchStore (pre-validated) + encode", store_patch)
+    bench("PatchStore (validate_fields) + encode", store_patch_raw)
+
+    def store_read(i: int):
+        store.get_encoded("foo")
+
+    bench("PatchStore cached read", store_read)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Route lookup cost as the route table grows: Starlette's linear regex scan vs the radix tree
+# python -m benchmarks.bench_router
+import random
+import time
+
+from fastapi import FastAPI
+from starlette.routing import Match
+
+from radix_router import use_radix_router
+
+SIZES = [10, 100, 1000]
+LOOKUPS = 20_000
+
+
+def endpoint():
+    return {}
+
+
+def build_app(size: int) -> FastAPI:
+    app = FastAPI()
+    router = use_radix_router(app)
+    # a mix of the usual shapes: collections, typed ids, sub resources
+    for i in range(size // 4):
+        app.get(f"/resource{i}/")(endpoint)
+        app.get(f"/resource{i}/{{item_id:int}}")(endpoint)
+        app.put(f"/resource{i}/{{item_id:int}}")(endpoint)
+        app.get(f"/resource{i}/{{item_id}}/children/{{child_id}}")(endpoint)
+    router.compile()
+    return app
+
+
+def linear_find(routes, scope):
+    # what starlette.routing.Router.__call__ does
+    partial = None
+    for route in routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return route
+        if match == Match.PARTIAL and partial is None:
+            partial = route
+    return partial
+
+
+def scopes(size: int) -> list[dict]:
+    resources = size // 4
+    paths = []
+    for _ in range(LOOKUPS):
+        i = random.randrange(resources)
+        paths.append(
+            random.choice(
+                [
+                    f"/resource{i}/",
+                    f"/resource{i}/{random.randrange(1000)}",
+                    f"/resource{i}/x{random.randrange(1000)}/children/7",
+                ]
+            )
+        )
+    return [{"type": "http", "path": path, "method": "GET"} for path in paths]
+
+
+def timed(fn, requests) -> float:
+    start = time.perf_counter()
+    for scope in requests:
+        assert fn(scope) is not None
+    return (time.perf_counter() - start) / len(requests) * 1_000_000
+
+
+def main():
+    print(f"{'routes':>8}{'linear us':>12}{'radix us':>12}{'speedup':>10}")
+    for size in SIZES:
+        app = build_app(size)
+        routes = app.router.routes
+        requests = scopes(size)
+        linear_us = timed(lambda scope: linear_find(routes, scope), requests)
+        radix_us = timed(lambda scope: app.router.find(scope)[1], requests)
+        print(
+            f"{len(routes):>8}{linear_us:>12.2f}{radix_us:>12.2f}"
+            f"{linear_us / radix_us:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
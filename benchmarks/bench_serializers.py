@@ -0,0 +1,74 @@
+# FastAPI's per-response serialization vs fast_serializers.compile_serializer
+# on the responce_model.py / responce_model2.py routes
+# python -m benchmarks.bench_serializers
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import responce_model
+import responce_model2
+from fast_serializers import compile_serializer
+
+ROUNDS = 20_000
+
+ROUTES = [
+    (
+        "responce_model2 /items/{id}/name",
+        responce_model2.Item,
+        responce_model2.items["bar"],
+        {"include": {"name", "description"}},
+    ),
+    (
+        "responce_model2 /items/{id}/public",
+        responce_model2.Item,
+        responce_model2.items["bar"],
+        {"exclude": {"tax"}},
+    ),
+    (
+        "responce_model /items/{id}",
+        responce_model.Item,
+        responce_model.items["bar"],
+        {"exclude_unset": True},
+    ),
+]
+
+
+def fastapi_serializer(model, options):
+    field = create_response_field(name="response", type_=model)
+
+    def serialize(content):
+        # serialize_response never awaits for async endpoints, drive it without a loop
+        coroutine = serialize_response(field=field, response_content=content, **options)
+        try:
+            coroutine.send(None)
+        except StopIteration as done:
+            return JSONResponse(done.value).body
+
+    return serialize
+
+
+def timed(fn, content) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(content)
+    return ROUNDS / (time.perf_counter() - start)
+
+
+def main():
+    for label, model, content, options in ROUTES:
+        slow = fastapi_serializer(model, options)
+        fast = compile_serializer(model, **options)
+        assert json.loads(slow(content)) == json.loads(fast(content)), label
+        slow_rate = timed(slow, content)
+        fast_rate = timed(fast, content)
+        print(
+            f"{label:<38} fastapi {slow_rate:>9.0f}/s  compiled {fast_rate:>9.0f}/s"
+            f"  x{fast_rate / slow_rate:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
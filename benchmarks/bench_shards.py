@@ -0,0 +1,74 @@
+# Write throughput of sql_app with 1, 2, 4 and 8 shards: processes adding
+# items for many users, each commit waits for its shard's SQLite write lock
+# (processes, threads would mostly wait for the GIL)
+# python -m benchmarks.bench_shards
+import multiprocessing
+import os
+import tempfile
+import time
+
+from sql_app import crud, database, schemas, sharding
+
+SHARDS = [1, 2, 4, 8]
+WRITERS = 8
+USERS = 64
+SECONDS = 3
+
+
+def run(shards: int) -> float:
+    sharding.create_all(shards)
+    user_ids = []
+    db = sharding.Shards(shards)
+    for i in range(USERS):
+        user = crud.create_user(
+            db, schemas.UserCreate(email=f"{i}@x.com", password="p")
+        )
+        user_ids.append(user.id)
+    db.close()
+    fork = multiprocessing.get_context("fork")
+    stop = fork.Event()
+    created = fork.Value("i", 0)
+
+    def writer(n):
+        item = schemas.ItemCreate(title="item")
+        db = sharding.Shards(shards)
+        i = count = 0
+        while not stop.is_set():
+            crud.create_user_item(db, item, user_id=user_ids[(n + i) % USERS])
+            count += 1
+            i += WRITERS
+        db.close()
+        with created.get_lock():
+            created.value += count
+
+    writers = [fork.Process(target=writer, args=(n,)) for n in range(WRITERS)]
+    for process in writers:
+        process.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for process in writers:
+        process.join()
+    return created.value / SECONDS
+
+
+def main():
+    print(f"{WRITERS} processes adding items for {USERS} users")
+    print(f"{'shards':>7}{'items/s':>10}")
+    cwd = os.getcwd()
+    for shards in SHARDS:
+        # the databases are relative to the working directory
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                print(f"{shards:>7}{run(shards):>10.0f}")
+            finally:
+                os.chdir(cwd)
+                for engine in database.engines.values():
+                    engine.dispose()
+                database.engines.clear()
+                sharding.new_user_id.reset()
+                sharding.new_item_id.reset()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Cold start of the apps: where the import time goes (python -X importtime)
+# and how long `uvicorn module:app` takes to answer its first request
+# python -m benchmarks.bench_startup [module:app ...]
+import http.client
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# app, first request
+APPS = [
+    ("main:app", "/"),
+    ("main_security2:app", "/users/me/"),
+    ("sql_app.main:app", "/users/"),
+]
+ROUNDS = 5
+TOP = 8
+
+
+def import_times(module: str) -> tuple[float, dict[str, float]]:
+    """Total import ms of `module` and self ms per top level package."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages: dict[str, float] = defaultdict(float)
+    total = 0.0
+    # import time: self [us] | cumulative | imported package
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+        if name.strip() == module:
+            total = int(cumulative_us) / 1000
+    return total, packages
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_response(app: str, path: str) -> tuple[float, int]:
+    """ms from starting the server process to the end of the first response."""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                return (time.perf_counter() - start) * 1000, response.status
+            except ConnectionRefusedError:
+                if server.poll() is not None:
+                    raise RuntimeError(f"{app} exited with {server.returncode}")
+                time.sleep(0.005)
+            finally:
+                connection.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    apps = APPS
+    if len(sys.argv) > 1:
+        paths = dict(APPS)
+        apps = [(app, paths.get(app, "/")) for app in sys.argv[1:]]
+    # paid by every app before its own imports
+    uvicorn_ms = statistics.median(import_times("uvicorn")[0] for _ in range(ROUNDS))
+    print(f"import uvicorn: {uvicorn_ms:.0f} ms\n")
+    for app, path in apps:
+        module = app.split(":")[0]
+        totals, runs = [], []
+        for _ in range(ROUNDS):
+            total, packages = import_times(module)
+            totals.append(total)
+            ms, status = first_response(app, path)
+            runs.append(ms)
+        print(f"{app}")
+        print(f"  import {module}: {statistics.median(totals):.0f} ms, by package:")
+        for name, ms in sorted(packages.items(), key=lambda p: -p[1])[:TOP]:
+            print(f"    {name:<24}{ms:>8.1f}")
+        print(
+            f"  first response GET {path} ({status}): "
+            f"{statistics.median(runs):.0f} ms median, {min(runs):.0f} min\n"
+        )
+
+
+if __name__ == "__main__":
+    main()
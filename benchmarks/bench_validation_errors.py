@@ -0,0 +1,64 @@
+# Cost and size of 422 responses for pathological Offer bodies:
+# FastAPI's default handler, the tutorial's body echoing one, the bounded one
+# python -m benchmarks.bench_validation_errors
+import asyncio
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+
+from main import Offer
+from validation_errors import bounded_validation_handler
+
+SIZES = [100, 10_000, 100_000]
+ROUNDS = 3
+
+
+async def echo_body_handler(request, exc: RequestValidationError):
+    # error_handling.py's "Use the RequestValidationError body" handler
+    return JSONResponse(
+        status_code=422,
+        content=jsonable_encoder({"detail": exc.errors(), "body": exc.body}),
+    )
+
+
+def invalid_offer(bad_items: int) -> RequestValidationError:
+    body = {
+        "name": "Offer",
+        "price": 10,
+        "items": [{"name": f"item {i}", "price": "free"} for i in range(bad_items)],
+    }
+    try:
+        Offer.parse_obj(body)
+    except ValidationError as exc:
+        return RequestValidationError([ErrorWrapper(exc, ("body",))], body=body)
+    raise AssertionError("the offer should be invalid")
+
+
+def timed(handler, exc) -> tuple[float, int]:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        response = asyncio.run(handler(None, exc))
+    return (time.perf_counter() - start) / ROUNDS * 1000, len(response.body)
+
+
+def main():
+    handlers = [
+        ("default", request_validation_exception_handler),
+        ("echo body", echo_body_handler),
+        ("bounded", bounded_validation_handler()),
+    ]
+    print(f"{'bad items':>10}{'handler':>12}{'ms':>10}{'bytes':>12}")
+    for size in SIZES:
+        exc = invalid_offer(size)
+        for name, handler in handlers:
+            ms, length = timed(handler, exc)
+            print(f"{size:>10}{name:>12}{ms:>10.2f}{length:>12}")
+
+
+if __name__ == "__main__":
+    main()
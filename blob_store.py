@@ -0,0 +1,235 @@
+# Content-addressed blob storage with reference counting
+# Files are stored once per SHA-256 digest under objects/<2 chars>/<rest>,
+# names (file names, upload references...) point at digests.
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO
+
+CHUNK_SIZE = 1024 * 1024
+DIGEST_LENGTH = 64
+
+
+def is_digest(value: str) -> bool:
+    return len(value) == DIGEST_LENGTH and all(c in "0123456789abcdef" for c in value)
+
+
+class BlobStore:
+    """
+    A local deduplicating store.
+
+    `refcount` counts the names that point at a blob. Blobs that nothing
+    points at are removed by `gc()` once they are older than `grace_seconds`,
+    which leaves clients time to link a blob they uploaded on its own.
+    """
+
+    def __init__(
+        self, root: str | os.PathLike = "blob_store", grace_seconds: float = 3600
+    ):
+        self.root = Path(root)
+        self.grace_seconds = grace_seconds
+        self.objects_dir = self.root / "objects"
+        self.tmp_dir = self.root / "tmp"
+        self.index_path = self.root / "index.db"
+        # the directories and the index are created on first use, importing
+        # an app that declares a store doesn't touch the disk
+        self.created = False
+        self.create_lock = threading.Lock()
+
+    def create(self) -> None:
+        with self.create_lock:
+            if self.created:
+                return
+            self.objects_dir.mkdir(parents=True, exist_ok=True)
+            self.tmp_dir.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            try:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS blobs (
+                        digest TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        refcount INTEGER NOT NULL DEFAULT 0,
+                        touched_at REAL NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS names (
+                        name TEXT PRIMARY KEY,
+                        digest TEXT NOT NULL REFERENCES blobs (digest)
+                    );
+                    CREATE INDEX IF NOT EXISTS blobs_unreferenced ON blobs (refcount, touched_at);
+                    """
+                )
+            finally:
+                db.close()
+            self.created = True
+
+    @contextmanager
+    def connect(self):
+        if not self.created:
+            self.create()
+        db = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest[2:]
+
+    def size(self, digest: str) -> int | None:
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT size FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def exists(self, digest: str) -> bool:
+        return self.size(digest) is not None
+
+    def ingest(self, file: BinaryIO) -> tuple[str, int]:
+        """Copy `file` into the store and return its (digest, size)."""
+        sha256 = hashlib.sha256()
+        size = 0
+        if not self.created:
+            self.create()
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while chunk := file.read(CHUNK_SIZE):
+                    sha256.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            return self.ingest_path(Path(tmp_name), sha256.hexdigest(), size)
+        finally:
+            Path(tmp_name).unlink(missing_ok=True)
+
+    def ingest_file(self, path: Path) -> tuple[str, int]:
+        """Hash a file and move it into the store, it must be on the same file system."""
+        sha256 = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                sha256.update(chunk)
+                size += len(chunk)
+        return self.ingest_path(path, sha256.hexdigest(), size)
+
+    def ingest_path(self, tmp_path: Path, digest: str, size: int) -> tuple[str, int]:
+        """Move an already hashed file (on the same file system) into the store."""
+        with self.transaction() as db:
+            db.execute(
+                "INSERT INTO blobs (digest, size, touched_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (digest) DO UPDATE SET touched_at = excluded.touched_at",
+                (digest, size, time.time()),
+            )
+            path = self.path(digest)
+            if not path.exists():
+                path.parent.mkdir(exist_ok=True)
+                os.replace(tmp_path, path)
+        return digest, size
+
+    def ingest_bytes(self, content: bytes) -> tuple[str, int]:
+        digest = hashlib.sha256(content).hexdigest()
+        if self.exists(digest):
+            self.touch(digest)
+            return digest, len(content)
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(content)
+            return self.ingest_path(Path(tmp_name), digest, len(content))
+        finally:
+            Path(tmp_name).unlink(missing_ok=True)
+
+    def touch(self, digest: str) -> None:
+        with self.connect() as db:
+            db.execute(
+                "UPDATE blobs SET touched_at = ? WHERE digest = ?",
+                (time.time(), digest),
+            )
+
+    def resolve(self, name: str) -> str | None:
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT digest FROM names WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def link(self, name: str, digest: str) -> None:
+        """Point `name` at `digest`, releasing whatever it pointed at before."""
+        with self.transaction() as db:
+            if (
+                db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                is None
+            ):
+                raise KeyError(digest)
+            row = db.execute(
+                "SELECT digest FROM names WHERE name = ?", (name,)
+            ).fetchone()
+            if row and row[0] == digest:
+                return
+            if row:
+                db.execute(
+                    "UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", row
+                )
+            db.execute(
+                "INSERT INTO names (name, digest) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET digest = excluded.digest",
+                (name, digest),
+            )
+            db.execute(
+                "UPDATE blobs SET refcount = refcount + 1 WHERE digest = ?", (digest,)
+            )
+
+    def unlink(self, name: str) -> bool:
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT digest FROM names WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return False
+            db.execute("DELETE FROM names WHERE name = ?", (name,))
+            db.execute(
+                "UPDATE blobs SET refcount = refcount - 1, touched_at = ? WHERE digest = ?",
+                (time.time(), row[0]),
+            )
+        return True
+
+    def gc(self) -> int:
+        """Delete unreferenced blobs older than the grace period, returns how many."""
+        cutoff = time.time() - self.grace_seconds
+        removed = 0
+        with self.transaction() as db:
+            rows = db.execute(
+                "SELECT digest FROM blobs WHERE refcount <= 0 AND touched_at < ?",
+                (cutoff,),
+            ).fetchall()
+            for (digest,) in rows:
+                db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                self.path(digest).unlink(missing_ok=True)
+                removed += 1
+        # leftovers from interrupted uploads
+        for tmp in self.tmp_dir.iterdir():
+            try:
+                if tmp.stat().st_mtime < cutoff:
+                    tmp.unlink()
+            except FileNotFoundError:
+                pass
+        return removed
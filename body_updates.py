@@ -1,7 +1,11 @@
-from fastapi import FastAPI
-from fastapi.encoders import jsonable_encoder
+from fastapi import FastAPI, Header, Request, Response, status
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
+from etags import check_if_match, not_modified
+from item_patch import PatchStore
+from item_store import VersionConflict
+
 app = FastAPI()
 
 
@@ -13,32 +17,86 @@ class Item(BaseModel):
     tags: list[str] = []
 
 
-items = {
-    "foo": {"name": "Foo", "price": 50.2},
-    "bar": {"name": "Bar", "description": "The bartenders", "price": 62, "tax": 20.2},
-    "baz": {"name": "Baz", "description": None, "price": 50.2, "tax": 10.5, "tags": []},
-}
+# items are validated once here, PATCH only touches the changed fields and the
+# JSON of each item is encoded once per change (the ETag is its hash). They are
+# kept in item_store/body_updates and survive restarts.
+items = PatchStore(
+    Item,
+    {
+        "foo": {"name": "Foo", "price": 50.2},
+        "bar": {
+            "name": "Bar",
+            "description": "The bartenders",
+            "price": 62,
+            "tax": 20.2,
+        },
+        "baz": {
+            "name": "Baz",
+            "description": None,
+            "price": 50.2,
+            "tax": 10.5,
+            "tags": [],
+        },
+    },
+    path="item_store/body_updates",
+)
+
+
+@app.on_event("shutdown")
+def save_items():
+    items.close()
+
+
+@app.exception_handler(VersionConflict)
+async def version_conflict_handler(request: Request, exc: VersionConflict):
+    # changed by another request between the If-Match check and the write
+    return JSONResponse(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        content={"detail": "Item was modified, fetch it again before updating"},
+    )
+
+
+def matched_version(item_id: str, if_match: str | None) -> int | None:
+    """The version an If-Match header was checked against, 0 for a new item."""
+    record = items.record(item_id)
+    check_if_match(if_match, record.etag if record else None)
+    if if_match is None:
+        return None
+    return record.version if record else 0
+
+
+def item_response(item_id: str) -> Response:
+    # already encoded, skips response_model validation and jsonable_encoder
+    return Response(
+        content=items.get_encoded(item_id),
+        media_type="application/json",
+        headers={"etag": items.etag(item_id)},
+    )
 
 
+# curl -H 'If-None-Match: "<etag>"' http://127.0.0.1:8000/items/foo  -> 304
 @app.get("/items/{item_id}", response_model=Item)
-async def read_item(item_id: str):
-    return items[item_id]
+async def read_item(item_id: str, if_none_match: str | None = Header(default=None)):
+    if cached := not_modified(if_none_match, items.etag(item_id)):
+        return cached
+    return item_response(item_id)
 
 
 # replace all data
 @app.put("/items/{item_id}", response_model=Item)
-async def replace_item(item_id: str, item: Item):
-    update_item_encoded = jsonable_encoder(item)
-    items[item_id] = update_item_encoded
-    return update_item_encoded
+async def replace_item(
+    item_id: str, item: Item, if_match: str | None = Header(default=None)
+):
+    items.replace(item_id, item, expected_version=matched_version(item_id, if_match))
+    return item_response(item_id)
 
 
 ## Update partial data
 @app.patch("/items/{item_id}", response_model=Item)
-async def update_item(item_id: str, item: Item):
-    stored_item_data = items[item_id]
-    stored_item_model = Item(**stored_item_data)
+async def update_item(
+    item_id: str, item: Item, if_match: str | None = Header(default=None)
+):
+    version = matched_version(item_id, if_match)
     update_data = item.dict(exclude_unset=True)
-    updated_item = stored_item_model.copy(update=update_data)
-    items[item_id] = jsonable_encoder(updated_item)
-    return updated_item
+    items.patch(item_id, update_data, validated=True, expected_version=version)
+    return item_response(item_id)
@@ -0,0 +1,154 @@
+# Dependencies cached across requests
+# https://fastapi.tiangolo.com/tutorial/dependencies/sub-dependencies/#using-the-same-dependency-multiple-times
+#
+# FastAPI caches a dependency's result for one request only. @cached_dependency
+# adds two wider scopes:
+#   "app"      computed once (on startup with warm_up()), shared by every request
+#   "ttl"      cached for `ttl` seconds, keyed on the dependency's arguments
+#              (or only the ones named in `key`), e.g. a header value
+#   "request"  FastAPI's own behaviour, the function is returned untouched
+#
+#     @cached_dependency("ttl", ttl=300, key=("x_token",))
+#     async def verify_token(x_token: str = Header()): ...
+#
+# The function keeps its signature, so its parameters and sub-dependencies are
+# still resolved by FastAPI on every request, only its body is skipped on a hit.
+# Exceptions (e.g. HTTPException for a bad token) are not cached. Cached results
+# are shared between requests and must not be mutated.
+import functools
+import inspect
+from typing import Any, Callable, Hashable, Iterable
+
+from fastapi import FastAPI
+
+from single_flight import SingleFlight, SyncSingleFlight
+from ttl_cache import TTLCache
+
+# bounded, shared by the "ttl" dependencies
+dependency_cache = TTLCache(max_entries=10_000)
+
+MISSING = object()
+
+
+class ScopedDependency:
+    def __init__(
+        self,
+        dependency: Callable,
+        scope: str,
+        ttl: float,
+        key: tuple[str, ...] | None,
+        cache: TTLCache,
+    ):
+        self.name = f"{dependency.__module__}.{dependency.__qualname__}"
+        self.scope = scope
+        self.ttl = ttl
+        self.key_names = key
+        self.cache = cache
+        self.app_values: dict[Hashable, Any] = {}
+
+    def key(self, kwargs: dict[str, Any]) -> tuple | None:
+        """The cache key for these arguments, None when they aren't hashable."""
+        if self.scope == "app":
+            return (self.name,)
+        names = sorted(kwargs) if self.key_names is None else self.key_names
+        key = (self.name, *(kwargs.get(name) for name in names))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key: tuple) -> Any:
+        if self.scope == "app":
+            return self.app_values.get(key, MISSING)
+        entry = self.cache.get(key)
+        return MISSING if entry is None else entry.value
+
+    def store(self, key: tuple, value: Any) -> None:
+        if self.scope == "app":
+            self.app_values[key] = value
+        else:
+            self.cache.set(key, value, ttl=self.ttl)
+
+    def invalidate(self, **kwargs) -> None:
+        key = self.key(kwargs)
+        if key is not None:
+            self.app_values.pop(key, None)
+            self.cache.invalidate(key)
+
+
+def cached_dependency(
+    scope: str = "ttl",
+    ttl: float = 60,
+    key: Iterable[str] | None = None,
+    cache: TTLCache | None = None,
+):
+    if scope not in ("app", "ttl", "request"):
+        raise ValueError(f"Unknown dependency scope {scope!r}")
+
+    def decorator(dependency: Callable) -> Callable:
+        if scope == "request":
+            return dependency
+        scoped = ScopedDependency(
+            dependency,
+            scope,
+            ttl,
+            None if key is None else tuple(key),
+            dependency_cache if cache is None else cache,
+        )
+
+        # functools.wraps keeps the signature FastAPI reads the parameters from
+        if inspect.iscoroutinefunction(dependency):
+            flight = SingleFlight()
+
+            @functools.wraps(dependency)
+            async def wrapper(**kwargs):
+                key = scoped.key(kwargs)
+                if key is None:
+                    return await dependency(**kwargs)
+                value = scoped.get(key)
+                if value is MISSING:
+
+                    async def compute():
+                        value = await dependency(**kwargs)
+                        scoped.store(key, value)
+                        return value
+
+                    value = await flight.do(key, compute)
+                return value
+
+        else:
+            sync_flight = SyncSingleFlight()
+
+            @functools.wraps(dependency)
+            def wrapper(**kwargs):
+                key = scoped.key(kwargs)
+                if key is None:
+                    return dependency(**kwargs)
+                value = scoped.get(key)
+                if value is MISSING:
+
+                    def compute():
+                        value = dependency(**kwargs)
+                        scoped.store(key, value)
+                        return value
+
+                    value = sync_flight.do(key, compute)
+                return value
+
+        wrapper.scoped = scoped
+        return wrapper
+
+    return decorator
+
+
+def warm_up(app: FastAPI, *dependencies: Callable) -> None:
+    """Compute "app" scoped dependencies on startup rather than on first use."""
+
+    async def compute_app_dependencies():
+        for dependency in dependencies:
+            value = dependency()
+            if inspect.isawaitable(value):
+                await value
+
+    app.router.on_startup.append(compute_app_dependencies)
@@ -0,0 +1,209 @@
+# A change feed: events published by the app, pushed to subscribers over
+# Server-Sent Events or WebSockets instead of having them poll
+# https://fastapi.tiangolo.com/advanced/websockets/
+# https://html.spec.whatwg.org/multipage/server-sent-events.html
+#
+#     feed = Broadcaster()
+#     feed.publish("item_created", {"id": 1, ...})  # from any thread
+#     app.include_router(feed_router(feed))          # GET /events, WS /events/ws
+#
+# Each event is serialized once, as an SSE frame and as WebSocket text, into a
+# ring of the last `history` events. Subscribers don't get a queue each, they
+# keep a position in the ring and read whatever was published since, in one
+# batch, at the pace their connection takes it. A subscriber that falls more
+# than `history` events behind (or resumes from an id the ring no longer has)
+# gets a "reset" event, meaning "reload the list and continue from here".
+#
+# Clients resume with the id of the last event they got: EventSource sends it
+# as the Last-Event-ID header when it reconnects, or ?last_event_id=. Ids are
+# "<epoch>-<sequence>", the epoch changes when the process restarts. The feed
+# is per process: behind several workers a subscriber only sees the events of
+# the process it is connected to.
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, NamedTuple
+
+import orjson
+from fastapi import APIRouter, Header, WebSocket
+from fastapi.responses import StreamingResponse
+
+
+class Event(NamedTuple):
+    seq: int
+    id: str
+    sse: bytes
+    text: str
+
+
+def encode_event(seq: int, event_id: str, event_type: str, data: bytes) -> Event:
+    sse = b"id: %s\nevent: %s\ndata: %s\n\n" % (
+        event_id.encode(),
+        event_type.encode(),
+        data,
+    )
+    text = b'{"id":%s,"type":%s,"data":%s}' % (
+        orjson.dumps(event_id),
+        orjson.dumps(event_type),
+        data,
+    )
+    return Event(seq, event_id, sse, text.decode())
+
+
+class Broadcaster:
+    def __init__(self, history: int = 4096, max_batch: int = 256):
+        self.epoch = str(time.time_ns() // 1_000_000)
+        self.history = history
+        self.max_batch = max_batch
+        self.ring: list[Event | None] = [None] * history
+        self.seq = 0
+        self.lock = threading.Lock()
+        # event loop -> [asyncio.Event set on the next publish, subscribers]
+        self.waiters: dict[asyncio.AbstractEventLoop, list] = {}
+
+    @property
+    def subscribers(self) -> int:
+        return sum(count for _, count in self.waiters.values())
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def publish(self, event_type: str, data: Any) -> str:
+        """Publish an event, thread-safe. Returns its id."""
+        body = orjson.dumps(data, default=str)
+        with self.lock:
+            seq = self.seq + 1
+            event = encode_event(seq, self.event_id(seq), event_type, body)
+            self.ring[seq % self.history] = event
+            self.seq = seq
+            loops = list(self.waiters)
+        # one wake up per event loop, however many subscribers it runs
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self.wake, loop)
+            except RuntimeError:
+                pass  # closed loop
+        return event.id
+
+    def wake(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self.lock:
+            waiter = self.waiters.get(loop)
+            if waiter is not None:
+                waiter[0].set()
+                waiter[0] = asyncio.Event()
+
+    def reset(self, reason: str) -> tuple[int, Event]:
+        seq = self.seq
+        data = orjson.dumps({"reason": reason})
+        return seq, encode_event(seq, self.event_id(seq), "reset", data)
+
+    def start(self, last_event_id: str | None) -> tuple[int, Event | None]:
+        """Sequence to read after, and a reset event if `last_event_id` is lost."""
+        if last_event_id is None:
+            return self.seq, None
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return self.reset("unknown last_event_id")
+        if self.seq - int(seq) > self.history:
+            return self.reset("last_event_id is too old")
+        return int(seq), None
+
+    def events_after(self, seq: int) -> list[Event] | None:
+        """The events published after `seq`, None if some were overwritten."""
+        last = min(self.seq, seq + self.max_batch)
+        events = []
+        for next_seq in range(seq + 1, last + 1):
+            event = self.ring[next_seq % self.history]
+            if event is None or event.seq != next_seq:
+                return None
+            events.append(event)
+        return events
+
+    async def subscribe(
+        self, last_event_id: str | None = None, keepalive: float = 15
+    ) -> AsyncIterator[list[Event]]:
+        """
+        Batches of events, starting after `last_event_id` (or with the next
+        event). An empty batch every `keepalive` seconds without events.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            waiter = self.waiters.setdefault(loop, [asyncio.Event(), 0])
+            waiter[1] += 1
+        try:
+            seq, reset = self.start(last_event_id)
+            if reset is not None:
+                yield [reset]
+            while True:
+                # taken before reading, a publish in between sets it
+                published = waiter[0]
+                events = self.events_after(seq)
+                if events is None:
+                    seq, reset = self.reset("lagged")
+                    yield [reset]
+                elif events:
+                    seq = events[-1].seq
+                    yield events
+                else:
+                    try:
+                        await asyncio.wait_for(published.wait(), keepalive)
+                    except asyncio.TimeoutError:
+                        yield []
+        finally:
+            with self.lock:
+                waiter[1] -= 1
+                if not waiter[1]:
+                    del self.waiters[loop]
+
+
+def feed_router(feed: Broadcaster, prefix: str = "/events") -> APIRouter:
+    router = APIRouter(prefix=prefix, tags=["events"])
+
+    # curl -N http://127.0.0.1:8000/events
+    @router.get("")
+    async def event_stream(
+        last_event_id: str | None = None,
+        last_event_id_header: str | None = Header(default=None, alias="last-event-id"),
+    ):
+        async def frames():
+            # EventSource reconnects after 1s
+            yield b"retry: 1000\n\n"
+            async for events in feed.subscribe(last_event_id or last_event_id_header):
+                if events:
+                    yield b"".join(event.sse for event in events)
+                else:
+                    yield b": keepalive\n\n"
+
+        return StreamingResponse(
+            frames(),
+            media_type="text/event-stream",
+            headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+        )
+
+    @router.websocket("/ws")
+    async def event_socket(websocket: WebSocket, last_event_id: str | None = None):
+        await websocket.accept()
+
+        async def send_events():
+            async for events in feed.subscribe(last_event_id):
+                for event in events:
+                    await websocket.send_text(event.text)
+
+        async def wait_disconnect():
+            # clients don't send anything, this returns when they leave
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+
+        tasks = [
+            asyncio.create_task(send_events()),
+            asyncio.create_task(wait_disconnect()),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+        for task in done:
+            task.result()
+
+    return router
@@ -0,0 +1,22 @@
+import pytest
+
+
+def reset_sql_app():
+    from sql_app import database, sharding
+    from sql_app.jobs import jobs
+
+    for engine in database.engines.values():
+        engine.dispose()
+    database.engines.clear()
+    sharding.new_user_id.reset()
+    sharding.new_item_id.reset()
+    jobs.created = False
+
+
+@pytest.fixture
+def sql_app_dir(tmp_path, monkeypatch):
+    """sql_app with its databases in an empty directory."""
+    monkeypatch.chdir(tmp_path)
+    reset_sql_app()
+    yield tmp_path
+    reset_sql_app()
@@ -0,0 +1,119 @@
+# Request deadlines: a request that runs past its deadline gets a 504, and the
+# work it started stops instead of holding a thread and a database connection
+# for a client that has given up.
+#
+# The deadline of an endpoint is the smallest of
+# - @deadline(seconds) on the endpoint, or REQUEST_TIMEOUT (env, seconds)
+# - the X-Request-Timeout header of the request (seconds), a client can only
+#   shorten it
+#
+#     router = APIRouter(route_class=DeadlineRoute)
+#
+#     @router.get("/items/")
+#     @deadline(2)
+#     def read_items(db: Session = Depends(get_db)): ...
+#
+# Async endpoints are cancelled at the deadline. Sync endpoints run in a
+# threadpool thread that can't be cancelled, the response waits for them, so
+# what they run has to stop by itself: sqlite connections with
+# `interrupt_sqlite(connection)` abort their query (sqlite3.OperationalError
+# "interrupted"), and long Python loops can call `check_deadline()`. Both read
+# the deadline from a context variable, which follows the request into the
+# threadpool (https://docs.python.org/3/library/contextvars.html).
+import asyncio
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Coroutine
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "0")) or None
+
+# time.monotonic() by which the current request must be done
+current_deadline: ContextVar[float | None] = ContextVar(
+    "current_deadline", default=None
+)
+
+
+class DeadlineExceeded(Exception):
+    """Raised by work that stopped because its request's deadline passed."""
+
+
+def remaining() -> float | None:
+    """Seconds left to the current request, None without a deadline."""
+    at = current_deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def expired() -> bool:
+    at = current_deadline.get()
+    return at is not None and time.monotonic() >= at
+
+
+def check_deadline() -> None:
+    if expired():
+        raise DeadlineExceeded()
+
+
+def interrupt_sqlite(
+    connection: sqlite3.Connection, instructions: int = 10_000
+) -> None:
+    """Abort the statements of `connection` running past the current deadline."""
+    # called every `instructions` virtual machine instructions (10_000 is well
+    # under a millisecond), a true result interrupts the statement
+    # https://www.sqlite.org/c3ref/progress_handler.html
+    connection.set_progress_handler(expired, instructions)
+
+
+def deadline(seconds: float):
+    """Set the deadline of an endpoint, DeadlineRoute enforces it."""
+
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.__deadline__ = seconds
+        return endpoint
+
+    return decorator
+
+
+def request_timeout(request: Request) -> float | None:
+    value = request.headers.get("x-request-timeout")
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = -1
+    if not seconds > 0:
+        raise HTTPException(status_code=400, detail="Invalid X-Request-Timeout")
+    return seconds
+
+
+class DeadlineRoute(APIRoute):
+    """Answer 504 when a request runs past its deadline, and cancel its work."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        route_timeout = getattr(self.endpoint, "__deadline__", REQUEST_TIMEOUT)
+
+        async def deadline_handler(request: Request) -> Response:
+            timeouts = [t for t in (route_timeout, request_timeout(request)) if t]
+            if not timeouts:
+                return await handler(request)
+            at = time.monotonic() + min(timeouts)
+            outer = current_deadline.get()
+            if outer is not None:
+                at = min(at, outer)
+            token = current_deadline.set(at)
+            try:
+                # the handler's task copies the context, dependencies and the
+                # threadpool see the deadline
+                return await asyncio.wait_for(handler(request), at - time.monotonic())
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                raise HTTPException(status_code=504, detail="Request deadline exceeded")
+            finally:
+                current_deadline.reset(token)
+
+        return deadline_handler
@@ -1,4 +1,7 @@
 from fastapi import Depends, FastAPI, Cookie, Header, HTTPException
+from pydantic import BaseSettings
+
+from cached_dependencies import cached_dependency, warm_up
 
 app = FastAPI()
 
@@ -43,6 +46,8 @@ def query_extractor(q: str | None = None):
     return q
 
 
+# same query and cookie, same answer: cached for a minute across requests
+@cached_dependency("ttl", ttl=60)
 def query_or_cookie_extractor(
     q: str = Depends(query_extractor), last_query: str | None = Cookie(default=None)
 ):
@@ -59,13 +64,32 @@ async def read_query(query_or_default: str = Depends(query_or_cookie_extractor))
 ############ Add dependencies to the path operation decorator
 
 
-async def verify_token(x_token: str = Header()):
-    if x_token != "fake-super-secret-token":
+# read from the environment (X_TOKEN, X_KEY) once, when the app starts
+class Settings(BaseSettings):
+    x_token: str = "fake-super-secret-token"
+    x_key: str = "fake-super-secret-key"
+
+
+@cached_dependency("app")
+def get_settings():
+    return Settings()
+
+
+warm_up(app, get_settings)
+
+
+# valid headers are remembered for 5 minutes, invalid ones are checked every time
+@cached_dependency("ttl", ttl=300, key=("x_token",))
+async def verify_token(
+    x_token: str = Header(), settings: Settings = Depends(get_settings)
+):
+    if x_token != settings.x_token:
         raise HTTPException(status_code=400, detail="X-Token header invalid")
 
 
-async def verify_key(x_key: str = Header()):
-    if x_key != "fake-super-secret-key":
+@cached_dependency("ttl", ttl=300, key=("x_key",))
+async def verify_key(x_key: str = Header(), settings: Settings = Depends(get_settings)):
+    if x_key != settings.x_key:
         raise HTTPException(status_code=400, detail="X-Key header invalid")
     return x_key
 
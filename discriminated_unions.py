@@ -0,0 +1,56 @@
+# Tagged unions for response models, dispatched on a discriminator field
+# https://pydantic-docs.helpmanual.io/usage/types/#discriminated-unions-aka-tagged-unions
+#
+# Union[PlaneItem, CarItem] validates a CarItem by first failing PlaneItem.
+# With a discriminator pydantic looks the model up by the `type` value instead,
+# but FastAPI (0.79) drops the discriminator when it builds the response field,
+# DiscriminatedUnionRoute puts it back.
+from typing import Annotated, Any, Callable, Union, get_args, get_origin
+
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, Field
+from pydantic.fields import FieldInfo, ModelField
+from starlette.routing import request_response
+
+
+def discriminated_union(*models: type[BaseModel], discriminator: str = "type") -> Any:
+    """
+    `Union[*models]` tagged by `discriminator`, each model must declare it as a
+    `Literal` field, e.g. `type: Literal["car"] = "car"`.
+    """
+    return Annotated[Union[models], Field(discriminator=discriminator)]
+
+
+def get_discriminator(type_: Any) -> str | None:
+    if get_origin(type_) is not Annotated:
+        return None
+    for metadata in get_args(type_)[1:]:
+        if isinstance(metadata, FieldInfo) and metadata.discriminator:
+            return metadata.discriminator
+    return None
+
+
+def apply_discriminator(field: ModelField | None, discriminator: str) -> None:
+    """Turn a Union field into a discriminated one (schema and validation)."""
+    if field is None or not field.sub_fields:
+        return
+    field.discriminator_key = discriminator
+    field.prepare_discriminated_union_sub_fields()
+
+
+class DiscriminatedUnionRoute(APIRoute):
+    """
+    An APIRoute that keeps the discriminator of a `discriminated_union` response
+    model, for validation and for the OpenAPI schema.
+
+    Use it with `app.router.route_class = DiscriminatedUnionRoute`.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs) -> None:
+        super().__init__(path, endpoint, **kwargs)
+        discriminator = get_discriminator(self.response_model)
+        if discriminator is None:
+            return
+        apply_discriminator(self.response_field, discriminator)
+        apply_discriminator(self.secure_cloned_response_field, discriminator)
+        self.app = request_response(self.get_route_handler())
@@ -1,4 +1,5 @@
 # https://fastapi.tiangolo.com/tutorial/handling-errors/
+import logging
 
 from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.encoders import jsonable_encoder
@@ -7,8 +8,21 @@ from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from pydantic import BaseModel
 
+import json_logging
+from validation_errors import bounded_validation_handler, errors
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
+
+# JSON logs written by a background thread, handlers never block on stdout.
+# Started with the app, importing this module doesn't reconfigure logging
+@app.on_event("startup")
+def start_logging():
+    json_logging.start()
+
+
 items = {"foo": "The Foo Wrestlers"}
 
 ####### Raise an HTTPException in your code
@@ -94,22 +108,32 @@ async def create_item(item: Item):
 
 
 ################# Re-use FastAPI's exception handlers
-from fastapi.exception_handlers import (
-    http_exception_handler,
-    request_validation_exception_handler,
-)
+from fastapi.exception_handlers import http_exception_handler
 
 
 @app.exception_handler(StarletteHTTPException)
 async def custom_http_exception_handler(request, exc):
-    print(f"OMG! An HTTP error!: {repr(exc)}")
+    logger.warning(
+        "OMG! An HTTP error!: %r",
+        exc,
+        extra={"status_code": exc.status_code, "path": request.url.path},
+    )
     return await http_exception_handler(request, exc)
 
 
+# at most 20 errors and no echoed body, cheap even for huge invalid bodies
+bounded_validation_exception_handler = bounded_validation_handler(max_errors=20)
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
-    print(f"OMG! The client sent invalid data!: {exc}")
-    return await request_validation_exception_handler(request, exc)
+    # only the first error, str(exc) would format all of them
+    logger.warning(
+        "OMG! The client sent invalid data!: %s",
+        next(errors(exc), None),
+        extra={"path": request.url.path},
+    )
+    return await bounded_validation_exception_handler(request, exc)
 
 
 @app.get("/itemsB/{item_id}")
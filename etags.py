@@ -0,0 +1,53 @@
+# ETag helpers for conditional requests on JSON resources
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
+from hashlib import sha1
+from typing import Any
+
+import orjson
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+
+
+def content_etag(data: Any) -> str:
+    """A strong ETag from the content, key order doesn't matter."""
+    encoded = orjson.dumps(jsonable_encoder(data), option=orjson.OPT_SORT_KEYS)
+    return '"' + sha1(encoded).hexdigest() + '"'
+
+
+def etag_matches(header_value: str, etag: str) -> bool:
+    # weak comparison, used for If-None-Match
+    if header_value.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header_value.split(",")]
+    return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in candidates]
+
+
+def not_modified(if_none_match: str | None, etag: str) -> Response | None:
+    """The 304 response to send back when the client's copy is current."""
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"etag": etag}
+        )
+    return None
+
+
+def check_if_match(if_match: str | None, etag: str | None):
+    """
+    Raise 412 when an `If-Match` precondition fails.
+
+    `etag` is None when the resource doesn't exist yet, which only fails
+    requests that sent an If-Match header.
+    """
+    if if_match is None:
+        return
+    if etag is not None:
+        if if_match.strip() == "*":
+            return
+        # strong comparison, weak tags never match
+        if etag in [tag.strip() for tag in if_match.split(",")]:
+            return
+    raise HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Item was modified, fetch it again before updating",
+        headers={"etag": etag} if etag else None,
+    )
@@ -1,9 +1,13 @@
-from typing import Union
+from typing import Literal
 
 from fastapi import FastAPI
 from pydantic import BaseModel
 
+from discriminated_unions import DiscriminatedUnionRoute, discriminated_union
+
 app = FastAPI()
+# keep the `type` discriminator on response models, for validation and OpenAPI
+app.router.route_class = DiscriminatedUnionRoute
 
 
 class BaseItem(BaseModel):
@@ -12,14 +16,17 @@ class BaseItem(BaseModel):
 
 
 class CarItem(BaseItem):
-    type = "car"
+    type: Literal["car"] = "car"
 
 
 class PlaneItem(BaseItem):
-    type = "plane"
+    type: Literal["plane"] = "plane"
     size: int
 
 
+# picks the model from "type" instead of trying PlaneItem then CarItem
+Item = discriminated_union(PlaneItem, CarItem, discriminator="type")
+
 items = {
     "item1": {"description": "All my friends drive a low rider", "type": "car"},
     "item2": {
@@ -30,6 +37,6 @@ items = {
 }
 
 
-@app.get("/items/{item_id}", response_model=Union[PlaneItem, CarItem])
+@app.get("/items/{item_id}", response_model=Item)
 async def read_item(item_id: str):
     return items[item_id]
@@ -1,6 +1,11 @@
 from fastapi import FastAPI
+from pydantic import BaseModel
+
+from negotiation import NegotiatedRoute
 
 app = FastAPI()
+# JSON, MessagePack or CBOR depending on Content-Type / Accept
+app.router.route_class = NegotiatedRoute
 
 
 # Return the list of a model
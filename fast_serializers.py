@@ -0,0 +1,312 @@
+# Response serializers compiled once per route instead of per response
+# https://fastapi.tiangolo.com/advanced/path-operation-advanced-configuration/
+#
+# FastAPI validates the returned value into the response model, dumps it, filters
+# include/exclude and runs jsonable_encoder on every response. CompiledResponseRoute
+# works out the fields to emit and how to check each value when the route is
+# created, then writes JSON bytes with orjson.
+import inspect
+from functools import wraps
+from typing import Any, Callable, get_args, get_origin
+
+import orjson
+from fastapi import Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.dependencies.utils import get_dependant, get_parameterless_sub_dependant
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, ValidationError
+from pydantic.fields import ModelField
+from pydantic.json import pydantic_encoder
+from pydantic.utils import lenient_issubclass
+from starlette.routing import request_response
+
+from trusted_models import Trusted
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# values of exactly these types are passed through as they are
+FAST_TYPES = {str, int, float, bool}
+
+
+class Unsupported(Exception):
+    pass
+
+
+def field_converter(
+    model: type[BaseModel], field: ModelField, nested_options: dict
+) -> Callable[[Any], Any]:
+    """
+    How to check one value: a type check for simple fields, the compiled
+    serializer of nested models, pydantic otherwise.
+    """
+
+    def validate(value):
+        value, errors = field.validate(value, {}, loc=field.name, cls=model)
+        if errors:
+            raise ValidationError([errors], model)
+        return value
+
+    if field.class_validators or field.sub_fields and field.shape == 1:
+        # custom validators and Unions need pydantic
+        return validate
+    accepted = field.type_
+    if lenient_issubclass(accepted, BaseModel) and field.shape in (1, 2):
+        # only the declared fields, as FastAPI does: a subclass such as
+        # UserInDB must not leak hashed_password through a User field
+        to_dict = compile_model_serializer(accepted, **nested_options)
+        allow_none = field.allow_none
+        if field.shape == 1:
+
+            def convert(value):
+                if value is None and allow_none:
+                    return value
+                return to_dict(value)
+
+        else:
+
+            def convert(value):
+                if value is None and allow_none:
+                    return value
+                if not isinstance(value, (list, tuple)):
+                    return validate(value)
+                return [to_dict(item) for item in value]
+
+        return convert
+    if accepted not in FAST_TYPES:
+        return validate
+    allow_none = field.allow_none
+    if field.shape == 1:  # a single value
+
+        def convert(value):
+            if type(value) is accepted or (value is None and allow_none):
+                return value
+            return validate(value)
+
+    elif field.shape == 2:  # list[...]
+
+        def convert(value):
+            if type(value) is list and all(type(v) is accepted for v in value):
+                return value
+            if value is None and allow_none:
+                return value
+            return validate(value)
+
+    else:
+        return validate
+    return convert
+
+
+def compile_model_serializer(
+    model: type[BaseModel],
+    include: set[str] | None = None,
+    exclude: set[str] | None = None,
+    by_alias: bool = True,
+    exclude_unset: bool = False,
+    exclude_defaults: bool = False,
+    exclude_none: bool = False,
+    compiling: frozenset[type[BaseModel]] = frozenset(),
+) -> Callable[[Any], dict]:
+    """Build a function turning a model instance or a dict into the response dict."""
+    if not isinstance(include or set(), set) or not isinstance(exclude or set(), set):
+        raise Unsupported("nested include/exclude")
+    if model.__pre_root_validators__ or model.__post_root_validators__:
+        raise Unsupported("root validators")
+    if model in compiling:
+        raise Unsupported("recursive models")
+    # include/exclude only apply to the response model itself
+    nested_options = dict(
+        by_alias=by_alias,
+        exclude_unset=exclude_unset,
+        exclude_defaults=exclude_defaults,
+        exclude_none=exclude_none,
+        compiling=compiling | {model},
+    )
+
+    fields = []
+    for name, field in model.__fields__.items():
+        if include is not None and name not in include:
+            continue
+        if exclude is not None and name in exclude:
+            continue
+        fields.append(
+            (
+                name,
+                field.alias if by_alias else name,
+                field_converter(model, field, nested_options),
+                field.required,
+                field.default,
+            )
+        )
+    # names the client may use in the data besides the field name
+    aliases = {name: field.alias for name, field in model.__fields__.items()}
+
+    def full_validation(data: Any) -> BaseModel:
+        return model.validate(data)
+
+    def serialize(data: Any) -> dict:
+        # trusted values only have their fields picked, any model or dict will
+        # do. Only scalars are passed as they are, nested models still go
+        # through their own serializer
+        trust = isinstance(data, Trusted)
+        if trust:
+            data = data.value
+        if isinstance(data, model) or (trust and isinstance(data, BaseModel)):
+            values = data.__dict__
+            present = data.__fields_set__
+        elif isinstance(data, dict):
+            values = data
+            present = data
+        else:
+            instance = full_validation(data)
+            values, present = instance.__dict__, instance.__fields_set__
+        result = {}
+        for name, key, convert, required, default in fields:
+            if name in values:
+                raw = values[name]
+                is_set = name in present
+            elif aliases[name] in values:
+                raw = values[aliases[name]]
+                is_set = True
+            elif required:
+                # let pydantic produce the error
+                full_validation(data)
+                raise AssertionError("unreachable")
+            else:
+                # not set and equal to the default, whichever is excluded
+                if not (exclude_unset or exclude_defaults):
+                    if not (exclude_none and default is None):
+                        result[key] = default
+                continue
+            if exclude_unset and not is_set:
+                continue
+            if trust and (type(raw) in FAST_TYPES or raw is None):
+                value = raw
+            else:
+                value = convert(raw)
+            # nested models are dicts once converted
+            if exclude_defaults and (value == default or raw == default):
+                continue
+            if exclude_none and value is None:
+                continue
+            result[key] = value
+        return result
+
+    return serialize
+
+
+def compile_serializer(response_model: Any, **options) -> Callable[[Any], bytes]:
+    """Compile a `response_model` (a model or a list of models) to a bytes serializer."""
+    if inspect.isclass(response_model) and issubclass(response_model, BaseModel):
+        to_dict = compile_model_serializer(response_model, **options)
+    elif get_origin(response_model) is list and len(get_args(response_model)) == 1:
+        item_to_dict = compile_model_serializer(get_args(response_model)[0], **options)
+
+        def to_dict(data):
+            if isinstance(data, Trusted):
+                return [item_to_dict(Trusted(item)) for item in data.value]
+            return [item_to_dict(item) for item in data]
+
+    else:
+        raise Unsupported(f"response model {response_model!r}")
+
+    def serialize(data: Any) -> bytes:
+        return orjson.dumps(
+            to_dict(data), default=pydantic_encoder, option=ORJSON_OPTIONS
+        )
+
+    return serialize
+
+
+class CompiledResponseRoute(APIRoute):
+    """
+    An APIRoute that serializes with a compiled serializer.
+
+    Routes it can't handle (nested include/exclude, root validators,
+    arbitrary response models) keep FastAPI's own serialization.
+
+    Use it with `app.router.route_class = CompiledResponseRoute`.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs) -> None:
+        super().__init__(path, endpoint, **kwargs)
+        try:
+            self.serializer = compile_serializer(
+                self.response_model,
+                include=self.response_model_include,
+                exclude=self.response_model_exclude,
+                by_alias=self.response_model_by_alias,
+                exclude_unset=self.response_model_exclude_unset,
+                exclude_defaults=self.response_model_exclude_defaults,
+                exclude_none=self.response_model_exclude_none,
+            )
+        except Unsupported:
+            return
+        # rebuild the dependant so the wrapper's Response parameter is injected
+        call = self.compiled_endpoint(self.dependant.call)
+        self.dependant = get_dependant(path=self.path_format, call=call)
+        # the route's and router's dependencies=[...], as APIRoute.__init__ adds them
+        for depends in self.dependencies[::-1]:
+            self.dependant.dependencies.insert(
+                0,
+                get_parameterless_sub_dependant(depends=depends, path=self.path_format),
+            )
+        self.app = request_response(self.get_route_handler())
+
+    def compiled_endpoint(self, endpoint: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(endpoint)
+        parameters = list(signature.parameters.values())
+        # FastAPI injects a single Response parameter, share it with the endpoint
+        response_param = next(
+            (p.name for p in parameters if lenient_issubclass(p.annotation, Response)),
+            None,
+        )
+        keep_response_param = response_param is not None
+        if not keep_response_param:
+            response_param = "compiled_sub_response"
+            parameters.append(
+                inspect.Parameter(
+                    response_param, inspect.Parameter.KEYWORD_ONLY, annotation=Response
+                )
+            )
+        status_code = self.status_code or 200
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        media_type = response_class.media_type or "application/json"
+        serializer = self.serializer
+
+        def make_response(content: Any, sub_response: Response) -> Any:
+            if isinstance(content, Response):
+                return content
+            response = Response(
+                content=serializer(content),
+                status_code=sub_response.status_code or status_code,
+                media_type=media_type,
+            )
+            response.raw_headers.extend(
+                (key, value)
+                for key, value in sub_response.raw_headers
+                if key != b"content-length"
+            )
+            return response
+
+        if inspect.iscoroutinefunction(endpoint):
+
+            @wraps(endpoint)
+            async def compiled(**values):
+                sub_response = values[response_param]
+                if not keep_response_param:
+                    del values[response_param]
+                return make_response(await endpoint(**values), sub_response)
+
+        else:
+
+            @wraps(endpoint)
+            def compiled(**values):
+                sub_response = values[response_param]
+                if not keep_response_param:
+                    del values[response_param]
+                return make_response(endpoint(**values), sub_response)
+
+        compiled.__signature__ = signature.replace(parameters=parameters)
+        return compiled
@@ -0,0 +1,198 @@
+# FileResponse with HTTP Range and conditional request support
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Range_requests
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+# https://asgi.readthedocs.io/en/latest/extensions.html#zero-copy-send
+import os
+import stat
+from email.utils import parsedate_to_datetime
+from hashlib import md5
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from etags import etag_matches
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    etag_base = f"{stat_result.st_mtime_ns}-{stat_result.st_size}"
+    return '"' + md5(etag_base.encode()).hexdigest() + '"'
+
+
+def parse_range(header_value: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a `Range: bytes=...` header into an inclusive (start, end) pair.
+
+    Returns None when the header should be ignored (other units, several
+    ranges) and raises RangeNotSatisfiable when it can't be served.
+    """
+    unit, _, ranges = header_value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    start_text, sep, end_text = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not start_text:
+            # suffix range: the last N bytes
+            suffix = int(end_text)
+            # an empty file has no last byte to send
+            if suffix <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(FileResponse):
+    """
+    A FileResponse that answers `Range`, `If-Range`, `If-None-Match` and
+    `If-Modified-Since` itself.
+
+    When the server offers the ASGI zero-copy send extension the file
+    descriptor is handed to the server (sendfile) instead of being read
+    into Python memory in chunks.
+    """
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        self.headers.setdefault("etag", make_etag(stat_result))
+        self.headers.setdefault("accept-ranges", "bytes")
+        super().set_stat_headers(stat_result)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.stat_result is None:
+            try:
+                self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.")
+            if not stat.S_ISREG(self.stat_result.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            self.set_stat_headers(self.stat_result)
+
+        request_headers = Headers(scope=scope)
+        size = self.stat_result.st_size
+        start, end = 0, size - 1
+
+        if self.is_not_modified(request_headers):
+            await self.send_not_modified(send)
+            return
+
+        range_header = request_headers.get("range")
+        if (
+            range_header
+            and self.status_code == 200
+            and self.if_range_ok(request_headers)
+        ):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                await self.send_range_not_satisfiable(send, size)
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+                self.headers["content-length"] = str(end - start + 1)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if self.send_header_only or size == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            await self.send_zero_copy(send, start, end - start + 1)
+        else:
+            await self.send_chunks(send, start, end - start + 1)
+        if self.background is not None:
+            await self.background()
+
+    def is_not_modified(self, request_headers: Headers) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, self.headers["etag"])
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.stat_result.st_mtime) <= since
+        return False
+
+    def if_range_ok(self, request_headers: Headers) -> bool:
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            # If-Range needs a strong comparison
+            return if_range == self.headers["etag"]
+        return if_range == self.headers["last-modified"]
+
+    async def send_not_modified(self, send: Send) -> None:
+        headers = [
+            (key, value)
+            for key, value in self.raw_headers
+            if key in (b"etag", b"last-modified", b"cache-control", b"accept-ranges")
+        ]
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send_range_not_satisfiable(self, send: Send, size: int) -> None:
+        headers = [
+            (b"content-range", f"bytes */{size}".encode("latin-1")),
+            (b"content-length", b"0"),
+            (b"accept-ranges", b"bytes"),
+        ]
+        await send({"type": "http.response.start", "status": 416, "headers": headers})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send_zero_copy(self, send: Send, offset: int, count: int) -> None:
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            await send(
+                {
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": offset,
+                    "count": count,
+                    "more_body": False,
+                }
+            )
+        finally:
+            await anyio.to_thread.run_sync(file.close)
+
+    async def send_chunks(self, send: Send, offset: int, count: int) -> None:
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(offset)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    }
+                )
+            if remaining > 0:
+                # the file shrank under us, close the response anyway
+                await send(
+                    {"type": "http.response.body", "body": b"", "more_body": False}
+                )
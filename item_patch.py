@@ -0,0 +1,112 @@
+# Partial updates without re-validating or re-encoding the whole stored item
+# https://fastapi.tiangolo.com/tutorial/body-updates/
+import os
+from typing import Any, Generic, TypeVar
+
+import orjson
+from pydantic import BaseModel, ValidationError
+from pydantic.json import pydantic_encoder
+
+from item_store import ItemStore, Record
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def validate_fields(model: type[BaseModel], data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Validate only the fields present in `data`.
+
+    Field validators run, root validators don't since they need the whole
+    model. Unknown fields are dropped like pydantic's default `Extra.ignore`.
+    """
+    validated = {}
+    errors = []
+    for name, value in data.items():
+        field = model.__fields__.get(name)
+        if field is None:
+            continue
+        value, error = field.validate(value, validated, loc=name, cls=model)
+        if error:
+            errors.append(error)
+        else:
+            validated[name] = value
+    if errors:
+        raise ValidationError(errors, model)
+    return validated
+
+
+def encode(model: BaseModel) -> bytes:
+    # dict(model) is shallow, orjson walks lists/dicts natively and only nested
+    # models and exotic types go through pydantic_encoder
+    return orjson.dumps(dict(model), default=pydantic_encoder)
+
+
+class PatchStore(Generic[ModelT]):
+    """
+    Items kept as validated models in an ItemStore, with their JSON encoded
+    once per change.
+
+    Updates are copy-on-write: `patch()` builds a new model with
+    `BaseModel.copy(update=...)`, which shares the unchanged field values
+    with the previous version instead of validating them again. With a
+    `path` the items survive restarts, the initial `items` are only stored
+    in a new store.
+    """
+
+    def __init__(
+        self,
+        model: type[ModelT],
+        items: dict[str, dict] | None = None,
+        path: str | os.PathLike | None = None,
+    ):
+        self.model = model
+        self.store = ItemStore(
+            path,
+            encode=encode,
+            decode=model.parse_obj,
+            initial={item_id: model(**data) for item_id, data in (items or {}).items()},
+        )
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.store
+
+    def get(self, item_id: str) -> ModelT:
+        return self.store[item_id].value
+
+    def record(self, item_id: str) -> Record | None:
+        return self.store.get(item_id)
+
+    def get_encoded(self, item_id: str) -> bytes:
+        return self.store[item_id].encoded
+
+    def etag(self, item_id: str) -> str:
+        return self.store[item_id].etag
+
+    def replace(
+        self, item_id: str, item: ModelT, expected_version: int | None = None
+    ) -> ModelT:
+        return self.store.put(item_id, item, expected_version).value
+
+    def patch(
+        self,
+        item_id: str,
+        changes: dict[str, Any],
+        validated: bool = False,
+        expected_version: int | None = None,
+    ) -> ModelT:
+        """
+        Apply `changes` to a stored item.
+
+        Pass `validated=True` when the values come from a model FastAPI already
+        validated, e.g. `item.dict(exclude_unset=True)`.
+        """
+        if not validated:
+            changes = validate_fields(self.model, changes)
+        if not changes:
+            return self.get(item_id)
+        return self.store.update(
+            item_id, lambda stored: stored.copy(update=changes), expected_version
+        ).value
+
+    def close(self) -> None:
+        self.store.close()
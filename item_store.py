@@ -0,0 +1,385 @@
+# Items shared by concurrent requests: lock-free reads, serialized writes, a
+# version per item, and a log plus snapshots on disk to restart from
+#
+#     store = ItemStore("item_store/items")         # or ItemStore() in memory
+#     record = store.put("foo", {"name": "Foo"})    # Record(value, version=1, ...)
+#     store.put("foo", {...}, expected_version=1)   # VersionConflict if it changed
+#     store["foo"].value
+#
+# The items are held in an immutable snapshot: BUCKETS dicts that are never
+# changed once published. A write copies the one bucket it touches and
+# publishes a new tuple of buckets, so readers don't lock, never see half a
+# write, and store.snapshot() stays consistent for as long as it is held.
+#
+# With a directory, every write is appended to log-<first seq>.jsonl, and every
+# `snapshot_every` writes a background thread saves the current snapshot (it
+# can't change under it) and removes the logs it covers. A restart loads the
+# newest snapshot and replays the logs written after it.
+#
+# The directory is loaded on first use, in the process using it: a store made
+# at import, before serve.py forks its workers, is loaded again by each worker.
+# The files belong to one process at a time, a second one gets StoreInUse
+# until the first exits, so behind serve.py run a single worker.
+import fcntl
+import logging
+import os
+import threading
+import weakref
+from collections.abc import Mapping
+from hashlib import sha1
+from pathlib import Path
+from typing import Any, Callable, Iterator, NamedTuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = 64
+
+
+class VersionConflict(Exception):
+    def __init__(self, item_id: str, expected: int, actual: int):
+        super().__init__(f"{item_id} is at version {actual}, not {expected}")
+        self.item_id = item_id
+        self.expected = expected
+        self.actual = actual
+
+
+class StoreInUse(RuntimeError):
+    def __init__(self, path: Path):
+        super().__init__(f"{path} is used by another process, run a single worker")
+        self.path = path
+
+
+class Record(NamedTuple):
+    value: Any
+    version: int
+    # value's JSON, encoded once per write, for responses and the log
+    encoded: bytes
+    # a strong ETag of `encoded`, computed with it
+    etag: str
+
+
+def new_record(value: Any, version: int, encoded: bytes) -> Record:
+    return Record(value, version, encoded, '"' + sha1(encoded).hexdigest() + '"')
+
+
+class Snapshot(Mapping):
+    """The items as of write `seq`, never changes."""
+
+    __slots__ = ("buckets", "seq")
+
+    def __init__(self, buckets: tuple[dict[str, Record], ...], seq: int):
+        self.buckets = buckets
+        self.seq = seq
+
+    def __getitem__(self, item_id: str) -> Record:
+        return self.buckets[hash(item_id) % BUCKETS][item_id]
+
+    def get(self, item_id: str, default: Any = None) -> Record | None:
+        return self.buckets[hash(item_id) % BUCKETS].get(item_id, default)
+
+    def __contains__(self, item_id: object) -> bool:
+        return item_id in self.buckets[hash(item_id) % BUCKETS]
+
+    def __iter__(self) -> Iterator[str]:
+        for bucket in self.buckets:
+            yield from bucket
+
+    def __len__(self) -> int:
+        return sum(map(len, self.buckets))
+
+
+def log_line(seq: int, item_id: str, record: Record | None) -> bytes:
+    if record is None:
+        return b'{"seq":%d,"id":%s,"deleted":true}\n' % (seq, orjson.dumps(item_id))
+    return b'{"seq":%d,"id":%s,"version":%d,"value":%s}\n' % (
+        seq,
+        orjson.dumps(item_id),
+        record.version,
+        record.encoded,
+    )
+
+
+class ItemStore:
+    """
+    `encode` turns a value into JSON bytes, `decode` turns the parsed JSON
+    back into a value when the store is loaded. Values must not be mutated
+    once stored, store a changed copy. The `initial` items are only stored in
+    a new, empty store.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike | None = None,
+        encode: Callable[[Any], bytes] = orjson.dumps,
+        decode: Callable[[Any], Any] = lambda value: value,
+        snapshot_every: int = 1000,
+        fsync: bool = False,
+        initial: Mapping[str, Any] | None = None,
+    ):
+        self.path = Path(path) if path is not None else None
+        self.encode = encode
+        self.decode = decode
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.initial = initial or {}
+        self.lock = threading.Lock()
+        self.log = None
+        self.lock_fd: int | None = None
+        self.snapshot_seq = 0
+        self.snapshot_thread: threading.Thread | None = None
+        # None until the directory is loaded, see open()
+        self.current: Snapshot | None = None
+        if self.path is None:
+            self.current = self.seeded(empty_buckets(), 0)
+        else:
+            # the forked copy must not use the parent's files or threads
+            forked = weakref.WeakMethod(self.forked)
+            os.register_at_fork(after_in_child=lambda: call_alive(forked))
+
+    ####### reads, no lock
+
+    def snapshot(self) -> Snapshot:
+        current = self.current
+        if current is None:
+            return self.open()
+        return current
+
+    @property
+    def seq(self) -> int:
+        return self.snapshot().seq
+
+    def get(self, item_id: str) -> Record | None:
+        return self.snapshot().get(item_id)
+
+    def __getitem__(self, item_id: str) -> Record:
+        return self.snapshot()[item_id]
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.snapshot()
+
+    def __len__(self) -> int:
+        return len(self.snapshot())
+
+    ####### writes, one at a time
+
+    def put(
+        self, item_id: str, value: Any, expected_version: int | None = None
+    ) -> Record:
+        """
+        Store `value` as the next version of `item_id`. With `expected_version`
+        (0 for "doesn't exist yet") the write only happens if nobody else
+        changed the item since that version.
+        """
+        encoded = self.encode(value)
+        self.snapshot()
+        with self.lock:
+            version = self.check_version(item_id, expected_version)
+            record = new_record(value, version + 1, encoded)
+            self.write(item_id, record)
+        return record
+
+    def update(
+        self,
+        item_id: str,
+        change: Callable[[Any], Any],
+        expected_version: int | None = None,
+    ) -> Record:
+        """Store `change(current value)`, read and written under the write lock."""
+        self.snapshot()
+        with self.lock:
+            version = self.check_version(item_id, expected_version)
+            stored = self.current[item_id]
+            value = change(stored.value)
+            if value is stored.value:
+                return stored
+            record = new_record(value, version + 1, self.encode(value))
+            self.write(item_id, record)
+        return record
+
+    def delete(self, item_id: str, expected_version: int | None = None) -> bool:
+        self.snapshot()
+        with self.lock:
+            if self.check_version(item_id, expected_version) == 0:
+                return False
+            self.write(item_id, None)
+        return True
+
+    def check_version(self, item_id: str, expected_version: int | None) -> int:
+        stored = self.current.get(item_id)
+        version = stored.version if stored is not None else 0
+        if expected_version is not None and expected_version != version:
+            raise VersionConflict(item_id, expected_version, version)
+        return version
+
+    def write(self, item_id: str, record: Record | None) -> None:
+        current = self.current
+        seq = current.seq + 1
+        index = hash(item_id) % BUCKETS
+        bucket = dict(current.buckets[index])
+        if record is None:
+            del bucket[item_id]
+        else:
+            bucket[item_id] = record
+        if self.log is not None:
+            # logged before it is visible, a failed write isn't seen by anyone
+            self.log.write(log_line(seq, item_id, record))
+            self.log.flush()
+            if self.fsync:
+                os.fsync(self.log.fileno())
+        buckets = current.buckets[:index] + (bucket,) + current.buckets[index + 1 :]
+        self.current = Snapshot(buckets, seq)
+        if self.log is not None and seq - self.snapshot_seq >= self.snapshot_every:
+            self.start_snapshot()
+
+    ####### files
+
+    def open(self) -> Snapshot:
+        """Load the directory, once per process, and take it over."""
+        with self.lock:
+            if self.current is not None:
+                return self.current
+            self.path.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path / "lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                raise StoreInUse(self.path) from None
+            self.lock_fd = fd
+            buckets, seq = self.load()
+            self.open_log(seq + 1)
+            # published last, readers don't lock and must not see it half loaded
+            self.current = self.seeded(buckets, seq)
+            return self.current
+
+    def seeded(self, buckets: tuple[dict[str, Record], ...], seq: int) -> Snapshot:
+        if seq == 0:
+            for item_id, value in self.initial.items():
+                seq += 1
+                record = new_record(value, 1, self.encode(value))
+                buckets[hash(item_id) % BUCKETS][item_id] = record
+                if self.log is not None:
+                    self.log.write(log_line(seq, item_id, record))
+        return Snapshot(buckets, seq)
+
+    def forked(self) -> None:
+        # runs in the child: the parent keeps the files, its lock and its
+        # snapshot thread, this process loads the directory again on first use
+        self.lock = threading.Lock()
+        if self.log is not None:
+            self.log.close()  # unbuffered, nothing of the parent's is written
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)  # not LOCK_UN, that would unlock the parent
+        self.log = None
+        self.lock_fd = None
+        self.snapshot_thread = None
+        self.current = None
+
+    def open_log(self, first_seq: int) -> None:
+        if self.log is not None:
+            self.log.close()
+        # unbuffered: each log line is one write() of its own
+        self.log = open(self.path / f"log-{first_seq:012d}.jsonl", "ab", buffering=0)
+
+    def start_snapshot(self) -> None:
+        if self.snapshot_thread is not None and self.snapshot_thread.is_alive():
+            return  # the next write tries again
+        snapshot = self.current
+        # the new log starts after the snapshot, the older ones can go once it is saved
+        self.open_log(snapshot.seq + 1)
+        self.snapshot_seq = snapshot.seq
+        self.snapshot_thread = threading.Thread(
+            target=self.save_snapshot, args=(snapshot,), name="snapshot", daemon=True
+        )
+        self.snapshot_thread.start()
+
+    def save_snapshot(self, snapshot: Snapshot) -> None:
+        name = f"snapshot-{snapshot.seq:012d}.jsonl"
+        tmp_path = self.path / (name + ".tmp")
+        try:
+            with open(tmp_path, "wb") as file:
+                file.write(b'{"seq":%d}\n' % snapshot.seq)
+                for item_id, record in snapshot.items():
+                    file.write(log_line(0, item_id, record))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path / name)
+        except OSError:
+            logger.exception("Snapshot of %s failed", self.path)
+            return
+        for old in self.path.glob("snapshot-*.jsonl"):
+            if old.name < name:
+                old.unlink()
+        for log in self.path.glob("log-*.jsonl"):
+            if int(log.stem.removeprefix("log-")) <= snapshot.seq:
+                log.unlink()
+
+    def load(self) -> tuple[tuple[dict[str, Record], ...], int]:
+        buckets = empty_buckets()
+        seq = 0
+        snapshots = sorted(self.path.glob("snapshot-*.jsonl"))
+        if snapshots:
+            with open(snapshots[-1], "rb") as file:
+                seq = orjson.loads(file.readline())["seq"]
+                for line in file:
+                    self.apply(buckets, orjson.loads(line))
+        self.snapshot_seq = seq
+        for log in sorted(self.path.glob("log-*.jsonl")):
+            end = 0
+            with open(log, "rb") as file:
+                for line in file:
+                    try:
+                        # without its newline the line was cut short too
+                        entry = orjson.loads(line) if line.endswith(b"\n") else None
+                    except orjson.JSONDecodeError:
+                        entry = None
+                    if entry is None:
+                        break
+                    end += len(line)
+                    if entry["seq"] > seq:
+                        self.apply(buckets, entry)
+                        seq = entry["seq"]
+            if end < log.stat().st_size:
+                # the last write before a crash. Cut it off: the newest log is
+                # appended to again, and writes after a torn line would be lost
+                # on the next load
+                logger.warning("Removing a torn write at the end of %s", log)
+                os.truncate(log, end)
+        return buckets, seq
+
+    def apply(self, buckets: tuple[dict[str, Record], ...], entry: dict) -> None:
+        bucket = buckets[hash(entry["id"]) % BUCKETS]
+        if entry.get("deleted"):
+            bucket.pop(entry["id"], None)
+        else:
+            value = self.decode(entry["value"])
+            bucket[entry["id"]] = new_record(
+                value, entry["version"], self.encode(value)
+            )
+
+    def close(self) -> None:
+        """Save a last snapshot, the next start doesn't replay anything."""
+        with self.lock:
+            if self.log is None:
+                return
+            if self.current.seq > self.snapshot_seq:
+                self.start_snapshot()
+            self.log.close()
+            self.log = None
+        if self.snapshot_thread is not None:
+            self.snapshot_thread.join()
+        # the next process can take the directory over
+        os.close(self.lock_fd)
+        self.lock_fd = None
+
+
+def empty_buckets() -> tuple[dict[str, Record], ...]:
+    return tuple({} for _ in range(BUCKETS))
+
+
+def call_alive(method: weakref.WeakMethod) -> None:
+    bound = method()
+    if bound is not None:
+        bound()
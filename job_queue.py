@@ -0,0 +1,412 @@
+# Durable background jobs: work that doesn't have to happen before the response
+# https://fastapi.tiangolo.com/tutorial/background-tasks/
+#
+# BackgroundTasks run in the same process right after the response and are lost
+# if the process stops. A JobQueue keeps its jobs in a SQLite table, runs them
+# on a pool of worker threads and retries failures with exponential backoff:
+#
+#     jobs = JobQueue("jobs.db")
+#
+#     @jobs.task(max_attempts=5)
+#     def send_welcome_email(user_id: int): ...
+#
+#     @app.post("/users/", status_code=202)
+#     def create_user(...):
+#         job_id = jobs.enqueue("send_welcome_email", user_id=user.id)
+#
+#     app.include_router(jobs_router(jobs))  # GET /jobs/{id}, /jobs/metrics
+#
+# Several processes (serve.py workers) can share the file, each claims the
+# ready jobs of the tasks it knows. A claimed job holds a lease: if its process
+# dies the job is run again once the lease expires, so jobs are run at least
+# once and should be idempotent.
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable
+
+import orjson
+from fastapi import APIRouter, HTTPException
+
+logger = logging.getLogger(__name__)
+
+# job columns returned by the status endpoint, the arguments are left out
+JOB_FIELDS = (
+    "id",
+    "name",
+    "status",
+    "attempts",
+    "max_attempts",
+    "result",
+    "error",
+    "enqueued_at",
+    "run_at",
+    "started_at",
+    "finished_at",
+)
+
+
+class Task:
+    __slots__ = ("fn", "max_attempts", "backoff", "max_backoff", "secret")
+
+    def __init__(
+        self,
+        fn: Callable[..., Any],
+        max_attempts: int,
+        backoff: float,
+        max_backoff: float,
+        secret: bool,
+    ):
+        self.fn = fn
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.secret = secret
+
+    def retry_delay(self, attempts: int) -> float:
+        # exponential with full jitter, retries of jobs that failed together spread out
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempts))
+
+
+class JobQueue:
+    """
+    Jobs go from queued to running to done, or back to queued with a later
+    `run_at` after a failure, until `max_attempts` failures make them failed.
+    Finished jobs are kept `keep_seconds` for their status and the metrics.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike = "jobs.db",
+        workers: int = 4,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 300,
+        keep_seconds: float = 7 * 24 * 3600,
+    ):
+        self.path = path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.keep_seconds = keep_seconds
+        self.tasks: dict[str, Task] = {}
+        self.threads: list[threading.Thread] = []
+        self.stopping = threading.Event()
+        self.ready = threading.Condition()
+        self.worker_id = ""
+        # the file and its table are created on first use, importing an app
+        # that declares a queue doesn't touch the disk
+        self.created = False
+        self.create_lock = threading.Lock()
+
+    def create_table(self, db: sqlite3.Connection) -> None:
+        with self.create_lock:
+            if self.created:
+                return
+            db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    args BLOB,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    result BLOB,
+                    error TEXT,
+                    enqueued_at REAL NOT NULL,
+                    run_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    locked_by TEXT,
+                    lease_until REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+                CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+                """
+            )
+            self.created = True
+
+    @contextmanager
+    def connect(self):
+        if not self.created:
+            # e.g. next to a store that is created on first use as well
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            if not self.created:
+                self.create_table(db)
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def task(
+        self,
+        name: str | None = None,
+        max_attempts: int = 3,
+        backoff: float = 1.0,
+        max_backoff: float = 300,
+        secret: bool = False,
+    ):
+        """
+        Register a function as a task, enqueued by `name` (the function's name
+        by default) with JSON serializable keyword arguments. With `secret=True`
+        the arguments are deleted once the job is finished.
+        """
+
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            self.tasks[name or fn.__name__] = Task(
+                fn, max_attempts, backoff, max_backoff, secret
+            )
+            return fn
+
+        return decorator
+
+    def enqueue(self, name: str, delay: float = 0, **kwargs: Any) -> int:
+        if name not in self.tasks:
+            raise KeyError(f"Unknown task {name!r}")
+        now = time.time()
+        with self.connect() as db:
+            job_id = db.execute(
+                "INSERT INTO jobs (name, args, max_attempts, enqueued_at, run_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    name,
+                    orjson.dumps(kwargs),
+                    self.tasks[name].max_attempts,
+                    now,
+                    now + delay,
+                ),
+            ).lastrowid
+        if not delay:
+            with self.ready:
+                self.ready.notify()
+        return job_id
+
+    def get(self, job_id: int) -> dict[str, Any] | None:
+        with self.connect() as db:
+            row = db.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        if job["result"] is not None:
+            job["result"] = orjson.loads(job["result"])
+        return job
+
+    ####### workers
+
+    def claim(self) -> tuple[int, str, dict[str, Any]] | None:
+        now = time.time()
+        names = list(self.tasks)
+        with self.transaction() as db:
+            # jobs of processes that died while running them
+            db.execute(
+                "UPDATE jobs SET locked_by = NULL, lease_until = NULL, "
+                "error = 'lease expired', "
+                "status = CASE WHEN attempts < max_attempts THEN 'queued' "
+                "ELSE 'failed' END, "
+                "finished_at = CASE WHEN attempts < max_attempts THEN NULL "
+                "ELSE ? END "
+                "WHERE status = 'running' AND lease_until < ?",
+                (now, now),
+            )
+            row = db.execute(
+                "SELECT id, name, args FROM jobs "
+                "WHERE status = 'queued' AND run_at <= ? "
+                f"AND name IN ({', '.join('?' * len(names))}) "
+                "ORDER BY run_at, id LIMIT 1",
+                (now, *names),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                "started_at = ?, locked_by = ?, lease_until = ? WHERE id = ?",
+                (now, self.worker_id, now + self.lease_seconds, row[0]),
+            )
+        job_id, name, args = row
+        return job_id, name, orjson.loads(args)
+
+    def finish(self, job_id: int, task: Task, result: Any) -> None:
+        with self.connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, "
+                "finished_at = ?, locked_by = NULL, lease_until = NULL, "
+                "args = CASE WHEN ? THEN NULL ELSE args END "
+                "WHERE id = ? AND locked_by = ?",
+                (
+                    orjson.dumps(result, default=str),
+                    time.time(),
+                    task.secret,
+                    job_id,
+                    self.worker_id,
+                ),
+            )
+
+    def fail(self, job_id: int, task: Task, error: str) -> bool:
+        """Queue the job again, True when it has failed for good instead."""
+        now = time.time()
+        with self.transaction() as db:
+            (attempts,) = db.execute(
+                "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if attempts < task.max_attempts:
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, run_at = ?, "
+                    "locked_by = NULL, lease_until = NULL "
+                    "WHERE id = ? AND locked_by = ?",
+                    (error, now + task.retry_delay(attempts), job_id, self.worker_id),
+                )
+                return False
+            else:
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, "
+                    "locked_by = NULL, lease_until = NULL, "
+                    "args = CASE WHEN ? THEN NULL ELSE args END "
+                    "WHERE id = ? AND locked_by = ?",
+                    (error, now, task.secret, job_id, self.worker_id),
+                )
+                return True
+
+    def run_one(self) -> bool:
+        """Run the next ready job, False when there is none."""
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        job_id, name, args = claimed
+        task = self.tasks[name]
+        try:
+            result = task.fn(**args)
+        except Exception as exc:
+            logger.warning("Job %d (%s) failed: %r", job_id, name, exc, exc_info=True)
+            error = "".join(traceback.format_exception_only(exc))
+            if self.fail(job_id, task, error):
+                logger.error("Job %d (%s) failed for good: %r", job_id, name, exc)
+        else:
+            self.finish(job_id, task, result)
+        return True
+
+    def work(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                if self.run_one():
+                    continue
+            except sqlite3.Error:
+                logger.exception("Job queue %s unavailable", self.path)
+            with self.ready:
+                self.ready.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """Start the worker threads in this process, from the app's startup."""
+        if self.threads:
+            return
+        self.worker_id = f"{os.getpid()}-{id(self)}"
+        self.stopping.clear()
+        self.purge()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"jobs-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 10) -> None:
+        """Let the running jobs finish (up to `timeout`), the queued ones stay queued."""
+        self.stopping.set()
+        with self.ready:
+            self.ready.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self.threads = []
+
+    def purge(self) -> int:
+        with self.connect() as db:
+            return db.execute(
+                "DELETE FROM jobs WHERE finished_at < ?",
+                (time.time() - self.keep_seconds,),
+            ).rowcount
+
+    ####### metrics
+
+    def metrics(self, window_seconds: float = 300) -> dict[str, Any]:
+        """
+        Jobs per status, age of the oldest ready job, and latency percentiles
+        of the jobs finished in the last `window_seconds`: `wait` from the time
+        they were due to their last start, `run` the last attempt, `total` from
+        enqueue to finish.
+        """
+        now = time.time()
+        with self.connect() as db:
+            depth = dict(
+                db.execute("SELECT status, count(*) FROM jobs GROUP BY status")
+            )
+            (oldest,) = db.execute(
+                "SELECT min(run_at) FROM jobs WHERE status = 'queued' AND run_at <= ?",
+                (now,),
+            ).fetchone()
+            rows = db.execute(
+                "SELECT started_at - run_at, finished_at - started_at, "
+                "finished_at - enqueued_at FROM jobs "
+                "WHERE finished_at >= ? AND status = 'done'",
+                (now - window_seconds,),
+            ).fetchall()
+        latency = {}
+        for i, name in enumerate(("wait", "run", "total")):
+            values = sorted(row[i] for row in rows)
+            latency[name] = (
+                {
+                    f"p{p}": round(
+                        values[min(len(values) - 1, len(values) * p // 100)], 4
+                    )
+                    for p in (50, 95, 99)
+                }
+                if values
+                else {}
+            )
+        return {
+            "depth": {
+                s: depth.get(s, 0) for s in ("queued", "running", "done", "failed")
+            },
+            "oldest_ready_seconds": round(now - oldest, 3) if oldest else 0,
+            "finished_in_window": len(rows),
+            "window_seconds": window_seconds,
+            "latency_seconds": latency,
+        }
+
+
+def jobs_router(queue: JobQueue, prefix: str = "/jobs") -> APIRouter:
+    """Status and metrics endpoints, and the workers started with the app."""
+    router = APIRouter(prefix=prefix, tags=["jobs"])
+    router.add_event_handler("startup", queue.start)
+    router.add_event_handler("shutdown", queue.stop)
+
+    @router.get("/metrics")
+    def job_metrics():
+        return queue.metrics()
+
+    @router.get("/{job_id}")
+    def read_job(job_id: int):
+        job = queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    return router
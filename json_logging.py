@@ -0,0 +1,216 @@
+# Structured JSON logs written by a background thread
+# https://docs.python.org/3/howto/logging-cookbook.html#dealing-with-handlers-that-block
+#
+# Request handlers only put the log record on an in-memory queue; formatting
+# and writing happen in a thread that drains the queue in batches, one write()
+# per batch. A full queue drops records instead of blocking the event loop.
+# Repeated messages (same logger, level and message template) are rate limited,
+# past the limit only one in `sample_every` goes through, carrying the number of
+# records suppressed since the previous one.
+#
+#     @app.on_event("startup")
+#     def start_logging():
+#         json_logging.start()
+#
+#     logger = logging.getLogger(__name__)
+#     logger.warning("Item %s not found", item_id, extra={"path": request.url.path})
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import TextIO
+
+import orjson
+
+# attributes every LogRecord has, everything else came from `extra=`
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=repr).decode()
+
+
+class RateLimitFilter(logging.Filter):
+    """A token bucket per message template: `rate` per second, bursts of `burst`."""
+
+    def __init__(
+        self,
+        rate: float = 10,
+        burst: int = 50,
+        sample_every: int = 100,
+        max_keys: int = 10_000,
+    ):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_every = sample_every
+        self.max_keys = max_keys
+        # key -> [tokens, last refill, suppressed since the last record let through]
+        self.buckets: dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_keys:
+                    self.buckets.clear()
+                bucket = self.buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+            else:
+                bucket[2] += 1
+                if bucket[2] % self.sample_every:
+                    return False
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.Handler):
+    """Enqueue records as they are, formatting happens in the writer thread."""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__()
+        self.records = records
+        self.dropped = 0
+        self.writer: BatchWriter | None = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        # logging.shutdown() at exit: write what is still queued
+        if self.writer is not None:
+            self.writer.stop()
+        super().close()
+
+
+class BatchWriter(threading.Thread):
+    def __init__(
+        self,
+        handler: DroppingQueueHandler,
+        stream: TextIO,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+    ):
+        super().__init__(name="json-logging", daemon=True)
+        self.handler = handler
+        self.records = handler.records
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.formatter = JSONFormatter()
+        self.stopping = False
+
+    def run(self) -> None:
+        while not self.stopping or not self.records.empty():
+            try:
+                batch = [self.records.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                # wait for more until the batch is due, only drain when stopping
+                timeout = 0 if self.stopping else deadline - time.monotonic()
+                try:
+                    batch.append(self.records.get(timeout=max(timeout, 0)))
+                except queue.Empty:
+                    break
+            if self.handler.dropped:
+                dropped, self.handler.dropped = self.handler.dropped, 0
+                batch.append(dropped_record(dropped))
+            self.write(batch)
+
+    def write(self, batch: list[logging.LogRecord]) -> None:
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                lines.append(orjson.dumps({"unformattable": repr(record)}).decode())
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        self.stopping = True
+        self.join(timeout=5)
+
+
+def dropped_record(count: int) -> logging.LogRecord:
+    return logging.makeLogRecord(
+        {
+            "name": __name__,
+            "levelno": logging.WARNING,
+            "levelname": "WARNING",
+            "msg": "%d log records dropped, the queue was full",
+            "args": (count,),
+        }
+    )
+
+
+handler: DroppingQueueHandler | None = None
+writer: BatchWriter | None = None
+
+
+def start(
+    logger_name: str = "",
+    level: int = logging.INFO,
+    stream: TextIO | None = None,
+    max_queued: int = 100_000,
+    rate: float = 10,
+    burst: int = 50,
+    sample_every: int = 100,
+) -> BatchWriter:
+    """
+    Send `logger_name` (the root logger by default) through the pipeline, once.
+    It sets the logger's level and starts a thread: call it when the app
+    starts, not at import.
+    """
+    global handler, writer
+    if writer is not None:
+        return writer
+    handler = DroppingQueueHandler(queue.Queue(maxsize=max_queued))
+    handler.addFilter(RateLimitFilter(rate, burst, sample_every))
+    logger = logging.getLogger(logger_name)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    writer = handler.writer = BatchWriter(handler, stream or sys.stderr)
+    writer.start()
+    os.register_at_fork(after_in_child=restart_in_child)
+    return writer
+
+
+def restart_in_child() -> None:
+    """Threads don't survive fork(), forked workers get their own queue and writer."""
+    global writer
+    handler.records = queue.Queue(maxsize=handler.records.maxsize)
+    handler.dropped = 0
+    writer = handler.writer = BatchWriter(handler, writer.stream)
+    writer.start()
@@ -3,10 +3,24 @@
 # http://127.0.0.1:8000/redoc
 
 from enum import Enum
-from fastapi import FastAPI, Query, Path, Body, status
+from fastapi import FastAPI, Query, Path, Body, Depends, Request, status
 from datetime import datetime, time, timedelta
 from uuid import UUID
 
+from fastapi.exceptions import RequestValidationError
+
+from negotiation import NegotiatedRoute
+from numeric_arrays import (
+    NUMERIC_MAP_REQUEST_BODY,
+    NumericMap,
+    NumericMapBody,
+    numeric_map_response,
+)
+from radix_router import use_radix_router
+from response_cache import CachedRoute, cache_response
+from streaming_json import StreamedBody, StreamedElements
+from validation_errors import bounded_validation_handler
+
 
 ###########################################################
 #### GET API setup Examples
@@ -67,7 +81,18 @@ class User(BaseModel):
     full_name: str | None = None
 
 
+class MainRoute(CachedRoute, NegotiatedRoute):
+    # JSON, MessagePack or CBOR depending on Content-Type / Accept,
+    # @cache_response endpoints are served from the response cache
+    pass
+
+
 app = FastAPI()
+app.router.route_class = MainRoute
+# radix tree lookup, duplicate/shadowed routes are logged at startup
+use_radix_router(app)
+# 422s list at most 20 errors however broken the body is
+app.add_exception_handler(RequestValidationError, bounded_validation_handler())
 
 ###########################################################
 #### POST API End Point Examples
@@ -77,6 +102,20 @@ async def create_index_weights(weights: dict[int, float]):
     return weights
 
 
+# Same data decoded into NumPy arrays and checked with vectorized operations,
+# also accepts a compact binary body (application/x-numeric-map)
+
+
+@app.post(
+    "/index-weights/vectorized/",
+    openapi_extra={"requestBody": NUMERIC_MAP_REQUEST_BODY},
+)
+async def create_index_weights_vectorized(
+    request: Request, weights: NumericMap = Depends(NumericMapBody(key_ge=0))
+):
+    return numeric_map_response(weights, request)
+
+
 @app.post("/offers/")
 async def create_offer(offer: Offer):
     return offer
@@ -87,6 +126,31 @@ async def create_multiple_images(images: list[Image]):
     return images
 
 
+# Streaming versions: the body is validated one element at a time while it
+# arrives, memory use is bounded by one Item/Image instead of the whole payload
+
+
+@app.post("/offers/stream/")
+async def create_offer_streaming(
+    offer: StreamedElements[Item] = Depends(StreamedBody(Offer, array_field="items")),
+):
+    item_count = 0
+    items_price = 0.0
+    async for item in offer:
+        item_count += 1
+        items_price += item.price
+    fields = offer.fields()
+    return {"name": fields.name, "item_count": item_count, "items_price": items_price}
+
+
+@app.post("/images/multiple/stream/")
+async def create_multiple_images_streaming(
+    images: StreamedElements[Image] = Depends(StreamedBody(Image)),
+):
+    names = [image.name async for image in images]
+    return {"image_count": len(names), "names": names}
+
+
 @app.post("/items/")
 async def create_item(item: Item):
     item_dict = item.dict()
@@ -266,6 +330,7 @@ async def read_user_item(
 
 
 @app.get("/models/{model_name}")
+@cache_response(ttl=300)
 async def get_model(model_name: ModelName):
     if model_name == ModelName.alexnet:
         return {"model_name": model_name, "message": "Deep Learning FTW!"}
@@ -1,8 +1,11 @@
+import os
 import time
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
+from replay import CaptureMiddleware
+
 
 app = FastAPI()
 
@@ -21,6 +24,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# CAPTURE_REQUESTS=traffic.jsonl records the traffic for
+# `python replay.py traffic.jsonl --app middleware:app`
+if os.environ.get("CAPTURE_REQUESTS"):
+    app.add_middleware(CaptureMiddleware, path=os.environ["CAPTURE_REQUESTS"])
+
 
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
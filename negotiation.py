@@ -0,0 +1,153 @@
+# Content negotiation: MessagePack and CBOR bodies next to JSON
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Content_negotiation
+#
+# A request with `Content-Type: application/msgpack` (or application/cbor) is
+# decoded and validated by the same pydantic models as JSON, and
+# `Accept: application/msgpack` gets the response in MessagePack.
+# msgpack and cbor2 are optional, a format whose package isn't installed is
+# simply not offered.
+from typing import Any, Callable, Coroutine
+
+from fastapi import Request, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, get_request_handler
+from pydantic.error_wrappers import ErrorWrapper
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, use_bin_type=True)
+
+
+class CBORResponse(Response):
+    media_type = CBOR_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return cbor2.dumps(content)
+
+
+def unpack_msgpack(body: bytes) -> Any:
+    # dict[int, float] bodies have integer keys
+    return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+
+# media type -> (decoder, response class)
+FORMATS: dict[str, tuple[Callable[[bytes], Any], type[Response]]] = {}
+if msgpack is not None:
+    for media_type in (
+        MSGPACK_MEDIA_TYPE,
+        "application/x-msgpack",
+        "application/vnd.msgpack",
+    ):
+        FORMATS[media_type] = (unpack_msgpack, MsgPackResponse)
+if cbor2 is not None:
+    FORMATS[CBOR_MEDIA_TYPE] = (cbor2.loads, CBORResponse)
+
+
+def media_type_of(header_value: str | None) -> str:
+    return (header_value or "").split(";", 1)[0].strip().lower()
+
+
+def preferred_media_type(accept: str | None, available: list[str]) -> str:
+    """The best of `available` for an Accept header, JSON when nothing matches."""
+    best, best_quality = JSON_MEDIA_TYPE, 0.0
+    for part in (accept or "").split(","):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media_type = media_type.lower()
+        if media_type in ("*/*", "application/*"):
+            media_type = JSON_MEDIA_TYPE
+        if media_type in available and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+class NegotiatedRoute(APIRoute):
+    """
+    An APIRoute that also speaks MessagePack/CBOR.
+
+    Use it with `app.router.route_class = NegotiatedRoute`. Routes with a custom
+    `response_class` keep it and only get the request side.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        json_handler = super().get_route_handler()
+        handlers = {JSON_MEDIA_TYPE: json_handler}
+        if isinstance(self.response_class, DefaultPlaceholder) and (
+            self.response_class.value is JSONResponse
+        ):
+            for media_type, (_, response_class) in FORMATS.items():
+                handlers[media_type] = get_request_handler(
+                    dependant=self.dependant,
+                    body_field=self.body_field,
+                    status_code=self.status_code,
+                    response_class=response_class,
+                    response_field=self.secure_cloned_response_field,
+                    response_model_include=self.response_model_include,
+                    response_model_exclude=self.response_model_exclude,
+                    response_model_by_alias=self.response_model_by_alias,
+                    response_model_exclude_unset=self.response_model_exclude_unset,
+                    response_model_exclude_defaults=self.response_model_exclude_defaults,
+                    response_model_exclude_none=self.response_model_exclude_none,
+                    dependency_overrides_provider=self.dependency_overrides_provider,
+                )
+        available = list(handlers)
+
+        async def negotiated_handler(request: Request) -> Response:
+            content_type = media_type_of(request.headers.get("content-type"))
+            if content_type in FORMATS and self.body_field is not None:
+                await decode_body(request, FORMATS[content_type][0])
+            accept = request.headers.get("accept")
+            if not accept:
+                return await json_handler(request)
+            response = await handlers[preferred_media_type(accept, available)](request)
+            response.headers.append("vary", "accept")
+            return response
+
+        return negotiated_handler
+
+
+async def decode_body(request: Request, decoder: Callable[[bytes], Any]) -> None:
+    """Decode a binary body and present it to FastAPI as an already parsed JSON body."""
+    body = await request.body()
+    if not body:
+        return
+    try:
+        request._json = decoder(body)
+    except Exception as exc:
+        error = ValueError(f"Could not decode the body: {exc!r}")
+        raise RequestValidationError([ErrorWrapper(error, ("body",))])
+    headers = [
+        (key, value)
+        for key, value in request.scope["headers"]
+        if key != b"content-type"
+    ]
+    headers.append((b"content-type", JSON_MEDIA_TYPE.encode()))
+    request.scope["headers"] = headers
+    if hasattr(request, "_headers"):
+        del request._headers
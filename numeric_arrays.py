@@ -0,0 +1,261 @@
+# Large numeric maps (dict[int, float]) decoded straight into NumPy arrays
+#
+# `dict[int, float]` bodies are validated key by key by pydantic, which builds
+# two Python objects per entry. NumericMapBody parses the body into an int64
+# key array and a float64 value array and checks the constraints with
+# vectorized operations.
+#
+# Accepted bodies:
+#   application/json            {"1": 0.5, "2": 1.25, ...}
+#   application/x-numeric-map   n little-endian int64 keys followed by n float64 values
+import json
+import re
+
+import numpy as np
+import orjson
+from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic.error_wrappers import ErrorWrapper
+
+BINARY_MEDIA_TYPE = "application/x-numeric-map"
+# JSON punctuation turned into spaces, leaving "key value key value ..."
+JSON_PUNCTUATION = bytes.maketrans(b'{}":,', b"     ")
+MAX_EXACT_INT = 2**53
+
+# for openapi_extra={"requestBody": NUMERIC_MAP_REQUEST_BODY}
+NUMERIC_MAP_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "application/json": {
+            "schema": {"type": "object", "additionalProperties": {"type": "number"}}
+        },
+        BINARY_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    },
+}
+
+
+class NumericMap:
+    def __init__(self, keys: np.ndarray, values: np.ndarray):
+        self.keys = keys
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def to_bytes(self) -> bytes:
+        return self.keys.astype("<i8").tobytes() + self.values.astype("<f8").tobytes()
+
+
+def invalid_body(message: str) -> RequestValidationError:
+    return RequestValidationError([ErrorWrapper(ValueError(message), loc=("body",))])
+
+
+# the bytes of {"1": 0.5, "-2": 1e3, ...}
+NUMBER_BYTES = b"0123456789.eE+-"
+NUMERIC_MAP_BYTES = NUMBER_BYTES + b'{}":, \t\n\r'
+INTEGER_KEY = re.compile(r"-?[0-9]+")
+
+
+def is_digit(chars: np.ndarray) -> np.ndarray:
+    return (chars - np.uint8(ord("0"))) < 10
+
+
+def is_simple_json_map(body: bytes) -> bool:
+    """
+    Whether the body is an object of JSON numbers with integer keys, like
+    {"1": 0.5, "-2": 1e3}, checked with vectorized operations. Those are the
+    bodies np.fromstring parses correctly, the others go through the json module.
+    """
+    if body.translate(None, NUMERIC_MAP_BYTES):
+        return False
+    b = np.frombuffer(body, dtype=np.uint8)
+    digit = is_digit(b)
+    number = digit | (b == ord(".")) | (b == ord("-")) | (b == ord("+"))
+    number |= (b | 32) == ord("e")
+    # a run of number characters is a token, "0" in the skeleton
+    start = number.copy()
+    start[1:] &= ~number[:-1]
+    tokens = b.copy()
+    tokens[start] = ord("0")
+    skeleton = tokens[start | ~number].tobytes().translate(None, b" \t\n\r")
+    entries = skeleton.count(b":")
+    if skeleton != b"{" + (b'"0":0,' * entries)[:-1] + b"}":
+        return False
+
+    # every token is a JSON number https://www.json.org/json-en.html
+    padded = np.concatenate((b, np.zeros(2, dtype=np.uint8)))
+    starts = np.flatnonzero(start)
+    first, second, third = b[starts], padded[starts + 1], padded[starts + 2]
+    leading_zero = (first == ord("0")) & is_digit(second)
+    leading_zero |= (first == ord("-")) & (second == ord("0")) & is_digit(third)
+    if leading_zero.any():
+        return False
+    # the characters that aren't digits, and their neighbours
+    others = np.flatnonzero(number & ~digit)
+    char, before = b[others], b[others - 1]
+    after, after_sign = padded[others + 1], padded[others + 2]
+    minus, plus, dot = char == ord("-"), char == ord("+"), char == ord(".")
+    exponent = (char | 32) == ord("e")
+    sign_ok = (minus & start[others] | ((before | 32) == ord("e"))) & is_digit(after)
+    dot_ok = is_digit(before) & is_digit(after)
+    exponent_ok = is_digit(before) & (
+        is_digit(after)
+        | ((after == ord("-")) | (after == ord("+"))) & is_digit(after_sign)
+    )
+    ok = np.where(minus | plus, sign_ok, np.where(dot, dot_ok, exponent_ok))
+    if not ok.all():
+        return False
+    # only digits before a "." in its token, only digits and a "." before an
+    # exponent, and neither in keys (the even tokens)
+    inner = dot | exponent
+    positions = others[inner]
+    token = np.searchsorted(starts, positions, side="right") - 1
+    if not (token % 2).all():
+        return False
+    token_start = starts[token]
+    previous = np.concatenate(([-1], others[:-1]))[inner]
+    previous_char = padded[previous]
+    ok = (previous < token_start) | (previous == token_start) & (
+        previous_char == ord("-")
+    )
+    ok |= exponent[inner] & (previous_char == ord("."))
+    return bool(ok.all())
+
+
+def reject_constant(name: str):
+    raise ValueError(f"{name} is not a number")
+
+
+def load_json_map(body: bytes) -> NumericMap:
+    """The bodies the vectorized path can't vouch for, with the json module."""
+    try:
+        data = json.loads(body, parse_constant=reject_constant)
+    except ValueError:
+        raise invalid_body("Expecting a JSON object of numbers")
+    if not isinstance(data, dict):
+        raise invalid_body("Expecting a JSON object of numbers")
+    if not all(INTEGER_KEY.fullmatch(key) for key in data):
+        raise invalid_body("Keys must be integers")
+    keys = [int(key) for key in data]
+    if any(abs(key) >= MAX_EXACT_INT for key in keys):
+        raise invalid_body("Keys must be integers")
+    values = list(data.values())
+    # bool is an int, "2" would be turned into a float by numpy
+    if not all(type(value) in (int, float) for value in values):
+        raise invalid_body("Values must be numbers")
+    try:
+        values = np.array(values, dtype=np.float64)
+    except OverflowError:
+        raise invalid_body("Values must be finite numbers")
+    return NumericMap(np.array(keys, dtype=np.int64), values)
+
+
+def parse_json_map(body: bytes) -> NumericMap:
+    body = body.strip()
+    if not (body.startswith(b"{") and body.endswith(b"}")):
+        raise invalid_body("Expecting a JSON object of numbers")
+    if not is_simple_json_map(body):
+        return load_json_map(body)
+    entries = body.count(b":")
+    if entries == 0:
+        return NumericMap(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+    numbers = np.fromstring(body.translate(JSON_PUNCTUATION), sep=" ")
+    if len(numbers) != 2 * entries:
+        return load_json_map(body)
+    pairs = numbers.reshape(-1, 2)
+    raw_keys = pairs[:, 0]
+    if not np.all(np.abs(raw_keys) < MAX_EXACT_INT):
+        raise invalid_body("Keys must be integers")
+    return NumericMap(raw_keys.astype(np.int64), np.ascontiguousarray(pairs[:, 1]))
+
+
+def parse_binary_map(body: bytes) -> NumericMap:
+    if len(body) % 16:
+        raise invalid_body("Binary numeric maps are n int64 keys then n float64 values")
+    count = len(body) // 16
+    # zero copy views on the request body
+    keys = np.frombuffer(body, dtype="<i8", count=count)
+    values = np.frombuffer(body, dtype="<f8", count=count, offset=count * 8)
+    return NumericMap(keys, values)
+
+
+def deduplicate(numeric_map: NumericMap) -> NumericMap:
+    """Keep the last value of repeated keys, like a JSON object does."""
+    reversed_keys = numeric_map.keys[::-1]
+    keys, index = np.unique(reversed_keys, return_index=True)
+    if len(keys) == len(numeric_map.keys):
+        return numeric_map
+    return NumericMap(keys, numeric_map.values[::-1][index])
+
+
+class NumericMapBody:
+    """
+    A dependency reading a `dict[int, float]` style body into a NumericMap.
+
+        @app.post("/index-weights/vectorized/")
+        async def create(weights: NumericMap = Depends(NumericMapBody(key_ge=0))):
+            ...
+    """
+
+    def __init__(
+        self,
+        key_ge: int | None = None,
+        key_le: int | None = None,
+        value_ge: float | None = None,
+        value_le: float | None = None,
+        allow_nan: bool = False,
+        max_entries: int | None = None,
+    ):
+        self.key_ge = key_ge
+        self.key_le = key_le
+        self.value_ge = value_ge
+        self.value_le = value_le
+        self.allow_nan = allow_nan
+        self.max_entries = max_entries
+
+    async def __call__(self, request: Request) -> NumericMap:
+        body = await request.body()
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        if content_type == BINARY_MEDIA_TYPE:
+            numeric_map = parse_binary_map(body)
+        else:
+            numeric_map = parse_json_map(body)
+        numeric_map = deduplicate(numeric_map)
+        self.check(numeric_map)
+        return numeric_map
+
+    def check(self, numeric_map: NumericMap):
+        keys, values = numeric_map.keys, numeric_map.values
+        if self.max_entries is not None and len(keys) > self.max_entries:
+            raise invalid_body(f"At most {self.max_entries} entries are allowed")
+        if self.key_ge is not None:
+            reject(keys, keys < self.key_ge, f"keys must be >= {self.key_ge}")
+        if self.key_le is not None:
+            reject(keys, keys > self.key_le, f"keys must be <= {self.key_le}")
+        # binary bodies and numbers like 1e400 bring NaN and infinities
+        if not self.allow_nan:
+            reject(keys, ~np.isfinite(values), "values must be finite numbers")
+        if self.value_ge is not None:
+            reject(keys, values < self.value_ge, f"values must be >= {self.value_ge}")
+        if self.value_le is not None:
+            reject(keys, values > self.value_le, f"values must be <= {self.value_le}")
+
+
+def reject(keys: np.ndarray, bad: np.ndarray, message: str):
+    if bad.any():
+        first = int(keys[np.argmax(bad)])
+        raise invalid_body(f"{int(bad.sum())} invalid entries, {message} (key {first})")
+
+
+def numeric_map_response(numeric_map: NumericMap, request: Request) -> Response:
+    """
+    Binary when the client accepts it, otherwise columnar JSON:
+    {"keys": [...], "values": [...]}
+    """
+    if BINARY_MEDIA_TYPE in request.headers.get("accept", ""):
+        return Response(numeric_map.to_bytes(), media_type=BINARY_MEDIA_TYPE)
+    content = orjson.dumps(
+        {"keys": numeric_map.keys, "values": numeric_map.values},
+        option=orjson.OPT_SERIALIZE_NUMPY,
+    )
+    return Response(content, media_type="application/json")
@@ -0,0 +1,243 @@
+# Route lookup through a radix tree instead of one regex per route
+#
+# Starlette tries `route.matches()` on every route in order. RadixAPIRouter
+# compiles the routes into a tree of path segments (static text or typed
+# parameters), so finding the candidates costs O(path length); only those
+# candidates run their regex, in declaration order, so the behaviour (first
+# match wins, 405 for a wrong method, slash redirects) stays the same.
+#
+# Compiling also reports routes that can never be reached: exact duplicates
+# and routes shadowed by an earlier, more general one.
+import logging
+import re
+from typing import Iterator
+
+from fastapi import FastAPI
+from fastapi.routing import APIRouter
+from starlette.datastructures import URL
+from starlette.responses import RedirectResponse
+from starlette.routing import BaseRoute, Match
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+PARAM_SEGMENT = re.compile(r"^\{([a-zA-Z_][a-zA-Z0-9_]*)\}$")
+
+
+class Node:
+    __slots__ = ("static", "params", "catch_all", "routes")
+
+    def __init__(self):
+        self.static: dict[str, Node] = {}
+        # (segment regex, convertor name, child), one entry per convertor type
+        self.params: list[tuple[re.Pattern, str, Node]] = []
+        # route indexes of `{name:path}` parameters, they take the rest of the path
+        self.catch_all: list[int] = []
+        # route indexes ending at this node
+        self.routes: list[int] = []
+
+    def param_child(self, convertor_name: str, regex: str) -> "Node":
+        for _, name, child in self.params:
+            if name == convertor_name:
+                return child
+        child = Node()
+        self.params.append((re.compile(regex), convertor_name, child))
+        return child
+
+
+def route_segments(route: BaseRoute) -> list[tuple[str, str | None]] | None:
+    """
+    [(text, convertor name or None for static text), ...] for a route's path,
+    None when the route can't go in the tree (mounts, several params in a segment).
+    """
+    path_format = getattr(route, "path_format", None)
+    convertors = getattr(route, "param_convertors", None)
+    if path_format is None or convertors is None or not hasattr(route, "methods"):
+        return None
+    segments = []
+    for segment in path_format.split("/"):
+        if "{" not in segment:
+            segments.append((segment, None))
+            continue
+        match = PARAM_SEGMENT.match(segment)
+        if match is None:
+            return None
+        convertor = convertors[match.group(1)]
+        convertor_name = type(convertor).__name__
+        segments.append((convertor.regex, convertor_name))
+    return segments
+
+
+def segment_covers(earlier: tuple[str, str | None], later: tuple[str, str | None]):
+    """Does every value the later segment matches also match the earlier one?"""
+    earlier_text, earlier_convertor = earlier
+    later_text, later_convertor = later
+    if earlier_convertor is None:
+        return later_convertor is None and earlier_text == later_text
+    if later_convertor is None:
+        return bool(later_text) and re.fullmatch(earlier_text, later_text) is not None
+    return (
+        earlier_convertor == later_convertor or earlier_convertor == "StringConvertor"
+    )
+
+
+def path_covers(earlier: list, later: list) -> bool:
+    for position, segment in enumerate(earlier):
+        if segment[1] == "PathConvertor":
+            return len(later) > position
+        if position >= len(later) or not segment_covers(segment, later[position]):
+            return False
+    return len(earlier) == len(later)
+
+
+def methods_overlap(earlier: BaseRoute, later: BaseRoute) -> bool:
+    earlier_methods = getattr(earlier, "methods", None)
+    later_methods = getattr(later, "methods", None)
+    if not earlier_methods or not later_methods:
+        return earlier_methods == later_methods
+    return bool(earlier_methods & later_methods)
+
+
+def analyze_routes(routes: list[BaseRoute]) -> list[str]:
+    """Warnings about duplicate and shadowed routes, in declaration order."""
+    problems = []
+    compiled = [(route, route_segments(route)) for route in routes]
+    for index, (route, segments) in enumerate(compiled):
+        if segments is None:
+            continue
+        for earlier, earlier_segments in compiled[:index]:
+            if earlier_segments is None or not methods_overlap(earlier, route):
+                continue
+            if earlier_segments == segments:
+                kind = "duplicates"
+            elif path_covers(earlier_segments, segments):
+                kind = "is shadowed by"
+            else:
+                continue
+            problems.append(
+                f"{describe(route)} {kind} {describe(earlier)}, it can't be reached"
+            )
+            break
+    return problems
+
+
+def describe(route: BaseRoute) -> str:
+    methods = ",".join(sorted(getattr(route, "methods", None) or ["WEBSOCKET"]))
+    endpoint = getattr(route, "endpoint", None)
+    where = f" ({endpoint.__module__}.{endpoint.__name__})" if endpoint else ""
+    return f"{methods} {route.path}{where}"
+
+
+class RadixTree:
+    def __init__(self, routes: list[BaseRoute]):
+        self.root = Node()
+        # routes the tree can't index are tried on every request, in order
+        self.always: list[int] = []
+        for index, route in enumerate(routes):
+            segments = route_segments(route)
+            if segments is None:
+                self.always.append(index)
+                continue
+            self.insert(index, segments)
+
+    def insert(self, index: int, segments: list[tuple[str, str | None]]):
+        node = self.root
+        for text, convertor_name in segments:
+            if convertor_name is None:
+                node = node.static.setdefault(text, Node())
+            elif convertor_name == "PathConvertor":
+                node.catch_all.append(index)
+                return
+            else:
+                node = node.param_child(convertor_name, text)
+        node.routes.append(index)
+
+    def candidates(self, path: str) -> list[int]:
+        """Indexes of the routes whose path may match, in declaration order."""
+        found = list(self.always)
+        found.extend(self.walk(self.root, path.split("/"), 0))
+        found.sort()
+        return found
+
+    def walk(self, node: Node, segments: list[str], position: int) -> Iterator[int]:
+        if position == len(segments):
+            yield from node.routes
+            return
+        yield from node.catch_all
+        segment = segments[position]
+        child = node.static.get(segment)
+        if child is not None:
+            yield from self.walk(child, segments, position + 1)
+        for regex, _, child in node.params:
+            if segment and regex.fullmatch(segment):
+                yield from self.walk(child, segments, position + 1)
+
+
+class RadixAPIRouter(APIRouter):
+    """
+    An APIRouter dispatching through a RadixTree, rebuilt whenever routes are
+    added. Install it on an app with `use_radix_router(app)`.
+    """
+
+    tree: RadixTree | None = None
+    compiled_routes: int = -1
+
+    def compile(self) -> RadixTree:
+        if self.tree is None or self.compiled_routes != len(self.routes):
+            self.tree = RadixTree(self.routes)
+            self.compiled_routes = len(self.routes)
+            for problem in analyze_routes(self.routes):
+                logger.warning(problem)
+        return self.tree
+
+    def find(self, scope: Scope) -> tuple[Match, BaseRoute | None, Scope]:
+        partial = None
+        partial_scope: Scope = {}
+        for index in self.compile().candidates(scope["path"]):
+            route = self.routes[index]
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return match, route, child_scope
+            if match == Match.PARTIAL and partial is None:
+                partial, partial_scope = route, child_scope
+        if partial is not None:
+            return Match.PARTIAL, partial, partial_scope
+        return Match.NONE, None, {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await super().__call__(scope, receive, send)
+            return
+        if "router" not in scope:
+            scope["router"] = self
+
+        match, route, child_scope = self.find(scope)
+        if route is not None:
+            scope.update(child_scope)
+            await route.handle(scope, receive, send)
+            return
+
+        if scope["type"] == "http" and self.redirect_slashes and scope["path"] != "/":
+            redirect_scope = dict(scope)
+            if scope["path"].endswith("/"):
+                redirect_scope["path"] = redirect_scope["path"].rstrip("/")
+            else:
+                redirect_scope["path"] = redirect_scope["path"] + "/"
+            match, route, _ = self.find(redirect_scope)
+            if route is not None:
+                response = RedirectResponse(url=str(URL(scope=redirect_scope)))
+                await response(scope, receive, send)
+                return
+
+        await self.default(scope, receive, send)
+
+
+def use_radix_router(app: FastAPI) -> RadixAPIRouter:
+    """Swap the app's router for a RadixAPIRouter, keeping its routes and settings."""
+    router = RadixAPIRouter()
+    router.__dict__.update(app.router.__dict__)
+    app.router = router
+    app.middleware_stack = app.build_middleware_stack()
+    # compile and report problems once all routes are registered
+    router.on_startup.append(router.compile)
+    return router
@@ -0,0 +1,491 @@
+# Replay recorded traffic against an app and report latency per route
+#
+#     python replay.py traffic.jsonl --app main:app               in-process, over ASGI
+#     python replay.py traffic.jsonl --url http://127.0.0.1:8000  against a server
+#     python replay.py traffic.jsonl --app main:app --speed 10    10 times faster
+#     python replay.py traffic.jsonl --app main:app --rps 500     open loop, fixed rate
+#
+# One JSON record per line:
+#   {"t": 0.25, "method": "POST", "path": "/items/?q=1",
+#    "headers": [["content-type", "application/json"]], "body": "{...}"}
+# `t` is a time in seconds, only the differences between records matter
+# (CaptureMiddleware writes the wall clock time), binary bodies go in
+# "body_b64" instead of "body". CaptureMiddleware records real traffic in this
+# format.
+#
+# Requests are started on schedule whether or not earlier ones finished (open
+# loop), and latency is measured from the scheduled start, so a slow server
+# can't hide its queueing delay by slowing the load down.
+import argparse
+import asyncio
+import base64
+import http.client
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
+from urllib.parse import urlsplit
+
+import orjson
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+from uvicorn.importer import import_from_string
+
+
+class Record:
+    __slots__ = ("t", "method", "path", "headers", "body")
+
+    def __init__(
+        self,
+        t: float,
+        method: str,
+        path: str,
+        headers: list[tuple[str, str]],
+        body: bytes,
+    ):
+        self.t = t
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    @classmethod
+    def parse(cls, line: bytes) -> "Record":
+        data = orjson.loads(line)
+        if "body_b64" in data:
+            body = base64.b64decode(data["body_b64"])
+        else:
+            body = (data.get("body") or "").encode()
+        headers = data.get("headers") or []
+        if isinstance(headers, dict):
+            headers = list(headers.items())
+        return cls(
+            float(data.get("t", 0)),
+            data.get("method", "GET").upper(),
+            data["path"],
+            [(str(k).lower(), str(v)) for k, v in headers],
+            body,
+        )
+
+    def to_json(self) -> bytes:
+        data: dict[str, Any] = {
+            "t": round(self.t, 6),
+            "method": self.method,
+            "path": self.path,
+            "headers": self.headers,
+        }
+        try:
+            data["body"] = self.body.decode()
+        except UnicodeDecodeError:
+            data["body_b64"] = base64.b64encode(self.body).decode()
+        return orjson.dumps(data)
+
+
+def load_records(path: str) -> list[Record]:
+    with open(path, "rb") as file:
+        records = [Record.parse(line) for line in file if line.strip()]
+    # several workers append to the same capture file
+    records.sort(key=lambda record: record.t)
+    return records
+
+
+####### clients
+
+
+class ASGIClient:
+    """Calls an ASGI app directly, running its lifespan around the replay."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.lifespan_messages: asyncio.Queue = asyncio.Queue()
+        self.lifespan_done: asyncio.Queue = asyncio.Queue()
+        self.lifespan_task: asyncio.Task | None = None
+
+    async def lifespan(self, event: str) -> None:
+        if self.lifespan_task is None:
+            scope = {"type": "lifespan", "asgi": {"version": "3.0"}}
+            self.lifespan_task = asyncio.create_task(
+                self.app(scope, self.lifespan_messages.get, self.lifespan_done.put)
+            )
+        await self.lifespan_messages.put({"type": f"lifespan.{event}"})
+        answer = asyncio.create_task(self.lifespan_done.get())
+        await asyncio.wait(
+            [answer, self.lifespan_task], return_when=asyncio.FIRST_COMPLETED
+        )
+        if not answer.done():
+            # the app doesn't do lifespan
+            answer.cancel()
+            return
+        message = answer.result()
+        if message["type"].endswith("failed"):
+            raise RuntimeError(f"lifespan {event} failed: {message.get('message')}")
+
+    async def start(self) -> None:
+        await self.lifespan("startup")
+
+    async def stop(self) -> None:
+        if not self.lifespan_task.done():
+            await self.lifespan("shutdown")
+
+    async def request(self, record: Record) -> tuple[int, int]:
+        path, _, query = record.path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": record.method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(k.encode(), v.encode()) for k, v in record.headers],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        status = 0
+        size = 0
+        sent_body = False
+
+        async def receive():
+            nonlocal sent_body
+            if sent_body:
+                # the client stays connected until the response is complete
+                await asyncio.Event().wait()
+            sent_body = True
+            return {"type": "http.request", "body": record.body, "more_body": False}
+
+        async def send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, size
+
+    def route_of(self, record: Record) -> str:
+        """The route template a request goes to, e.g. GET /items/{item_id}."""
+        path = record.path.partition("?")[0]
+        scope = {"type": "http", "path": path, "method": record.method}
+        partial = None
+        for route in getattr(self.app, "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return f"{record.method} {route.path}"
+            if match == Match.PARTIAL and partial is None:
+                partial = route
+        if partial is not None:
+            return f"{record.method} {partial.path}"
+        return f"{record.method} {path}"
+
+
+class HTTPClient:
+    """http.client in a thread pool, one keep-alive connection per thread."""
+
+    def __init__(self, url: str, concurrency: int):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="replay")
+        self.local = threading.local()
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def send(self, record: Record) -> tuple[int, int]:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.connection_class(self.host, self.port, timeout=60)
+            self.local.connection = connection
+        headers = dict(record.headers)
+        headers.pop("content-length", None)
+        headers.pop("host", None)
+        try:
+            connection.request(record.method, record.path, record.body, headers)
+            response = connection.getresponse()
+            return response.status, len(response.read())
+        except Exception:
+            connection.close()
+            self.local.connection = None
+            raise
+
+    async def request(self, record: Record) -> tuple[int, int]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.send, record)
+
+    def route_of(self, record: Record) -> str:
+        return f"{record.method} {record.path.partition('?')[0]}"
+
+
+####### replay and report
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.client_errors = 0
+        self.server_errors = 0
+        self.bytes = 0
+
+    def add(self, latency: float, status: int, size: int) -> None:
+        self.latencies.append(latency)
+        self.bytes += size
+        if status >= 500 or status == 0:
+            self.server_errors += 1
+        elif status >= 400:
+            self.client_errors += 1
+
+    def summary(self, duration: float) -> dict[str, Any]:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+
+        def percentile(p: float) -> float:
+            return latencies[min(count - 1, int(p / 100 * count))] * 1000
+
+        return {
+            "count": count,
+            "rps": count / duration if duration else 0.0,
+            "p50_ms": percentile(50),
+            "p90_ms": percentile(90),
+            "p99_ms": percentile(99),
+            "max_ms": latencies[-1] * 1000,
+            "4xx": self.client_errors / count,
+            "5xx": self.server_errors / count,
+            "bytes": self.bytes,
+        }
+
+
+def schedule(
+    records: list[Record], repeat: int, speed: float, rps: float | None
+) -> Iterator[tuple[float, Record]]:
+    """(offset in seconds from the start, record) in order."""
+    if rps:
+        for i in range(len(records) * repeat):
+            yield i / rps, records[i % len(records)]
+        return
+    start = records[0].t
+    length = records[-1].t - start
+    for round_ in range(repeat):
+        for record in records:
+            # rounds follow each other, keeping the recorded spacing
+            yield (round_ * length + record.t - start) / speed, record
+
+
+async def replay(
+    client: ASGIClient | HTTPClient,
+    records: list[Record],
+    repeat: int = 1,
+    speed: float = 1.0,
+    rps: float | None = None,
+) -> tuple[dict[str, RouteStats], float]:
+    stats: dict[str, RouteStats] = {}
+    routes: dict[tuple[str, str], str] = {}
+    await client.start()
+    loop = asyncio.get_running_loop()
+    begin = loop.time()
+
+    async def run(at: float, record: Record):
+        key = (record.method, record.path)
+        route = routes.get(key)
+        if route is None:
+            route = routes[key] = client.route_of(record)
+        try:
+            status, size = await client.request(record)
+        except Exception:
+            status, size = 0, 0
+        stats.setdefault(route, RouteStats()).add(loop.time() - at, status, size)
+
+    tasks = []
+    for offset, record in schedule(records, repeat, speed, rps):
+        at = begin + offset
+        delay = at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run(at, record)))
+    await asyncio.gather(*tasks)
+    duration = loop.time() - begin
+    await client.stop()
+    return stats, duration
+
+
+def report(stats: dict[str, RouteStats], duration: float) -> str:
+    columns = ["count", "rps", "p50_ms", "p90_ms", "p99_ms", "max_ms", "4xx", "5xx"]
+    width = max([len("route")] + [len(route) for route in stats]) + 2
+    lines = [f"{'route':<{width}}" + "".join(f"{c:>10}" for c in columns)]
+    total = RouteStats()
+    for route, route_stats in sorted(stats.items()):
+        summary = route_stats.summary(duration)
+        lines.append(f"{route:<{width}}" + format_row(summary, columns))
+        total.latencies += route_stats.latencies
+        total.client_errors += route_stats.client_errors
+        total.server_errors += route_stats.server_errors
+    if total.latencies:
+        lines.append(f"{'all':<{width}}" + format_row(total.summary(duration), columns))
+    lines.append(f"{duration:.2f}s")
+    return "\n".join(lines)
+
+
+def format_row(summary: dict[str, Any], columns: list[str]) -> str:
+    cells = []
+    for column in columns:
+        value = summary[column]
+        if column in ("4xx", "5xx"):
+            cells.append(f"{value:>10.1%}")
+        elif isinstance(value, float):
+            cells.append(f"{value:>10.2f}")
+        else:
+            cells.append(f"{value:>10}")
+    return "".join(cells)
+
+
+####### capture
+
+
+class CaptureMiddleware:
+    """
+    Records the requests an app receives in the replay format.
+
+        app.add_middleware(CaptureMiddleware, path="traffic.jsonl")
+
+    Lines are written by a background thread, started in each process that
+    serves requests (threads don't survive the fork of serve.py's workers,
+    which all append to `path`). Bodies over `max_body` bytes are
+    not recorded (the request is skipped), `redact` headers are replaced.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        path: str,
+        sample_rate: float = 1.0,
+        max_body: int = 1024 * 1024,
+        redact: tuple[str, ...] = ("authorization", "cookie"),
+    ):
+        self.app = app
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate else 0
+        self.max_body = max_body
+        self.redact = {name.lower() for name in redact}
+        self.path = path
+        self.seen = 0
+        self.writer_pid: int | None = None
+        self.lines: queue.SimpleQueue = queue.SimpleQueue()
+
+    def start_writer(self) -> None:
+        self.writer_pid = os.getpid()
+        self.lines = queue.SimpleQueue()
+        threading.Thread(
+            target=self.write_lines, args=(self.lines,), name="capture", daemon=True
+        ).start()
+
+    def write_lines(self, lines_queue: queue.SimpleQueue) -> None:
+        with open(self.path, "ab") as file:
+            while True:
+                lines = [lines_queue.get()]
+                while not lines_queue.empty():
+                    lines.append(lines_queue.get())
+                file.write(b"".join(lines))
+                file.flush()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.sample_every:
+            await self.app(scope, receive, send)
+            return
+        self.seen += 1
+        if self.seen % self.sample_every:
+            await self.app(scope, receive, send)
+            return
+
+        if self.writer_pid != os.getpid():
+            self.start_writer()
+        now = time.time()
+        chunks: list[bytes] = []
+        size = 0
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            recorded = True
+            if size > self.max_body:
+                return
+            path = scope.get("root_path", "") + scope["path"]
+            if scope.get("query_string"):
+                path += "?" + scope["query_string"].decode("latin-1")
+            headers = [
+                (
+                    name.decode("latin-1"),
+                    "<redacted>"
+                    if name.decode("latin-1") in self.redact
+                    else value.decode("latin-1"),
+                )
+                for name, value in scope["headers"]
+            ]
+            line = Record(now, scope["method"], path, headers, b"".join(chunks))
+            self.lines.put(line.to_json() + b"\n")
+
+        async def capturing_receive():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request" and not recorded:
+                body = message.get("body", b"")
+                size += len(body)
+                if size <= self.max_body:
+                    chunks.append(body)
+                if not message.get("more_body", False):
+                    record()
+            return message
+
+        try:
+            await self.app(scope, capturing_receive, send)
+        finally:
+            # bodies the app never read are not part of the record
+            if not recorded:
+                record()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded requests")
+    parser.add_argument("records", help="JSONL file of requests")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--app", help="module:attribute to call in-process")
+    target.add_argument("--url", help="base URL of a running server")
+    pace = parser.add_mutually_exclusive_group()
+    pace.add_argument("--speed", type=float, default=1.0, help="x recorded speed")
+    pace.add_argument("--rps", type=float, help="fixed request rate, open loop")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=64, help="with --url")
+    parser.add_argument("--json", action="store_true", help="JSON report")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.records)
+    if not records:
+        sys.exit(f"no requests in {args.records}")
+    if args.app:
+        sys.path.insert(0, ".")
+        client = ASGIClient(import_from_string(args.app))
+    else:
+        client = HTTPClient(args.url, args.concurrency)
+    stats, duration = asyncio.run(
+        replay(client, records, args.repeat, args.speed, args.rps)
+    )
+    if args.json:
+        summaries = {route: s.summary(duration) for route, s in stats.items()}
+        print(orjson.dumps(summaries, option=orjson.OPT_INDENT_2).decode())
+    else:
+        print(report(stats, duration))
+
+
+if __name__ == "__main__":
+    main()
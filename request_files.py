@@ -1,7 +1,76 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from pathlib import Path
+
+from fastapi import (
+    Body,
+    FastAPI,
+    File,
+    UploadFile,
+    Form,
+    Header,
+    HTTPException,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 
+from blob_store import BlobStore, is_digest
+from file_responses import RangeFileResponse
+from job_queue import JobQueue, jobs_router
+from resumable_uploads import (
+    LengthExceeded,
+    OffsetMismatch,
+    SessionNotFound,
+    UploadBusy,
+    UploadFinalizing,
+    UploadIncomplete,
+    UploadSessions,
+)
+
+# uploads are stored once per content digest, file names point at blobs
+blob_store = BlobStore("blob_store")
+# kept next to the blobs so finished uploads are moved in, not copied
+upload_sessions = UploadSessions(blob_store.root / "sessions")
+# finished uploads are hashed and stored after the response
+jobs = JobQueue(blob_store.root / "jobs.db")
+
 app = FastAPI()
+app.include_router(jobs_router(jobs))
+
+
+@app.on_event("startup")
+def collect_garbage():
+    upload_sessions.expire()
+    blob_store.gc()
+
+
+def check_filename(filename: str) -> str:
+    filename = Path(filename or "").name
+    if not filename:
+        raise HTTPException(status_code=400, detail="Missing file name")
+    return filename
+
+
+def check_digest(digest: str) -> str:
+    if not is_digest(digest):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return digest
+
+
+def blob_response(digest: str, request: Request, filename: str | None = None):
+    # the digest is a perfect strong ETag
+    return RangeFileResponse(
+        blob_store.path(digest),
+        filename=filename,
+        method=request.method,
+        headers={"etag": f'"{digest}"', "cache-control": "no-cache"},
+    )
+
+
+def save_upload_file(file: UploadFile) -> str:
+    digest, _ = blob_store.ingest(file.file)
+    blob_store.link(check_filename(file.filename), digest)
+    return digest
 
 
 # @app.post("/files/")
@@ -20,19 +89,196 @@ app = FastAPI()
 async def create_files(
     files: list[bytes] = File(description="Multiple files as bytes"),
 ):
-    return {"file_sizes": [len(file) for file in files]}
+    # the blobs are kept for the store's grace period, link them with PUT /files/{filename}
+    blobs = [await run_in_threadpool(blob_store.ingest_bytes, file) for file in files]
+    return {
+        "file_sizes": [size for _, size in blobs],
+        "digests": [digest for digest, _ in blobs],
+    }
 
 
 @app.post("/uploadfiles/")
 async def create_upload_files(
     files: list[UploadFile] = File(description="Multiple files as UploadFile"),
 ):
+    digests = [await run_in_threadpool(save_upload_file, file) for file in files]
     return {
         "filenames": [file.filename for file in files],
-        "description": [file.description for file in files],
+        "content_types": [file.content_type for file in files],
+        "digests": digests,
     }
 
 
+# Ask before uploading: 200 means the server already has these bytes
+@app.head("/blobs/{digest}")
+async def check_blob(digest: str):
+    size = await run_in_threadpool(blob_store.size, check_digest(digest))
+    if size is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return Response(headers={"content-length": str(size), "etag": f'"{digest}"'})
+
+
+@app.get("/blobs/{digest}")
+async def download_blob(digest: str, request: Request):
+    if not await run_in_threadpool(blob_store.exists, check_digest(digest)):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return blob_response(digest, request)
+
+
+# Store a file by reference to a blob the server already has, no bytes sent
+@app.put("/files/{filename}")
+async def link_file(filename: str, digest: str = Body(embed=True)):
+    try:
+        await run_in_threadpool(
+            blob_store.link, check_filename(filename), check_digest(digest)
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return {"filename": filename, "digest": digest}
+
+
+@app.delete("/files/{filename}", status_code=204)
+async def delete_file(filename: str):
+    if not await run_in_threadpool(blob_store.unlink, filename):
+        raise HTTPException(status_code=404, detail="File not found")
+    await run_in_threadpool(blob_store.gc)
+    return Response(status_code=204)
+
+
+# Download a stored file, supports resumable downloads (Range) and 304s
+# http://127.0.0.1:8000/files/video.mp4
+@app.api_route("/files/{filename}", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request):
+    digest = await run_in_threadpool(blob_store.resolve, filename)
+    if digest is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return blob_response(digest, request, filename=filename)
+
+
+###########################################################
+#### Resumable uploads
+###########################################################
+
+
+def get_upload_session(upload_id: str) -> dict:
+    try:
+        return upload_sessions.get(upload_id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+def upload_headers(session: dict) -> dict:
+    headers = {"upload-offset": str(session["offset"]), "cache-control": "no-store"}
+    if session["length"] is not None:
+        headers["upload-length"] = str(session["length"])
+    return headers
+
+
+@app.post("/uploads/", status_code=201)
+async def create_upload(
+    response: Response,
+    filename: str = Body(),
+    length: int | None = Body(default=None, ge=0),
+):
+    await run_in_threadpool(upload_sessions.expire)
+    session = await run_in_threadpool(
+        upload_sessions.create, check_filename(filename), length
+    )
+    response.headers["location"] = f"/uploads/{session['upload_id']}"
+    return session
+
+
+@app.head("/uploads/{upload_id}")
+async def check_upload(upload_id: str):
+    session = await run_in_threadpool(get_upload_session, upload_id)
+    return Response(status_code=204, headers=upload_headers(session))
+
+
+@app.get("/uploads/{upload_id}")
+async def read_upload(upload_id: str):
+    return await run_in_threadpool(get_upload_session, upload_id)
+
+
+# curl -X PATCH -H "Upload-Offset: 0" --data-binary @chunk http://127.0.0.1:8000/uploads/<id>
+@app.patch("/uploads/{upload_id}")
+async def append_upload_chunk(
+    upload_id: str, request: Request, upload_offset: int = Header(ge=0)
+):
+    try:
+        file = await run_in_threadpool(
+            upload_sessions.open_for_append, upload_id, upload_offset
+        )
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except OffsetMismatch as exc:
+        raise HTTPException(
+            status_code=409,
+            detail="Upload-Offset does not match the stored offset",
+            headers={"upload-offset": str(exc.expected)},
+        )
+    except LengthExceeded:
+        raise HTTPException(status_code=400, detail="Upload is already complete")
+    except UploadBusy:
+        raise HTTPException(status_code=423, detail="Another chunk is being uploaded")
+    except UploadFinalizing as exc:
+        raise HTTPException(
+            status_code=409,
+            detail="Upload is being completed",
+            headers={"location": f"/jobs/{exc.job_id}"},
+        )
+    try:
+        # write chunks as they arrive, the request body is never held in memory
+        async for chunk in request.stream():
+            await run_in_threadpool(file.write, chunk)
+    except LengthExceeded:
+        # nothing of this request was kept
+        raise HTTPException(status_code=400, detail="More data than Upload-Length")
+    finally:
+        await run_in_threadpool(file.close)
+    session = await run_in_threadpool(get_upload_session, upload_id)
+    return Response(status_code=204, headers=upload_headers(session))
+
+
+@jobs.task(max_attempts=5)
+def finish_upload(upload_id: str) -> dict:
+    session = upload_sessions.get(upload_id)
+    digest, size = blob_store.ingest_file(upload_sessions.data_path(upload_id))
+    blob_store.link(session["filename"], digest)
+    upload_sessions.delete(upload_id)
+    return {"filename": session["filename"], "digest": digest, "size": size}
+
+
+def start_finish_upload(session: dict) -> int:
+    return jobs.enqueue("finish_upload", upload_id=session["upload_id"])
+
+
+# Hashing a large upload takes a while: 202 and GET /jobs/{id} for the digest.
+# Completing it again returns the same job.
+@app.post("/uploads/{upload_id}/complete", status_code=202)
+async def complete_upload(upload_id: str, response: Response):
+    try:
+        job_id = await run_in_threadpool(
+            upload_sessions.finalize, upload_id, start_finish_upload
+        )
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadIncomplete:
+        raise HTTPException(status_code=409, detail="Upload is incomplete")
+    except UploadBusy:
+        raise HTTPException(status_code=423, detail="A chunk is being uploaded")
+    job = await run_in_threadpool(jobs.get, job_id)
+    response.headers["location"] = f"/jobs/{job_id}"
+    # purged once it is old enough, its session is gone by then
+    return {"job_id": job_id, "status": job["status"] if job else "done"}
+
+
+@app.delete("/uploads/{upload_id}", status_code=204)
+async def cancel_upload(upload_id: str):
+    await run_in_threadpool(get_upload_session, upload_id)
+    await run_in_threadpool(upload_sessions.delete, upload_id)
+    return Response(status_code=204)
+
+
 @app.post("/formfiles/")
 async def create_form_file(
     file: bytes = File(), fileb: UploadFile = File(), token: str = Form()
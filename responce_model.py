@@ -1,7 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Response
 from pydantic import BaseModel
 
+from etags import content_etag, not_modified
+from fast_serializers import CompiledResponseRoute
+
 app = FastAPI()
+# the response_model_exclude_unset serializer is compiled when the route is added
+app.router.route_class = CompiledResponseRoute
 
 
 class Item(BaseModel):
@@ -17,8 +22,15 @@ items = {
     "bar": {"name": "Bar", "description": "The bartenders", "price": 62, "tax": 20.2},
     "baz": {"name": "Baz", "description": None, "price": 50.2, "tax": 10.5, "tags": []},
 }
+item_etags = {item_id: content_etag(item) for item_id, item in items.items()}
 
 
 @app.get("/items/{item_id}", response_model=Item, response_model_exclude_unset=True)
-async def read_item(item_id: str):
+async def read_item(
+    item_id: str, response: Response, if_none_match: str | None = Header(default=None)
+):
+    etag = item_etags[item_id]
+    if cached := not_modified(if_none_match, etag):
+        return cached
+    response.headers["etag"] = etag
     return items[item_id]
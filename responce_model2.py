@@ -1,7 +1,18 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 
+from fast_serializers import CompiledResponseRoute
+from response_cache import CachedRoute, cache_response
+
+
+class ItemRoute(CachedRoute, CompiledResponseRoute):
+    # serializers for response_model_include/exclude are compiled when routes
+    # are added, @cache_response endpoints are served from the response cache
+    pass
+
+
 app = FastAPI()
+app.router.route_class = ItemRoute
 
 
 class Item(BaseModel):
@@ -28,6 +39,7 @@ items = {
     response_model=Item,
     response_model_include={"name", "description"},
 )
+@cache_response(ttl=60)
 async def read_item_name(item_id: str):
     return items[item_id]
 
@@ -0,0 +1,151 @@
+# Cache the encoded responses of idempotent GET routes
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Caching
+#
+# Mark an endpoint with @cache_response(ttl=...) and use CachedRoute as the
+# route class. Responses are cached as bytes, keyed on the path, the sorted
+# query parameters, the `vary` headers and the credentials (Authorization and
+# Cookie), and carry Cache-Control/Age headers. Write routes drop stale entries
+# with `invalidate_path()`.
+#
+# A cache hit doesn't run the endpoint or its dependencies: a request is only
+# answered from responses to the same credentials, but a dependency that must
+# run every time (a rate limit, a revocation list) rules the cache out.
+#
+#     app.router.route_class = CachedRoute
+#
+#     @app.get("/users/{user_id}")
+#     @cache_response(ttl=30)
+#     def read_user(user_id: int): ...
+from typing import Any, Callable, Coroutine, Iterable
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from ttl_cache import TTLCache
+
+# shared by every cached route unless one brings its own
+response_cache = TTLCache(max_entries=4096, max_bytes=64 * 1024 * 1024)
+# always part of the key, one user's response is never served to another
+CREDENTIAL_HEADERS = ("authorization", "cookie")
+
+
+class CacheOptions:
+    def __init__(
+        self,
+        ttl: float,
+        vary: Iterable[str],
+        public: bool,
+        cache: TTLCache,
+    ):
+        self.ttl = ttl
+        self.vary = tuple(header.lower() for header in vary)
+        self.cache = cache
+        scope = "public" if public else "private"
+        self.cache_control = f"{scope}, max-age={int(ttl)}"
+        # shared caches must not keep responses to a user's credentials
+        self.private_cache_control = f"private, max-age={int(ttl)}"
+
+    def cache_control_for(self, request: Request) -> str:
+        if has_credentials(request):
+            return self.private_cache_control
+        return self.cache_control
+
+
+def cache_response(
+    ttl: float = 60,
+    vary: Iterable[str] = ("accept",),
+    public: bool = True,
+    cache: TTLCache | None = None,
+):
+    """Mark an endpoint as cacheable, CachedRoute does the caching."""
+
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.__response_cache__ = CacheOptions(
+            ttl, vary, public, response_cache if cache is None else cache
+        )
+        return endpoint
+
+    return decorator
+
+
+def invalidate_path(path: str, cache: TTLCache | None = None) -> int:
+    """
+    Drop the cached responses of `path`, whatever their query and headers.
+    Only in this process: the other workers of serve.py keep theirs until
+    their ttl runs out.
+    """
+    return (response_cache if cache is None else cache).invalidate_tag(path)
+
+
+def request_key(request: Request, vary: tuple[str, ...]) -> tuple:
+    """Identifies requests that get the same response."""
+    return (
+        request.method,
+        request.scope["path"],
+        tuple(sorted(request.query_params.multi_items())),
+        tuple(request.headers.get(header, "") for header in vary),
+        tuple(request.headers.get(header, "") for header in CREDENTIAL_HEADERS),
+    )
+
+
+def has_credentials(request: Request) -> bool:
+    return any(header in request.headers for header in CREDENTIAL_HEADERS)
+
+
+def cached_response(entry, cache_control: str) -> Response:
+    status_code, raw_headers, body = entry.value
+    response = Response(body, status_code=status_code)
+    response.raw_headers = [
+        *raw_headers,
+        (b"cache-control", cache_control.encode()),
+        (b"age", str(int(entry.age)).encode()),
+        (b"x-cache", b"hit"),
+    ]
+    return response
+
+
+class CachedRoute(APIRoute):
+    """Serve GET/HEAD requests of @cache_response endpoints from the cache."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        options: CacheOptions | None = getattr(
+            self.endpoint, "__response_cache__", None
+        )
+        if options is None:
+            return handler
+
+        async def cached_handler(request: Request) -> Response:
+            if request.method not in ("GET", "HEAD"):
+                return await handler(request)
+            key = request_key(request, options.vary)
+            if "no-cache" not in request.headers.get("cache-control", ""):
+                entry = options.cache.get(key)
+                if entry is not None:
+                    return cached_response(entry, options.cache_control_for(request))
+            response = await handler(request)
+            body = getattr(response, "body", None)
+            if (
+                response.status_code == 200
+                and body is not None
+                and "set-cookie" not in response.headers
+            ):
+                raw_headers = [
+                    (name, value)
+                    for name, value in response.raw_headers
+                    if name not in (b"cache-control", b"age")
+                ]
+                size = len(body) + sum(len(n) + len(v) for n, v in raw_headers)
+                options.cache.set(
+                    key,
+                    (response.status_code, raw_headers, body),
+                    size=size,
+                    ttl=options.ttl,
+                    tags=(request.scope["path"],),
+                )
+                response.headers["cache-control"] = options.cache_control_for(request)
+                response.headers["age"] = "0"
+                response.headers["x-cache"] = "miss"
+            return response
+
+        return cached_handler
@@ -0,0 +1,209 @@
+# Resumable chunked uploads, sessions live on disk so they survive restarts
+# Protocol loosely follows https://tus.io/protocols/resumable-upload:
+#   POST   /uploads/                 create a session, returns its id
+#   HEAD   /uploads/{id}             current offset in the Upload-Offset header
+#   PATCH  /uploads/{id}             append a chunk at Upload-Offset
+#   POST   /uploads/{id}/complete    hash the data and hand it to the blob store,
+#                                    in a background job
+#
+# Completing a session records its job in meta.json, under the same lock as the
+# appends: from then on chunks are refused, so the data can't change while the
+# job hashes it, and completing it again returns the same job.
+import fcntl
+import json
+import os
+import secrets
+import shutil
+import string
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+SESSION_ID_CHARS = set(string.ascii_letters + string.digits + "-_")
+
+
+class UploadSessionError(Exception):
+    pass
+
+
+class SessionNotFound(UploadSessionError):
+    pass
+
+
+class OffsetMismatch(UploadSessionError):
+    def __init__(self, expected: int):
+        self.expected = expected
+
+
+class LengthExceeded(UploadSessionError):
+    pass
+
+
+class UploadBusy(UploadSessionError):
+    """Another request is appending to the session."""
+
+
+class UploadIncomplete(UploadSessionError):
+    pass
+
+
+class UploadFinalizing(UploadSessionError):
+    """The session is complete, its data is handed to the blob store."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+
+
+class Appender:
+    """
+    The data file of a session, locked while one request appends a chunk.
+    Writes past the session's length are refused and the chunk is dropped.
+    """
+
+    def __init__(self, file: BinaryIO, offset: int, length: int | None):
+        self.file = file
+        self.start = self.offset = offset
+        self.length = length
+
+    def write(self, data: bytes) -> None:
+        if self.length is not None and self.offset + len(data) > self.length:
+            # back to where this chunk started, the client can resend it
+            self.file.truncate(self.start)
+            self.offset = self.start
+            raise LengthExceeded()
+        self.file.write(data)
+        self.offset += len(data)
+
+    def close(self) -> None:
+        # closing the file releases its lock
+        self.file.close()
+
+
+class UploadSessions:
+    """
+    Each session is a directory holding `meta.json` and the `data` received so
+    far. The offset is the size of `data`, so chunks are only ever appended and
+    an interrupted write can be picked up after a restart.
+    """
+
+    def __init__(
+        self,
+        root: str | os.PathLike = "upload_sessions",
+        max_age_seconds: float = 24 * 3600,
+    ):
+        self.root = Path(root)
+        self.max_age_seconds = max_age_seconds
+
+    def session_dir(self, upload_id: str) -> Path:
+        if not upload_id or not set(upload_id) <= SESSION_ID_CHARS:
+            raise SessionNotFound(upload_id)
+        return self.root / upload_id
+
+    def create(self, filename: str, length: int | None = None) -> dict:
+        upload_id = secrets.token_urlsafe(16)
+        session_dir = self.session_dir(upload_id)
+        # the root is made with the first session
+        session_dir.mkdir(parents=True)
+        (session_dir / "data").touch()
+        meta = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "length": length,
+            "created_at": time.time(),
+        }
+        write_meta(session_dir, meta)
+        return {**meta, "offset": 0}
+
+    def get(self, upload_id: str) -> dict:
+        session_dir = self.session_dir(upload_id)
+        try:
+            meta = json.loads((session_dir / "meta.json").read_text())
+            offset = (session_dir / "data").stat().st_size
+        except FileNotFoundError:
+            raise SessionNotFound(upload_id)
+        return {**meta, "offset": offset}
+
+    def data_path(self, upload_id: str) -> Path:
+        return self.session_dir(upload_id) / "data"
+
+    def lock(self, upload_id: str, mode: str) -> BinaryIO:
+        """
+        Open the session data locked: one appending or completing request per
+        session, across threads and processes. Closing the file unlocks it.
+        """
+        try:
+            file = open(self.data_path(upload_id), mode)
+        except FileNotFoundError:
+            raise SessionNotFound(upload_id)
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            raise UploadBusy(upload_id)
+        return file
+
+    def open_for_append(self, upload_id: str, offset: int) -> Appender:
+        """Lock the session data for appending, checking the client's offset."""
+        file = self.lock(upload_id, "ab")
+        try:
+            # the session and the offset are only checked once we hold the lock
+            session = self.get(upload_id)
+            if "job_id" in session:
+                raise UploadFinalizing(session["job_id"])
+            current = os.fstat(file.fileno()).st_size
+            if current != offset:
+                raise OffsetMismatch(current)
+            if session["length"] is not None and offset > session["length"]:
+                raise LengthExceeded(upload_id)
+        except BaseException:
+            file.close()
+            raise
+        # the directory mtime marks the session as active for expire()
+        os.utime(self.session_dir(upload_id))
+        return Appender(file, offset, session["length"])
+
+    def finalize(self, upload_id: str, start_job: Callable[[dict], int]) -> int:
+        """
+        Start `start_job(session)` for a complete session and refuse chunks
+        from then on. The job id is kept, completing again returns it.
+        """
+        with self.lock(upload_id, "rb"):
+            session = self.get(upload_id)
+            if "job_id" in session:
+                return session["job_id"]
+            if session["length"] is not None and session["offset"] != session["length"]:
+                raise UploadIncomplete(upload_id)
+            job_id = start_job(session)
+            meta = {key: value for key, value in session.items() if key != "offset"}
+            write_meta(self.session_dir(upload_id), {**meta, "job_id": job_id})
+        return job_id
+
+    def delete(self, upload_id: str) -> None:
+        shutil.rmtree(self.session_dir(upload_id), ignore_errors=True)
+
+    def expire(self) -> int:
+        """Remove sessions that have not received data for `max_age_seconds`."""
+        cutoff = time.time() - self.max_age_seconds
+        removed = 0
+        if not self.root.exists():
+            return removed
+        for session_dir in self.root.iterdir():
+            try:
+                last_active = session_dir.stat().st_mtime
+            except FileNotFoundError:
+                continue  # deleted meanwhile
+            try:
+                last_active = max(last_active, (session_dir / "data").stat().st_mtime)
+            except FileNotFoundError:
+                pass  # still being created, the directory was just made
+            if last_active < cutoff:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                removed += 1
+        return removed
+
+
+def write_meta(session_dir: Path, meta: dict) -> None:
+    # replaced whole, a reader never sees half of it
+    tmp_path = session_dir / "meta.json.tmp"
+    tmp_path.write_text(json.dumps(meta))
+    os.replace(tmp_path, session_dir / "meta.json")
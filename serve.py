@@ -0,0 +1,275 @@
+# Run an app with several uvicorn worker processes sharing one socket
+# https://www.uvicorn.org/deployment/
+#
+#     python serve.py main:app --workers 4 --port 8000
+#     python serve.py sql_app.main:app --max-requests 10000
+#     python serve.py main_security2:app
+#
+# The app is imported once in the master (preload) and the workers are forked
+# from it, so imports and app setup happen once and the memory stays shared
+# copy-on-write. Signals to the master:
+#   SIGHUP          zero downtime reload: the master re-executes itself with the
+#                   same pid and socket, imports the new code, starts new
+#                   workers and then gracefully stops the old ones
+#   SIGTERM/SIGINT  stop accepting, let the workers finish in-flight requests
+#                   (up to --graceful-timeout), then exit
+# Workers exit after --max-requests (plus some jitter) and are replaced, which
+# contains slow memory growth. POSIX only, it needs fork().
+import argparse
+import logging
+import logging.config
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any
+
+import uvicorn
+from uvicorn.config import LOGGING_CONFIG
+from uvicorn.importer import import_from_string
+
+logger = logging.getLogger("serve")
+
+
+def default_workers() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("app", help="module:attribute, e.g. main:app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--factory", action="store_true", help="app is a factory")
+    parser.add_argument(
+        "--max-requests", type=int, default=0, help="recycle workers, 0 = never"
+    )
+    parser.add_argument("--max-requests-jitter", type=int, default=0)
+    parser.add_argument("--graceful-timeout", type=float, default=30)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    # set by the master when it re-executes itself on SIGHUP
+    parser.add_argument("--fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--old-workers", default="", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def load_app(path: str, factory: bool) -> Any:
+    app = import_from_string(path)
+    return app() if factory else app
+
+
+def bind(args: argparse.Namespace) -> socket.socket:
+    if args.fd is not None:
+        sock = socket.socket(fileno=args.fd)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((args.host, args.port))
+        sock.listen(args.backlog)
+    # kept across the exec of a reload
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):
+    """Tells the master when it accepts connections."""
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets: list | None = None) -> None:
+        await super().startup(sockets=sockets)
+        if self.started:
+            os.write(self.ready_fd, b"1")
+        os.close(self.ready_fd)
+
+
+class Master:
+    def __init__(self, args: argparse.Namespace, sock: socket.socket, app: Any):
+        self.args = args
+        self.sock = sock
+        self.app = app
+        self.workers: dict[int, int] = {}  # pid -> ready pipe
+        self.old_workers = {int(pid) for pid in args.old_workers.split(",") if pid}
+        self.reloading = False
+        self.stopping = False
+
+    def spawn(self) -> int:
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            for other_ready_fd in self.workers.values():
+                os.close(other_ready_fd)
+            status = 0
+            try:
+                self.run_worker(ready_write)
+            except BaseException:
+                logger.exception("Worker failed")
+                status = 1
+            finally:
+                # flush log handlers, os._exit skips the atexit hooks
+                logging.shutdown()
+                os._exit(status)
+        os.close(ready_write)
+        self.workers[pid] = ready_read
+        return pid
+
+    def run_worker(self, ready_fd: int) -> None:
+        # uvicorn handles SIGTERM/SIGINT, SIGHUP is for the master
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        max_requests = None
+        if self.args.max_requests:
+            jitter = random.randint(0, self.args.max_requests_jitter)
+            max_requests = self.args.max_requests + jitter
+        config = uvicorn.Config(
+            self.app,
+            # configured by the master already, a second dictConfig would close
+            # the handlers the app installed when it was imported
+            log_config=None,
+            log_level=self.args.log_level,
+            limit_max_requests=max_requests,
+            backlog=self.args.backlog,
+        )
+        WorkerServer(config, ready_fd).run(sockets=[self.sock])
+
+    def wait_ready(self, pids: list[int], timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        for pid in pids:
+            ready_fd = self.workers.get(pid)
+            if ready_fd is None:
+                return False
+            os.set_blocking(ready_fd, False)
+            while True:
+                try:
+                    if os.read(ready_fd, 1):
+                        break
+                    return False  # closed without starting
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        return False
+                    time.sleep(0.05)
+        return True
+
+    def reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.old_workers.discard(pid)
+            ready_fd = self.workers.pop(pid, None)
+            if ready_fd is None:
+                continue
+            os.close(ready_fd)
+            if not self.stopping and not self.reloading:
+                logger.info("Worker %d exited (%d), starting another", pid, status)
+                self.spawn()
+
+    def stop_workers(self, pids: set[int]) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def drain(self) -> None:
+        """Stop every worker gracefully, kill the ones still running at the timeout."""
+        self.stop_workers(set(self.workers) | self.old_workers)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while (self.workers or self.old_workers) and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in set(self.workers) | self.old_workers:
+            logger.warning("Worker %d did not stop in time, killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.sock.close()
+
+    def reload(self) -> None:
+        # don't exec into code that can't even be imported
+        check = subprocess.run(
+            [sys.executable, __file__, "--check", self.args.app]
+            + (["--factory"] if self.args.factory else []),
+        )
+        if check.returncode != 0:
+            logger.error("Reload aborted, %s can't be loaded", self.args.app)
+            self.reloading = False
+            return
+        # the workers stay our children across the exec, the new image stops
+        # them once its own workers accept connections
+        old_workers = set(self.workers) | self.old_workers
+        argv = [a for a in sys.argv[1:] if not a.startswith(("--fd", "--old-workers"))]
+        argv += [f"--fd={self.sock.fileno()}"]
+        argv += [f"--old-workers={','.join(map(str, old_workers))}"]
+        logger.info("Reloading %s", self.args.app)
+        os.execv(sys.executable, [sys.executable, __file__, *argv])
+
+    def run(self) -> None:
+        def on_hup(signum, frame):
+            self.reloading = True
+
+        def on_term(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGHUP, on_hup)
+        signal.signal(signal.SIGTERM, on_term)
+        signal.signal(signal.SIGINT, on_term)
+
+        pids = [self.spawn() for _ in range(self.args.workers)]
+        if self.old_workers:
+            if self.wait_ready(pids, self.args.graceful_timeout):
+                self.stop_workers(self.old_workers)
+            else:
+                logger.error("New workers did not start, the old ones keep running")
+        logger.info(
+            "Serving %s on %s with %d workers",
+            self.args.app,
+            self.sock.getsockname(),
+            self.args.workers,
+        )
+        while not self.stopping:
+            if self.reloading:
+                self.reload()
+            self.reap()
+            time.sleep(0.2)
+        self.drain()
+
+
+def main(argv: list[str] | None = None) -> None:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("[serve %(process)d] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    argv = sys.argv[1:] if argv is None else argv
+    sys.path.insert(0, os.getcwd())
+    if argv and argv[0] == "--check":
+        args = parse_args(argv[1:])
+        load_app(args.app, args.factory)
+        return
+    args = parse_args(argv)
+    # uvicorn's logging, set up before the app is imported like `uvicorn main:app`
+    logging.config.dictConfig(LOGGING_CONFIG)
+    sock = bind(args)
+    # preload: imported once, shared by the forked workers
+    app = load_app(args.app, args.factory)
+    Master(args, sock, app).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# Request coalescing: concurrent identical reads share one computation
+# (the "singleflight" pattern, https://pkg.go.dev/golang.org/x/sync/singleflight)
+#
+# SingleFlight is for coroutines, SyncSingleFlight for threads. The first caller
+# for a key runs the function, callers arriving while it runs wait for its
+# result or exception. When the first caller is cancelled, or stops at its own
+# request's deadline (deadlines.py), the waiters don't fail with it: they may
+# have no deadline or a later one, so one of them runs the function again.
+#
+# SingleFlightRoute does this for whole GET requests of @single_flight
+# endpoints, async or sync (those run in the threadpool under the same handler).
+# Requests are identical when their path, query, `vary` headers and
+# credentials (Authorization, Cookie) are, see response_cache.request_key:
+#
+#     app.router.route_class = SingleFlightRoute
+#
+#     @app.get("/users/{user_id}")
+#     @single_flight()
+#     def read_user(user_id: int): ...
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Coroutine, Hashable, Iterable, TypeVar
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from deadlines import DeadlineExceeded
+from response_cache import request_key
+
+T = TypeVar("T")
+
+
+class LeaderCancelled(Exception):
+    """The caller running the function was cancelled, waiters try again."""
+
+
+# failures of the caller running the function rather than of the function
+LEADER_ONLY = (asyncio.CancelledError, DeadlineExceeded)
+
+
+class SingleFlight:
+    def __init__(self):
+        self.calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        while key in self.calls:
+            try:
+                # shielded: a waiter being cancelled must not cancel the others
+                return await asyncio.shield(self.calls[key])
+            except LeaderCancelled:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        try:
+            result = await fn()
+        except LEADER_ONLY:
+            set_exception(future, LeaderCancelled())
+            raise
+        except BaseException as exc:
+            set_exception(future, exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
+
+
+def set_exception(future: asyncio.Future, exc: BaseException) -> None:
+    future.set_exception(exc)
+    # nobody may be waiting, don't log "exception was never retrieved"
+    future.exception()
+
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SyncSingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: dict[Hashable, Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        while True:
+            with self.lock:
+                call = self.calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self.calls[key] = Call()
+            if leader:
+                break
+            call.done.wait()
+            if isinstance(call.error, LeaderCancelled):
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except LEADER_ONLY:
+            call.error = LeaderCancelled()
+            raise
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+def single_flight(vary: Iterable[str] = ("accept",)):
+    """Mark an endpoint for coalescing, SingleFlightRoute does the coalescing."""
+
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.__single_flight__ = tuple(header.lower() for header in vary)
+        return endpoint
+
+    return decorator
+
+
+def copy_response(response: Response) -> Response:
+    # waiters send their own copy, background tasks only run for the first caller
+    copy = Response(response.body, status_code=response.status_code)
+    copy.raw_headers = list(response.raw_headers)
+    return copy
+
+
+class SingleFlightRoute(APIRoute):
+    """Coalesce concurrent identical GET/HEAD requests of @single_flight endpoints."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        vary: tuple[str, ...] | None = getattr(self.endpoint, "__single_flight__", None)
+        if vary is None:
+            return handler
+        flight = SingleFlight()
+
+        async def coalesced_handler(request: Request) -> Response:
+            if request.method not in ("GET", "HEAD"):
+                return await handler(request)
+            ran = False
+
+            async def run() -> Response:
+                nonlocal ran
+                ran = True
+                return await handler(request)
+
+            response = await flight.do(request_key(request, vary), run)
+            if ran:
+                return response
+            if getattr(response, "body", None) is None:
+                # streaming responses can't be shared
+                return await handler(request)
+            return copy_response(response)
+
+        return coalesced_handler
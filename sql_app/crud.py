@@ -1,37 +1,100 @@
 # combine the SQLAlchemy and Pydantic Models to interact with the end points and the database
-from sqlalchemy.orm import Session
+# `db` has a session per shard, see sharding.py
+from functools import lru_cache
 
-from . import models, schemas
+from . import models, schemas, sharding
+from .feed import feed
+from .sharding import Shards
 
 
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+def get_user(db: Shards, user_id: int):
+    session = db.for_user(user_id)
+    return session.query(models.User).filter(models.User.id == user_id).first()
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+def get_user_by_email(db: Shards, email: str):
+    user_id = sharding.user_id_for_email(email)
+    return get_user(db, user_id) if user_id is not None else None
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_users(db: Shards, skip: int = 0, limit: int = 100):
+    return db.merged(models.User, skip=skip, limit=limit)
 
 
-def create_user(db: Session, user: schemas.UserCreate):
-    fake_hashed_password = user.password + "notreallyhashed"
-    db_user = models.User(email=user.email, hashed_password=fake_hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+@lru_cache()
+def get_pwd_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def create_user(db: Shards, user: schemas.UserCreate):
+    user_id = sharding.new_user_id()
+    try:
+        sharding.register_email(user.email, user_id)
+    except sharding.EmailTaken:
+        # raises EmailTaken again unless the registration is stale
+        take_over_email(db, user.email, user_id)
+    session = db.for_user(user_id)
+    # no password until the hash_password job has run
+    db_user = models.User(id=user_id, email=user.email, hashed_password=None)
+    session.add(db_user)
+    try:
+        session.commit()
+        if sharding.user_id_for_email(user.email) != user_id:
+            # taken over meanwhile by a signup that didn't see our row yet
+            session.delete(db_user)
+            session.commit()
+            raise sharding.EmailTaken(user.email)
+    except BaseException:
+        session.rollback()
+        sharding.unregister_email(user.email, user_id)
+        raise
+    session.refresh(db_user)
+    feed.publish("user_created", schemas.User.from_orm(db_user).dict())
     return db_user
 
 
-def get_items(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Item).offset(skip).limit(limit).all()
+def take_over_email(db: Shards, email: str, user_id: int) -> None:
+    """
+    Register `email` for `user_id` when it belongs to a user that doesn't
+    exist: the directory entry is committed before the user's row, a process
+    that died between the two leaves it behind.
+    """
+    previous = sharding.user_id_for_email(email)
+    if previous is None:
+        # unregistered meanwhile
+        return sharding.register_email(email, user_id)
+    if get_user(db, previous) is not None:
+        raise sharding.EmailTaken(email)
+    if not sharding.move_email(email, previous, user_id):
+        raise sharding.EmailTaken(email)
+    # or a signup in flight, its row committed since we looked. Either it sees
+    # the email moved and deletes its row, or we see the row and give it back
+    if get_user(db, previous) is not None:
+        sharding.move_email(email, user_id, previous)
+        raise sharding.EmailTaken(email)
+
+
+def set_user_password(db: Shards, user_id: int, password: str):
+    hashed_password = get_pwd_context().hash(password)
+    session = db.for_user(user_id)
+    session.query(models.User).filter(models.User.id == user_id).update(
+        {"hashed_password": hashed_password}
+    )
+    session.commit()
+
+
+def get_items(db: Shards, skip: int = 0, limit: int = 100):
+    return db.merged(models.Item, skip=skip, limit=limit)
 
 
-def create_user_item(db: Session, item: schemas.ItemCreate, user_id: int):
-    db_item = models.Item(**item.dict(), owner_id=user_id)
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+def create_user_item(db: Shards, item: schemas.ItemCreate, user_id: int):
+    # items live on their owner's shard
+    session = db.for_user(user_id)
+    db_item = models.Item(**item.dict(), id=sharding.new_item_id(), owner_id=user_id)
+    session.add(db_item)
+    session.commit()
+    session.refresh(db_item)
+    feed.publish("item_created", schemas.Item.from_orm(db_item).dict())
     return db_item
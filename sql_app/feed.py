@@ -0,0 +1,5 @@
+# feed.py with the change feed: GET /events or WS /events/ws instead of polling
+# GET /items/
+from change_feed import Broadcaster
+
+feed = Broadcaster()
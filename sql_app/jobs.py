@@ -0,0 +1,21 @@
+# jobs.py with the work done after the response
+from job_queue import JobQueue
+from response_cache import invalidate_path
+
+from . import crud
+from .sharding import Shards
+
+jobs = JobQueue("sql_app_jobs.db")
+
+
+# bcrypt is slow on purpose, signing up doesn't wait for it. The password is in
+# the job's arguments until it is hashed.
+@jobs.task(max_attempts=5, secret=True)
+def hash_password(user_id: int, password: str):
+    db = Shards()
+    try:
+        crud.set_user_password(db, user_id=user_id, password=password)
+    finally:
+        db.close()
+    # the user's response says whether they have a password
+    invalidate_path(f"/users/{user_id}")
@@ -1,53 +1,103 @@
-from fastapi import Depends, FastAPI, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Response
 
-from . import crud, models, schemas
-from .database import SessionLocal, engine
+from change_feed import feed_router
+from deadlines import DeadlineRoute, deadline
+from job_queue import jobs_router
 
-models.Base.metadata.create_all(bind=engine)
+from response_cache import CachedRoute, cache_response, invalidate_path
+from single_flight import SingleFlightRoute, single_flight
 
-app = FastAPI()
+from . import crud, schemas, sharding
+from .feed import feed
+from .jobs import jobs
+from .sharding import Shards
+
+
+class UserRoute(DeadlineRoute, CachedRoute, SingleFlightRoute):
+    # cache misses for the same user arriving together run one query, requests
+    # get a 504 and their queries stop at their deadline (X-Request-Timeout,
+    # @deadline or REQUEST_TIMEOUT)
+    pass
+
+
+router = APIRouter(route_class=UserRoute)
 
 
 # Dependency
 def get_db():
-    db = SessionLocal()
+    db = Shards()
     try:
         yield db
     finally:
         db.close()
 
 
-@app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+# 202: the user exists but has no password (has_password is false) until the
+# hash_password job has run. The Location header is the job's status, GET
+# /jobs/{id}. A job that fails max_attempts times is logged and stays "failed"
+# there, and its user keeps has_password false.
+@router.post("/users/", response_model=schemas.User, status_code=202)
+def create_user(
+    user: schemas.UserCreate, response: Response, db: Shards = Depends(get_db)
+):
     db_user = crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    try:
+        db_user = crud.create_user(db=db, user=user)
+    except sharding.EmailTaken:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    job_id = jobs.enqueue("hash_password", user_id=db_user.id, password=user.password)
+    response.headers["location"] = f"/jobs/{job_id}"
+    return db_user
 
 
-@app.get("/users/", response_model=list[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/users/", response_model=list[schemas.User])
+@deadline(5)
+def read_users(skip: int = 0, limit: int = 100, db: Shards = Depends(get_db)):
     users = crud.get_users(db, skip=skip, limit=limit)
     return users
 
 
-@app.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
+@router.get("/users/{user_id}", response_model=schemas.User)
+@cache_response(ttl=30, vary=(), public=False)
+@single_flight(vary=())
+def read_user(user_id: int, db: Shards = Depends(get_db)):
     db_user = crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
-@app.post("/users/{user_id}/items/", response_model=schemas.Item)
+@router.post("/users/{user_id}/items/", response_model=schemas.Item)
 def create_item_for_user(
-    user_id: int, item: schemas.ItemCreate, db: Session = Depends(get_db)
+    user_id: int, item: schemas.ItemCreate, db: Shards = Depends(get_db)
 ):
-    return crud.create_user_item(db=db, item=item, user_id=user_id)
+    db_item = crud.create_user_item(db=db, item=item, user_id=user_id)
+    # the user's response lists their items
+    invalidate_path(f"/users/{user_id}")
+    return db_item
 
 
-@app.get("/items/", response_model=list[schemas.Item])
-def read_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/items/", response_model=list[schemas.Item])
+@deadline(5)
+def read_items(skip: int = 0, limit: int = 100, db: Shards = Depends(get_db)):
     items = crud.get_items(db, skip=skip, limit=limit)
     return items
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(router)
+    app.include_router(jobs_router(jobs))
+    app.include_router(feed_router(feed))
+
+    @app.on_event("startup")
+    def create_tables():
+        sharding.create_all()
+
+    return app
+
+
+# `uvicorn sql_app.main:app`, or `python serve.py sql_app.main:create_app --factory`
+app = create_app()
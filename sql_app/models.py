@@ -2,7 +2,7 @@
 from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
 from sqlalchemy.orm import relationship
 
-from .database import Base
+from .database import Base, DirectoryBase
 
 
 class User(Base):
@@ -15,6 +15,11 @@ class User(Base):
 
     items = relationship("Item", back_populates="owner")
 
+    @property
+    def has_password(self) -> bool:
+        # False until the hash_password job has run (jobs.py)
+        return self.hashed_password is not None
+
 
 class Item(Base):
     __tablename__ = "items"
@@ -25,3 +30,20 @@ class Item(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="items")
+
+
+# in the directory database, shared by the shards
+
+
+class IdBlock(DirectoryBase):
+    __tablename__ = "id_blocks"
+
+    name = Column(String, primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+
+class UserEmail(DirectoryBase):
+    __tablename__ = "user_emails"
+
+    email = Column(String, primary_key=True)
+    user_id = Column(Integer, nullable=False)
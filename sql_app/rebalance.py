@@ -0,0 +1,84 @@
+# rebalance.py moves users and their items to their shard for a new number of
+# shards. Stop the app, run it, then start the app with the new SQL_APP_SHARDS:
+#
+#     python -m sql_app.rebalance --from 1 --to 4
+#
+# Growing from N to M shards only moves the users that jump_hash sends to the
+# new shards. Rows are copied to their new shard before they are deleted from
+# the old one, in batches, so an interrupted run can simply be started again.
+import argparse
+from collections import defaultdict
+
+from sqlalchemy import delete, select
+
+from . import models
+from .database import get_engine, shard_url
+from .sharding import create_all, shard_of
+
+users = models.User.__table__
+items = models.Item.__table__
+
+
+def move(source: int, target: int, moving: list[dict]) -> None:
+    ids = [user["id"] for user in moving]
+    source_engine = get_engine(shard_url(source))
+    with source_engine.connect() as conn:
+        owned = conn.execute(select(items).where(items.c.owner_id.in_(ids)))
+        owned = [dict(item) for item in owned.mappings()]
+    # OR REPLACE: rows copied by an interrupted run are there already
+    with get_engine(shard_url(target)).begin() as conn:
+        conn.execute(users.insert().prefix_with("OR REPLACE"), moving)
+        if owned:
+            conn.execute(items.insert().prefix_with("OR REPLACE"), owned)
+    with source_engine.begin() as conn:
+        conn.execute(delete(items).where(items.c.owner_id.in_(ids)))
+        conn.execute(delete(users).where(users.c.id.in_(ids)))
+
+
+def rebalance(old: int, new: int, batch: int = 500) -> dict[tuple[int, int], int]:
+    """Number of users moved from each (source, target) shard."""
+    create_all(max(old, new))
+    moved: dict[tuple[int, int], int] = defaultdict(int)
+    for source in range(old):
+        last_id = 0
+        while True:
+            with get_engine(shard_url(source)).connect() as conn:
+                page = conn.execute(
+                    select(users)
+                    .where(users.c.id > last_id)
+                    .order_by(users.c.id)
+                    .limit(batch)
+                )
+                page = [dict(user) for user in page.mappings()]
+            if not page:
+                break
+            last_id = page[-1]["id"]
+            by_target = defaultdict(list)
+            for user in page:
+                target = shard_of(user["id"], new)
+                if target != source:
+                    by_target[target].append(user)
+            for target, moving in by_target.items():
+                move(source, target, moving)
+                moved[source, target] += len(moving)
+    return moved
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Move users to their new shard")
+    parser.add_argument("--from", dest="old", type=int, required=True)
+    parser.add_argument("--to", dest="new", type=int, required=True)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args(argv)
+    moved = rebalance(args.old, args.new, args.batch)
+    for (source, target), count in sorted(moved.items()):
+        print(f"shard {source} -> {target}: {count} users")
+    print(
+        f"moved {sum(moved.values())} users, start the app with SQL_APP_SHARDS={args.new}"
+    )
+    for index in range(args.new, args.old):
+        print(f"{shard_url(index)} is empty now")
+
+
+if __name__ == "__main__":
+    main()
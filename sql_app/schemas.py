@@ -30,6 +30,7 @@ class UserCreate(UserBase):
 class User(UserBase):
     id: int
     is_active: bool
+    has_password: bool
     items: list[Item] = []
 
     class Config:
@@ -0,0 +1,228 @@
+# sharding.py with the routing of users and their items to their database
+#
+# A user and all their items live in shard jump_hash(user_id, SHARDS): every
+# per-user query hits one database, and writes for users on different shards
+# don't wait for each other's lock. Lists of all users or items ask every
+# shard in parallel and merge the answers by id (scatter-gather).
+#
+# Ids can't come from each table's autoincrement any more. The directory
+# database hands them out in blocks of ID_BLOCK per process, and maps emails to
+# user ids, which keeps emails unique across shards.
+import contextvars
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+from operator import attrgetter
+from typing import Any, Callable
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import (
+    DIRECTORY_URL,
+    SHARDS,
+    Base,
+    DirectoryBase,
+    SessionLocal,
+    get_engine,
+    shard_url,
+)
+
+ID_BLOCK = 100
+scatter_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="scatter")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash, going from N to N+1 buckets only moves 1/(N+1) of
+    the keys. https://arxiv.org/abs/1406.2294
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_of(user_id: int, shards: int = SHARDS) -> int:
+    return jump_hash(user_id, shards)
+
+
+class Shards:
+    """The sessions of a request (or a job) on each shard, opened on first use."""
+
+    def __init__(self, count: int = SHARDS):
+        self.count = count
+        self.sessions: dict[int, Session] = {}
+
+    def session(self, index: int) -> Session:
+        session = self.sessions.get(index)
+        if session is None:
+            session = SessionLocal(bind=get_engine(shard_url(index)))
+            self.sessions[index] = session
+        return session
+
+    def for_user(self, user_id: int) -> Session:
+        return self.session(shard_of(user_id, self.count))
+
+    def scatter(self, query: Callable[[Session], Any]) -> list[Any]:
+        """`query` run on every shard, in parallel."""
+        sessions = [self.session(index) for index in range(self.count)]
+        if len(sessions) == 1:
+            return [query(sessions[0])]
+        # the pool's threads run in the caller's context, with its deadline
+        futures = [
+            scatter_pool.submit(contextvars.copy_context().run, query, session)
+            for session in sessions
+        ]
+        # all queries end before an error is raised, the caller closes the
+        # sessions the other threads would still be using
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def merged(self, model: type[models.Base], skip: int, limit: int) -> list:
+        """Rows `skip` to `skip + limit` of all shards in id order."""
+
+        # each shard's first skip + limit rows are enough, deep pages cost more
+        def first_rows(session: Session) -> list:
+            query = session.query(model).order_by(model.id)
+            return query.limit(skip + limit).all()
+
+        rows = heapq.merge(*self.scatter(first_rows), key=attrgetter("id"))
+        return list(islice(rows, skip, skip + limit))
+
+    def close(self) -> None:
+        for session in self.sessions.values():
+            session.close()
+
+
+def create_all(shards: int = SHARDS) -> None:
+    for index in range(shards):
+        Base.metadata.create_all(bind=get_engine(shard_url(index)))
+    DirectoryBase.metadata.create_all(bind=get_engine(DIRECTORY_URL))
+    index_emails(shards)
+
+
+####### directory
+
+
+class EmailTaken(Exception):
+    pass
+
+
+class IdAllocator:
+    """Ids from the directory database, ID_BLOCK at a time."""
+
+    def __init__(self, name: str, model: type[models.Base]):
+        self.name = name
+        self.model = model
+        self.lock = threading.Lock()
+        self.next_id = self.end = 0
+        # a forked worker must not hand out the ids of its parent's block
+        os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self) -> None:
+        self.lock = threading.Lock()
+        self.next_id = self.end = 0
+
+    def __call__(self) -> int:
+        with self.lock:
+            if self.next_id == self.end:
+                self.next_id, self.end = self.reserve(ID_BLOCK)
+            self.next_id += 1
+            return self.next_id - 1
+
+    def reserve(self, count: int) -> tuple[int, int]:
+        block = models.IdBlock
+        while True:
+            with Session(get_engine(DIRECTORY_URL)) as db:
+                # the update takes the write lock before anything is read
+                updated = (
+                    db.query(block)
+                    .filter(block.name == self.name)
+                    .update({block.next_id: block.next_id + count})
+                )
+                if updated:
+                    query = db.query(block.next_id).filter(block.name == self.name)
+                    end = query.scalar()
+                    db.commit()
+                    return end - count, end
+                # the first block starts after the rows created before sharding
+                first = 1 + max(Shards().scatter(self.max_id))
+                db.add(block(name=self.name, next_id=first + count))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    continue  # another process created it first
+                return first, first + count
+
+    def max_id(self, session: Session) -> int:
+        try:
+            return session.query(func.max(self.model.id)).scalar() or 0
+        finally:
+            session.close()
+
+
+new_user_id = IdAllocator("users", models.User)
+new_item_id = IdAllocator("items", models.Item)
+
+
+def register_email(email: str, user_id: int) -> None:
+    with Session(get_engine(DIRECTORY_URL)) as db:
+        db.add(models.UserEmail(email=email, user_id=user_id))
+        try:
+            db.commit()
+        except IntegrityError:
+            raise EmailTaken(email)
+
+
+def unregister_email(email: str, user_id: int) -> None:
+    with Session(get_engine(DIRECTORY_URL)) as db:
+        db.query(models.UserEmail).filter(
+            models.UserEmail.email == email, models.UserEmail.user_id == user_id
+        ).delete()
+        db.commit()
+
+
+def move_email(email: str, previous: int, user_id: int) -> bool:
+    """Point `email` at `user_id` if it still points at `previous`."""
+    with Session(get_engine(DIRECTORY_URL)) as db:
+        moved = (
+            db.query(models.UserEmail)
+            .filter(
+                models.UserEmail.email == email,
+                models.UserEmail.user_id == previous,
+            )
+            .update({models.UserEmail.user_id: user_id})
+        )
+        db.commit()
+        return bool(moved)
+
+
+def user_id_for_email(email: str) -> int | None:
+    with Session(get_engine(DIRECTORY_URL)) as db:
+        entry = db.get(models.UserEmail, email)
+        return entry.user_id if entry is not None else None
+
+
+def index_emails(shards: int = SHARDS) -> None:
+    """Fill a new directory with the emails of the users already stored."""
+    with Session(get_engine(DIRECTORY_URL)) as db:
+        if db.query(models.UserEmail).first() is not None:
+            return
+        shards_db = Shards(shards)
+        try:
+            for users in shards_db.scatter(
+                lambda session: session.query(models.User.email, models.User.id).all()
+            ):
+                for email, user_id in users:
+                    db.merge(models.UserEmail(email=email, user_id=user_id))
+        finally:
+            shards_db.close()
+        db.commit()
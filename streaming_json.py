@@ -0,0 +1,247 @@
+# Stream large JSON array bodies element by element
+#
+# A body like [{...}, {...}, ...] or {"name": ..., "items": [{...}, ...]} is read
+# from request.stream() and every array element is decoded and validated on its
+# own, so memory is bounded by one element and the first bad element stops the
+# request with a 422.
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator, Generic, TypeVar
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+WHITESPACE = " \t\n\r"
+# the rest of a number cut at the end of a chunk, "12." and "1e-" decode as 12, 1
+NUMBER_TAIL = re.compile(r"[0-9.eE+-]*\Z")
+# what a value cut at the end of a chunk can start with, past whitespace
+KEYWORDS = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+MAX_ELEMENT_SIZE = 8 * 1024 * 1024
+
+
+class ElementTooLarge(ValueError):
+    pass
+
+
+def invalid_body(exc: Exception, *loc: int | str) -> RequestValidationError:
+    return RequestValidationError([ErrorWrapper(exc, loc=("body", *loc))])
+
+
+def cut_short(exc: json.JSONDecodeError) -> bool:
+    """Whether more data could make the JSON valid, or it is wrong already."""
+    if exc.msg.startswith("Unterminated string"):
+        return True
+    rest = exc.doc[exc.pos :].lstrip(WHITESPACE)
+    if exc.msg.startswith("Invalid \\uXXXX escape"):
+        return len(rest) <= 5  # "uXXXX" and the end of the data
+    # "Expecting value", "Expecting ',' delimiter"... at the end of the data,
+    # or after the start of a number ("1." in an object)
+    return NUMBER_TAIL.match(rest) is not None or any(
+        keyword.startswith(rest) for keyword in KEYWORDS
+    )
+
+
+class JSONStreamReader:
+    """A tiny pull parser: skips whitespace and punctuation, decodes whole values."""
+
+    def __init__(
+        self, chunks: AsyncIterator[bytes], max_element_size: int = MAX_ELEMENT_SIZE
+    ):
+        self.chunks = chunks
+        self.max_element_size = max_element_size
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.offset = 0  # characters dropped from the front of the buffer
+        # chunks read but not added to the buffer yet: a big element arriving
+        # in small chunks isn't copied once per chunk
+        self.pending: list[str] = []
+        self.pending_size = 0
+        self.eof = False
+
+    async def fill(self) -> bool:
+        if self.eof:
+            return False
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            chunk = b""
+            self.eof = True
+        text = self.text_decoder.decode(chunk, final=self.eof)
+        self.pending.append(text)
+        self.pending_size += len(text)
+        return True
+
+    def merge(self) -> None:
+        """Add the pending chunks to the buffer."""
+        if self.pos > len(self.buffer) // 2:
+            # forget what was already parsed
+            self.offset += self.pos
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        self.buffer += "".join(self.pending)
+        self.pending.clear()
+        self.pending_size = 0
+
+    async def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.pending and not await self.fill():
+                return ""
+            self.merge()
+
+    async def expect(self, chars: str) -> str:
+        char = await self.peek()
+        if not char or char not in chars:
+            raise invalid_body(
+                ValueError(f"Expecting one of {chars!r}"), self.offset + self.pos
+            )
+        self.pos += 1
+        return char
+
+    async def value(self) -> Any:
+        await self.peek()
+        wanted = 0
+        while True:
+            available = len(self.buffer) - self.pos + self.pending_size
+            if available >= wanted or self.eof:
+                self.merge()
+                try:
+                    value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                except json.JSONDecodeError as exc:
+                    if self.eof or not cut_short(exc):
+                        # not the JSONDecodeError itself, it would echo the buffer
+                        raise invalid_body(ValueError(exc.msg), self.offset + exc.pos)
+                    # cut in the middle, wait for twice as much data so a big
+                    # element isn't parsed over and over again
+                    wanted = available * 2
+                else:
+                    # a number at the end of the buffer may continue in the
+                    # next chunk
+                    if (
+                        self.eof
+                        or type(value) not in (int, float)
+                        or not NUMBER_TAIL.match(self.buffer, end)
+                    ):
+                        self.pos = end
+                        return value
+                    wanted = available + 1
+            if available > self.max_element_size:
+                raise invalid_body(
+                    ElementTooLarge("JSON element too large"), self.offset + self.pos
+                )
+            await self.fill()
+
+
+class StreamedBody(Generic[ModelT]):
+    """
+    A dependency that streams the elements of a JSON array body.
+
+    `StreamedBody(Image)` reads a top level array of images,
+    `StreamedBody(Offer, array_field="items")` reads an Offer object and streams
+    its `items`, the other fields of the object are available from `fields()`
+    once the elements have been consumed.
+
+        @app.post("/images/stream/")
+        async def create_images(images: StreamedBody[Image] = Depends(StreamedBody(Image))):
+            async for image in images:
+                ...
+    """
+
+    def __init__(
+        self,
+        model: type[BaseModel],
+        array_field: str | None = None,
+        max_element_size: int = MAX_ELEMENT_SIZE,
+    ):
+        self.model = model
+        self.array_field = array_field
+        self.max_element_size = max_element_size
+        if array_field is None:
+            self.element_model = model
+        else:
+            self.element_model = model.__fields__[array_field].type_
+
+    def __call__(self, request: Request) -> "StreamedElements[ModelT]":
+        reader = JSONStreamReader(request.stream(), self.max_element_size)
+        return StreamedElements(self, reader)
+
+
+class StreamedElements(Generic[ModelT]):
+    def __init__(self, body: StreamedBody, reader: JSONStreamReader):
+        self.body = body
+        self.reader = reader
+        self.raw_fields: dict[str, Any] = {}
+        self.count = 0
+        self.consumed = False
+
+    def __aiter__(self) -> AsyncIterator[ModelT]:
+        return self.elements()
+
+    async def elements(self) -> AsyncIterator[ModelT]:
+        reader = self.reader
+        if self.body.array_field is None:
+            async for element in self.array_elements(()):
+                yield element
+        else:
+            await reader.expect("{")
+            if await reader.peek() == "}":
+                reader.pos += 1
+            else:
+                while True:
+                    key = await reader.value()
+                    if not isinstance(key, str):
+                        raise invalid_body(
+                            ValueError("Expecting a property name"),
+                            reader.offset + reader.pos,
+                        )
+                    await reader.expect(":")
+                    if key == self.body.array_field:
+                        async for element in self.array_elements((key,)):
+                            yield element
+                    else:
+                        self.raw_fields[key] = await reader.value()
+                    if await reader.expect(",}") == "}":
+                        break
+        if await reader.peek():
+            raise invalid_body(
+                ValueError("Extra data after the JSON body"), reader.offset + reader.pos
+            )
+        self.consumed = True
+
+    async def array_elements(self, loc: tuple) -> AsyncIterator[ModelT]:
+        reader = self.reader
+        await reader.expect("[")
+        if await reader.peek() == "]":
+            reader.pos += 1
+            return
+        while True:
+            data = await reader.value()
+            try:
+                element = self.body.element_model.parse_obj(data)
+            except ValidationError as exc:
+                raise invalid_body(exc, *loc, self.count)
+            del data
+            self.count += 1
+            yield element
+            if await reader.expect(",]") == "]":
+                return
+
+    def fields(self) -> ModelT:
+        """The object around the array, validated, with an empty array."""
+        assert self.consumed, "iterate over the elements first"
+        try:
+            return self.body.model.parse_obj(
+                {**self.raw_fields, self.body.array_field: []}
+            )
+        except ValidationError as exc:
+            raise invalid_body(exc)
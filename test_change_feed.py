@@ -0,0 +1,102 @@
+import asyncio
+
+import orjson
+
+from change_feed import Broadcaster
+
+
+def event_types(batch) -> list[str]:
+    return [orjson.loads(event.text)["type"] for event in batch]
+
+
+def reset_reason(batch) -> str:
+    [event] = batch
+    content = orjson.loads(event.text)
+    assert content["type"] == "reset"
+    return content["data"]["reason"]
+
+
+def first_batch(feed: Broadcaster, last_event_id: str | None, keepalive: float = 1):
+    async def read():
+        subscription = feed.subscribe(last_event_id, keepalive=keepalive)
+        try:
+            return await subscription.__anext__()
+        finally:
+            await subscription.aclose()
+
+    return asyncio.run(read())
+
+
+def test_resume_after_last_event_id():
+    feed = Broadcaster()
+    first = feed.publish("created", {"id": 1})
+    feed.publish("updated", {"id": 1})
+    feed.publish("deleted", {"id": 1})
+    batch = first_batch(feed, first)
+    assert event_types(batch) == ["updated", "deleted"]
+    assert batch[-1].id == feed.event_id(3)
+    # nothing missed: the next events, or a keepalive
+    assert first_batch(feed, batch[-1].id, keepalive=0.01) == []
+
+
+def test_unknown_or_old_last_event_id():
+    feed = Broadcaster(history=4)
+    for i in range(10):
+        feed.publish("created", {"id": i})
+    for last_event_id in (
+        "0-3",  # an earlier process
+        f"{feed.epoch}-11",  # not published yet
+        f"{feed.epoch}-x",
+        "garbage",
+    ):
+        batch = first_batch(feed, last_event_id)
+        assert reset_reason(batch) == "unknown last_event_id", last_event_id
+        assert batch[0].id == feed.event_id(10)
+    assert (
+        reset_reason(first_batch(feed, feed.event_id(5))) == "last_event_id is too old"
+    )
+    # the last `history` events can still be resumed from
+    assert len(first_batch(feed, feed.event_id(6))) == 4
+
+
+def test_lagging_subscriber_gets_a_reset():
+    feed = Broadcaster(history=4)
+
+    async def read():
+        subscription = feed.subscribe()
+        loop = asyncio.get_running_loop()
+        # more than `history` events before the subscriber reads any
+        loop.call_soon(lambda: [feed.publish("created", {"id": i}) for i in range(6)])
+        reset = await subscription.__anext__()
+        loop.call_soon(feed.publish, "updated", {"id": 5})
+        after_reset = await subscription.__anext__()
+        await subscription.aclose()
+        return reset, after_reset
+
+    reset, after_reset = asyncio.run(read())
+    assert reset_reason(reset) == "lagged"
+    assert reset[0].id == feed.event_id(6)
+    # continues with the events published after the reset
+    assert event_types(after_reset) == ["updated"]
+    assert after_reset[0].id == feed.event_id(7)
+
+
+def test_waiters_are_removed_when_subscriptions_close():
+    feed = Broadcaster()
+
+    async def read():
+        loop = asyncio.get_running_loop()
+        subscriptions = [feed.subscribe(keepalive=0.01) for _ in range(2)]
+        for subscription in subscriptions:
+            assert await subscription.__anext__() == []
+        # one waiter for the event loop, counting both subscribers
+        assert list(feed.waiters) == [loop]
+        assert feed.subscribers == 2
+        await subscriptions[0].aclose()
+        assert feed.subscribers == 1
+        await subscriptions[1].aclose()
+        assert feed.waiters == {}
+
+    asyncio.run(read())
+    # publishing doesn't need any loop any more
+    feed.publish("created", {"id": 1})
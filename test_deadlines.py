@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from deadlines import DeadlineExceeded, deadline
+from single_flight import single_flight
+from sql_app.database import get_engine
+from sql_app.main import UserRoute
+
+# about 10s for sqlite without an interrupt
+SLOW_QUERY = text(
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x+1 FROM c WHERE x < :n)"
+    " SELECT count(*) FROM c"
+)
+
+queries: list[tuple[int, str, float]] = []
+
+
+def count(n: int) -> int:
+    start = time.monotonic()
+    try:
+        with get_engine().connect() as connection:
+            result = connection.execute(SLOW_QUERY, {"n": n}).scalar()
+    except DeadlineExceeded:
+        queries.append((n, "interrupted", time.monotonic() - start))
+        raise
+    queries.append((n, "done", time.monotonic() - start))
+    return result
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    router = APIRouter(route_class=UserRoute)
+
+    @router.get("/slow/")
+    @deadline(0.2)
+    def slow():
+        return count(30_000_000)
+
+    @router.get("/count/")
+    @single_flight(vary=())
+    def read_count(n: int):
+        return count(n)
+
+    app.include_router(router)
+    return app
+
+
+def test_slow_query_is_interrupted(sql_app_dir):
+    queries.clear()
+    with TestClient(create_app()) as client:
+        start = time.monotonic()
+        response = client.get("/slow/")
+        elapsed = time.monotonic() - start
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Request deadline exceeded"}
+    # the query stopped at the deadline, the thread is free again
+    [(_, outcome, query_time)] = queries
+    assert outcome == "interrupted"
+    assert query_time < 1
+    assert elapsed < 1
+
+
+def test_waiters_keep_their_own_deadline(sql_app_dir):
+    queries.clear()
+    n = 1_000_000
+    with TestClient(create_app()) as client, ThreadPoolExecutor(3) as pool:
+        # the first request runs the query for all three
+        leader = pool.submit(
+            client.get, f"/count/?n={n}", headers={"x-request-timeout": "0.05"}
+        )
+        time.sleep(0.02)
+        no_deadline = pool.submit(client.get, f"/count/?n={n}")
+        later_deadline = pool.submit(
+            client.get, f"/count/?n={n}", headers={"x-request-timeout": "30"}
+        )
+        assert leader.result().status_code == 504
+        for waiter in (no_deadline, later_deadline):
+            response = waiter.result()
+            assert response.status_code == 200
+            assert response.json() == n
+    # the leader's query was interrupted, one of the waiters ran it again and
+    # the other one shared that
+    assert [outcome for _, outcome, _ in queries] == ["interrupted", "done"]
@@ -0,0 +1,74 @@
+import orjson
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from fast_serializers import CompiledResponseRoute, compile_serializer
+from trusted_models import trusted
+
+
+class Item(BaseModel):
+    name: str
+    price: float
+
+
+def require_token(x_token: str = Header(default="")):
+    if x_token != "secret":
+        raise HTTPException(status_code=403, detail="Invalid X-Token")
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.router.route_class = CompiledResponseRoute
+    router = APIRouter(route_class=CompiledResponseRoute)
+
+    @app.get("/route/", response_model=Item, dependencies=[Depends(require_token)])
+    def route_dependency():
+        return {"name": "Foo", "price": 1}
+
+    @router.get("/router/", response_model=Item)
+    def router_dependency():
+        return {"name": "Foo", "price": 1}
+
+    app.include_router(router, dependencies=[Depends(require_token)])
+    return app
+
+
+def test_dependencies_reject_request():
+    client = TestClient(create_app())
+    for path in ("/route/", "/router/"):
+        assert client.get(path).status_code == 403
+        response = client.get(path, headers={"x-token": "secret"})
+        assert response.status_code == 200
+        assert response.json() == {"name": "Foo", "price": 1.0}
+
+
+class User(BaseModel):
+    name: str
+
+
+class UserInDB(User):
+    hashed_password: str
+
+
+class Team(BaseModel):
+    name: str
+    lead: User
+    members: list[User] = []
+
+
+def test_nested_models_only_have_declared_fields():
+    serialize = compile_serializer(Team)
+    user = UserInDB(name="alice", hashed_password="secret-hash")
+    for team in (
+        {"name": "a", "lead": user, "members": [user]},
+        Team(name="a", lead=user, members=[user]),
+    ):
+        expected = {
+            "name": "a",
+            "lead": {"name": "alice"},
+            "members": [{"name": "alice"}],
+        }
+        assert orjson.loads(serialize(team)) == expected
+        # trusted skips the checks of scalars, not the nested fields' serializers
+        assert orjson.loads(serialize(trusted(team))) == expected
@@ -0,0 +1,43 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from file_responses import RangeFileResponse, RangeNotSatisfiable, parse_range
+
+
+@pytest.mark.parametrize(
+    "header, size, expected",
+    [
+        ("bytes=0-4", 10, (0, 4)),
+        ("bytes=5-", 10, (5, 9)),
+        ("bytes=-3", 10, (7, 9)),
+        ("bytes=-30", 10, (0, 9)),
+        ("bytes=2-30", 10, (2, 9)),
+        ("items=0-4", 10, None),
+        ("bytes=0-1,4-5", 10, None),
+    ],
+)
+def test_parse_range(header, size, expected):
+    assert parse_range(header, size) == expected
+
+
+@pytest.mark.parametrize(
+    "header, size",
+    [("bytes=-1", 0), ("bytes=0-", 0), ("bytes=-0", 10), ("bytes=10-", 10)],
+)
+def test_range_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)
+
+
+def test_suffix_range_of_an_empty_file(tmp_path):
+    (tmp_path / "empty.bin").write_bytes(b"")
+    app = FastAPI()
+
+    @app.get("/empty")
+    def read_empty():
+        return RangeFileResponse(tmp_path / "empty.bin")
+
+    response = TestClient(app).get("/empty", headers={"range": "bytes=-5"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */0"
@@ -0,0 +1,90 @@
+import os
+from hashlib import sha1
+
+import pytest
+
+from item_store import ItemStore, StoreInUse
+
+
+def run_in_child(function) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            function()
+            code = 0
+        finally:
+            os._exit(code)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
+def test_forked_worker_writes(tmp_path):
+    # made at import in the serve.py master, used by the worker it forks
+    store = ItemStore(tmp_path / "items", initial={"foo": {"name": "Foo"}})
+
+    def worker():
+        assert store["foo"].value == {"name": "Foo"}
+        store.put("bar", {"name": "Bar"})
+        store.update("foo", lambda value: {**value, "price": 1})
+        store.close()
+
+    assert run_in_child(worker) == 0
+    reopened = ItemStore(tmp_path / "items")
+    assert reopened["foo"][:3] == (
+        {"name": "Foo", "price": 1},
+        2,
+        b'{"name":"Foo","price":1}',
+    )
+    assert reopened["bar"].value == {"name": "Bar"}
+    reopened.close()
+
+
+def test_one_process_at_a_time(tmp_path):
+    store = ItemStore(tmp_path / "items")
+    store.put("foo", 1)
+
+    def second_process():
+        with pytest.raises(StoreInUse):
+            store.put("foo", 2)
+
+    assert run_in_child(second_process) == 0
+    store.put("foo", 3)
+    store.close()
+    # released on close
+    assert run_in_child(lambda: ItemStore(tmp_path / "items").put("foo", 4)) == 0
+    reopened = ItemStore(tmp_path / "items")
+    assert reopened["foo"].value == 4
+    reopened.close()
+
+
+def test_writes_after_a_torn_write_are_kept(tmp_path):
+    store = ItemStore(tmp_path / "items", snapshot_every=3)
+    store.put("foo", 1)
+    store.close()
+    # a crash in the middle of the first write of the newest log
+    [log] = (tmp_path / "items").glob("log-*.jsonl")
+    log.write_bytes(b'{"seq":2,"id":"t')
+
+    def restart_and_crash():
+        store = ItemStore(tmp_path / "items", snapshot_every=3)
+        store.put("a", 1)
+        store.put("b", 2)
+
+    assert run_in_child(restart_and_crash) == 0
+    reopened = ItemStore(tmp_path / "items")
+    assert "a" in reopened and "b" in reopened
+    assert reopened.seq == 3
+    reopened.close()
+
+
+def test_etag_is_computed_with_the_record(tmp_path):
+    store = ItemStore(tmp_path / "items")
+    record = store.put("foo", {"name": "Foo"})
+    assert record.etag == '"' + sha1(record.encoded).hexdigest() + '"'
+    assert store.put("foo", {"name": "Bar"}).etag != record.etag
+    # the same after a restart
+    etag = store["foo"].etag
+    store.close()
+    reopened = ItemStore(tmp_path / "items")
+    assert reopened["foo"].etag == etag
+    reopened.close()
@@ -0,0 +1,18 @@
+from job_queue import JobQueue
+
+
+def test_database_is_created_on_first_use(tmp_path):
+    path = tmp_path / "jobs.db"
+    jobs = JobQueue(path)
+
+    @jobs.task()
+    def add(a: int, b: int) -> int:
+        return a + b
+
+    assert not path.exists()
+    job_id = jobs.enqueue("add", a=1, b=2)
+    assert path.exists()
+    assert jobs.run_one()
+    job = jobs.get(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == 3
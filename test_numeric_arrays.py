@@ -0,0 +1,122 @@
+import json
+
+import numpy as np
+import pytest
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from numeric_arrays import (
+    NumericMap,
+    NumericMapBody,
+    is_simple_json_map,
+    numeric_map_response,
+    parse_json_map,
+)
+
+app = FastAPI()
+
+
+@app.post("/weights/")
+async def create_weights(
+    request: Request, weights: NumericMap = Depends(NumericMapBody())
+):
+    return numeric_map_response(weights, request)
+
+
+client = TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'{"1": 0.5, "-2": 1e3, "30": -0.25E-2, "4": 0}',
+        b'{ "1" : 2 }',
+        b"{}",
+        b'{"1": 1, "1": 2}',
+        # valid JSON the vectorized check leaves to the json module
+        b'{"01": 1.5}',
+        b'{"1": 1.5, "2": 1e400}',
+    ],
+)
+def test_same_as_json(body):
+    numeric_map = parse_json_map(body)
+    expected = json.loads(body)
+    assert dict(zip(numeric_map.keys.tolist(), numeric_map.values.tolist())) == {
+        int(key): float(value) for key, value in expected.items()
+    }
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'{"1": inf}',
+        b'{"1": NaN}',
+        b'{"1": Infinity}',
+        b'{"1": "2"}',
+        b'{"1": true}',
+        b'{"1": null}',
+        b'{"1": 2 "2": 3}',
+        b"{1: 2}",
+        b'{"1": 2,}',
+        b'{"1": 2, "2"}',
+        b'{"1": , "2 3": 4}',
+        b'{"1.5": 2}',
+        b'{"a": 2}',
+        b'{"1": 1.}',
+        b'{"1": .5}',
+        b'{"1": +1}',
+        b'{"1": 01}',
+        b'{"1": 1e}',
+        b'{"1": 1e5.5}',
+        b'{"1": 1-2}',
+        b'{"1": 1.2.3}',
+        b'{"1": 2}}',
+        b"[1, 2]",
+        b'{"1": 1e400}',
+    ],
+)
+def test_invalid_bodies(body):
+    response = client.post(
+        "/weights/", data=body, headers={"content-type": "application/json"}
+    )
+    assert response.status_code == 422, response.text
+
+
+def test_fast_path():
+    body = json.dumps({str(i): i / 3 for i in range(-500, 500)}).encode()
+    assert is_simple_json_map(body)
+    response = client.post(
+        "/weights/", data=body, headers={"content-type": "application/json"}
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["keys"] == list(range(-500, 500))
+    assert np.allclose(content["values"], [i / 3 for i in range(-500, 500)])
+
+
+def test_fast_path_only_accepts_json():
+    # mutations of a valid body: whenever the vectorized check accepts one,
+    # the json module agrees on its content
+    rng = np.random.default_rng(0)
+    template = b'{"1": 0.5, "-20": 1e3, "3": -0.25E-2, "4": 10}'
+    alphabet = b'0123456789.eE+-{}":, '
+    for _ in range(20_000):
+        body = bytearray(template)
+        for _ in range(rng.integers(1, 4)):
+            position = rng.integers(len(body))
+            action = rng.integers(3)
+            char = alphabet[rng.integers(len(alphabet))]
+            if action == 0:
+                del body[position]
+            elif action == 1:
+                body.insert(position, char)
+            else:
+                body[position] = char
+        body = bytes(body)
+        if not is_simple_json_map(body):
+            continue
+        expected = {int(key): value for key, value in json.loads(body).items()}
+        numeric_map = parse_json_map(body)
+        assert dict(zip(numeric_map.keys.tolist(), numeric_map.values.tolist())) == {
+            key: float(value) for key, value in expected.items()
+        }, body
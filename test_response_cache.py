@@ -0,0 +1,49 @@
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.testclient import TestClient
+
+from response_cache import CachedRoute, cache_response
+from single_flight import SingleFlightRoute, single_flight
+from ttl_cache import TTLCache
+
+TOKENS = {"alice-token": "alice", "bob-token": "bob"}
+
+
+class Route(CachedRoute, SingleFlightRoute):
+    pass
+
+
+def current_user(authorization: str = Header(default="")) -> str:
+    user = TOKENS.get(authorization.removeprefix("Bearer "))
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.router.route_class = Route
+
+    @app.get("/me")
+    @cache_response(ttl=60, cache=TTLCache(max_entries=100))
+    @single_flight()
+    def read_me(user: str = Depends(current_user)):
+        return {"user": user}
+
+    return app
+
+
+def test_credentials_are_part_of_the_key():
+    client = TestClient(create_app())
+    alice = {"authorization": "Bearer alice-token"}
+    bob = {"authorization": "Bearer bob-token"}
+    assert client.get("/me", headers=alice).headers["x-cache"] == "miss"
+    response = client.get("/me", headers=alice)
+    assert response.headers["x-cache"] == "hit"
+    assert response.json() == {"user": "alice"}
+    # a shared cache must not keep it
+    assert response.headers["cache-control"].startswith("private")
+    response = client.get("/me", headers=bob)
+    assert response.headers["x-cache"] == "miss"
+    assert response.json() == {"user": "bob"}
+    assert client.get("/me").status_code == 401
+    assert client.get("/me", headers={"authorization": "Bearer bad"}).status_code == 401
@@ -0,0 +1,102 @@
+import pytest
+
+from blob_store import BlobStore
+from job_queue import JobQueue
+from resumable_uploads import (
+    LengthExceeded,
+    OffsetMismatch,
+    UploadBusy,
+    UploadFinalizing,
+    UploadIncomplete,
+    UploadSessions,
+)
+
+
+def test_one_append_at_a_time(tmp_path):
+    sessions = UploadSessions(tmp_path)
+    upload_id = sessions.create("a.bin", length=10)["upload_id"]
+    first = sessions.open_for_append(upload_id, 0)
+    with pytest.raises(UploadBusy):
+        sessions.open_for_append(upload_id, 0)
+    first.write(b"abcd")
+    first.close()
+    # the second request retries with the old offset
+    with pytest.raises(OffsetMismatch) as exc:
+        sessions.open_for_append(upload_id, 0)
+    assert exc.value.expected == 4
+
+
+def test_chunk_past_length_is_dropped(tmp_path):
+    sessions = UploadSessions(tmp_path)
+    upload_id = sessions.create("a.bin", length=6)["upload_id"]
+    appender = sessions.open_for_append(upload_id, 0)
+    appender.write(b"abc")
+    appender.close()
+    appender = sessions.open_for_append(upload_id, 3)
+    appender.write(b"de")
+    with pytest.raises(LengthExceeded):
+        appender.write(b"fgh")
+    appender.close()
+    assert sessions.get(upload_id)["offset"] == 3
+    # the session can still be completed
+    appender = sessions.open_for_append(upload_id, 3)
+    appender.write(b"def")
+    appender.close()
+    assert sessions.data_path(upload_id).read_bytes() == b"abcdef"
+
+
+def test_expire_keeps_sessions_being_created(tmp_path):
+    sessions = UploadSessions(tmp_path, max_age_seconds=60)
+    # create() has made the directory but not the data file yet
+    (tmp_path / "new-session").mkdir()
+    upload_id = sessions.create("a.bin")["upload_id"]
+    assert sessions.expire() == 0
+    assert (tmp_path / "new-session").exists()
+    sessions.get(upload_id)
+
+
+def test_no_chunks_once_completed(tmp_path):
+    sessions = UploadSessions(tmp_path)
+    upload_id = sessions.create("a.bin")["upload_id"]
+    appender = sessions.open_for_append(upload_id, 0)
+    # not while a chunk is being written
+    with pytest.raises(UploadBusy):
+        sessions.finalize(upload_id, lambda session: 1)
+    appender.write(b"abc")
+    appender.close()
+    jobs = []
+
+    def start_job(session: dict) -> int:
+        jobs.append(session["upload_id"])
+        return len(jobs)
+
+    assert sessions.finalize(upload_id, start_job) == 1
+    with pytest.raises(UploadFinalizing) as exc:
+        sessions.open_for_append(upload_id, 3)
+    assert exc.value.job_id == 1
+    # completing again returns the same job
+    assert sessions.finalize(upload_id, start_job) == 1
+    assert jobs == [upload_id]
+    assert sessions.get(upload_id)["job_id"] == 1
+
+
+def test_incomplete_upload_is_not_finalized(tmp_path):
+    sessions = UploadSessions(tmp_path)
+    upload_id = sessions.create("a.bin", length=4)["upload_id"]
+    with pytest.raises(UploadIncomplete):
+        sessions.finalize(upload_id, lambda session: 1)
+    sessions.open_for_append(upload_id, 0).close()
+
+
+def test_stores_are_created_on_first_use(tmp_path):
+    # as request_files declares them at import
+    blob_store = BlobStore(tmp_path / "blob_store")
+    sessions = UploadSessions(blob_store.root / "sessions")
+    jobs = JobQueue(blob_store.root / "jobs.db")
+    assert sessions.expire() == 0
+    assert not blob_store.root.exists()
+    upload_id = sessions.create("a.bin")["upload_id"]
+    assert sessions.get(upload_id)["offset"] == 0
+    assert blob_store.ingest_bytes(b"abc")[1] == 3
+    assert jobs.get(1) is None
+    assert (blob_store.root / "jobs.db").exists()
@@ -0,0 +1,131 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from sql_app import crud, models, rebalance, sharding
+from sql_app.database import get_engine, shard_url
+from sql_app.main import create_app
+from sql_app.sharding import Shards
+
+
+def wait_for_job(client: TestClient, location: str) -> dict:
+    for _ in range(200):
+        job = client.get(location).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"{location} is still {job['status']}")
+
+
+def test_password_is_hashed_by_a_job(sql_app_dir):
+    with TestClient(create_app()) as client:
+        response = client.post(
+            "/users/", json={"email": "alice@example.com", "password": "secret"}
+        )
+        assert response.status_code == 202
+        user = response.json()
+        assert user["has_password"] is False
+        # cached until the job is done
+        assert client.get(f"/users/{user['id']}").json()["has_password"] is False
+        job = wait_for_job(client, response.headers["location"])
+        assert job["status"] == "done"
+        assert client.get(f"/users/{user['id']}").json()["has_password"] is True
+
+    db = Shards()
+    try:
+        db_user = crud.get_user(db, user["id"])
+        assert crud.get_pwd_context().verify("secret", db_user.hashed_password)
+    finally:
+        db.close()
+
+
+def test_stale_email_registration_is_taken_over(sql_app_dir):
+    with TestClient(create_app()) as client:
+        # a process died between registering the email and storing the user
+        sharding.register_email("alice@example.com", 999)
+        response = client.post(
+            "/users/", json={"email": "alice@example.com", "password": "secret"}
+        )
+        assert response.status_code == 202
+        user_id = response.json()["id"]
+        assert sharding.user_id_for_email("alice@example.com") == user_id
+        response = client.post(
+            "/users/", json={"email": "alice@example.com", "password": "other"}
+        )
+        assert response.status_code == 400
+
+
+def stored(shards: int) -> dict[str, dict[int, int]]:
+    """Shard of each user id and of each item id."""
+    rows = {"users": {}, "items": {}}
+    for index in range(shards):
+        with get_engine(shard_url(index)).connect() as conn:
+            for table in ("users", "items"):
+                for (row_id,) in conn.execute(
+                    select(models.Base.metadata.tables[table].c.id)
+                ):
+                    assert row_id not in rows[table], "stored twice"
+                    rows[table][row_id] = index
+    return rows
+
+
+def add_users(count: int) -> None:
+    sharding.create_all(1)
+    db = Shards(1)
+    try:
+        session = db.session(0)
+        for user_id in range(1, count + 1):
+            session.add(models.User(id=user_id, email=f"user{user_id}@example.com"))
+            session.add(models.Item(id=user_id, title="Item", owner_id=user_id))
+        session.commit()
+    finally:
+        db.close()
+
+
+def test_rebalance(sql_app_dir):
+    add_users(100)
+    moved = rebalance.rebalance(1, 3, batch=30)
+    rows = stored(3)
+    assert len(rows["users"]) == len(rows["items"]) == 100
+    for user_id, index in rows["users"].items():
+        assert index == sharding.shard_of(user_id, 3)
+        # items stay with their owner
+        assert rows["items"][user_id] == index
+    assert sum(moved.values()) == sum(1 for index in rows["users"].values() if index)
+    assert set(moved) == {(0, 1), (0, 2)}
+    # and back to two: shard 2 empties, nothing else moves between 0 and 1
+    moved = rebalance.rebalance(3, 2)
+    assert set(moved) <= {(2, 0), (2, 1)}
+    rows = stored(3)
+    assert all(
+        index == sharding.shard_of(user_id, 2)
+        for user_id, index in rows["users"].items()
+    )
+    assert len(rows["users"]) == 100
+
+
+def test_rebalance_again_after_an_interruption(sql_app_dir, monkeypatch):
+    add_users(100)
+    deletes = 0
+    delete = rebalance.delete
+
+    def interrupted_delete(table):
+        # rows of the second batch are copied, then the run stops
+        nonlocal deletes
+        deletes += 1
+        if deletes == 3:
+            raise KeyboardInterrupt
+        return delete(table)
+
+    monkeypatch.setattr(rebalance, "delete", interrupted_delete)
+    with pytest.raises(KeyboardInterrupt):
+        rebalance.rebalance(1, 4, batch=20)
+    monkeypatch.setattr(rebalance, "delete", delete)
+    rebalance.rebalance(1, 4, batch=20)
+    rows = stored(4)
+    assert len(rows["users"]) == len(rows["items"]) == 100
+    for user_id, index in rows["users"].items():
+        assert index == sharding.shard_of(user_id, 4)
+        assert rows["items"][user_id] == index
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel
+
+from streaming_json import StreamedBody
+
+
+class Item(BaseModel):
+    name: str
+    price: float
+    tax: float | None = None
+
+
+class Offer(BaseModel):
+    name: str
+    price: float
+    items: list[Item]
+
+
+class ChunkedRequest:
+    def __init__(self, *chunks: bytes):
+        self.chunks = chunks
+        self.read = 0
+
+    async def stream(self):
+        for chunk in self.chunks:
+            self.read += len(chunk)
+            yield chunk
+
+
+def read_offer(*chunks: bytes) -> tuple[Offer, list[Item]]:
+    async def read():
+        elements = StreamedBody(Offer, array_field="items")(ChunkedRequest(*chunks))
+        items = [item async for item in elements]
+        return elements.fields(), items
+
+    return asyncio.run(read())
+
+
+BODY = json.dumps(
+    {
+        "name": "Offer",
+        "price": 12.5,
+        "items": [
+            {"name": "a", "price": 1e-3, "tax": -0.25e2},
+            {"name": "b", "price": 10.75, "tax": 2},
+            {"name": "c", "price": 1e3},
+        ],
+    }
+).encode()
+
+
+KEYWORDS_BODY = json.dumps(
+    {
+        "name": 'Offer \u00e9"',
+        "price": 1,
+        "active": True,
+        "items": [{"name": "\u00e9t\u00e9", "price": -1, "tax": None, "new": False}],
+    }
+).encode()
+
+
+@pytest.mark.parametrize("body", [BODY, KEYWORDS_BODY])
+def test_split_at_every_offset(body):
+    expected = read_offer(body)
+    for split in range(1, len(body)):
+        assert read_offer(body[:split], body[split:]) == expected, split
+
+
+def test_prices():
+    assert [item.price for item in read_offer(BODY)[1]] == [1e-3, 10.75, 1e3]
+
+
+def test_bytewise_chunks():
+    assert read_offer(*(BODY[i : i + 1] for i in range(len(BODY)))) == read_offer(BODY)
+
+
+def test_invalid_number_is_rejected():
+    with pytest.raises(RequestValidationError):
+        read_offer(b'{"name": "x", "price": 1., "items": []}')
+
+
+def test_syntax_error_stops_reading():
+    # an element much bigger than the chunks, wrong early on
+    body = (
+        b'{"name": "x", "price": 1, "items": [{"name": "%s", "price": oops, "tax": "%s"}]}'
+        % (
+            b"a" * 10_000,
+            b"b" * 1_000_000,
+        )
+    )
+    request = ChunkedRequest(*(body[i : i + 100] for i in range(0, len(body), 100)))
+
+    async def read():
+        elements = StreamedBody(Offer, array_field="items")(request)
+        return [item async for item in elements]
+
+    with pytest.raises(RequestValidationError) as exc:
+        asyncio.run(read())
+    assert exc.value.errors()[0]["msg"] == "Expecting value"
+    assert request.read < 30_000
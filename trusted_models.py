@@ -0,0 +1,97 @@
+# Converting between related models (UserIn -> UserInDB -> UserOut) without
+# validating the same data again
+# https://fastapi.tiangolo.com/tutorial/extra-models/
+#
+# `UserInDB(**user_in.dict(), hashed_password=...)` validates every field a
+# second time, EmailStr included, and returning it with response_model=UserOut
+# validates it a third time. convert() copies the fields both models declare
+# with the same type as they are (Model.construct) and only validates the others.
+# trusted() marks a returned value as already valid: CompiledResponseRoute then
+# picks the response model's fields from it without checking the scalars.
+# Nested models still keep only the fields their response model declares.
+from typing import Any, Generic, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+M = TypeVar("M", bound=BaseModel)
+T = TypeVar("T")
+
+
+class Trusted(Generic[T]):
+    __slots__ = ("value",)
+
+    def __init__(self, value: T):
+        self.value = value
+
+
+def trusted(value: T) -> Trusted[T]:
+    """Return this from an endpoint of a CompiledResponseRoute to skip validation."""
+    return Trusted(value)
+
+
+class ConversionPlan:
+    """Which target fields can be copied from the source and which need validation."""
+
+    def __init__(self, source: type[BaseModel] | None, target: type[BaseModel]):
+        self.copied: list[str] = []
+        self.validated: list[str] = []
+        for name, field in target.__fields__.items():
+            source_field = None if source is None else source.__fields__.get(name)
+            if source_field is None and source is not None:
+                continue
+            if field.class_validators or (
+                source_field is not None
+                and source_field.outer_type_ != field.outer_type_
+            ):
+                self.validated.append(name)
+            else:
+                self.copied.append(name)
+        self.required = {
+            name for name, field in target.__fields__.items() if field.required
+        }
+        # root validators may depend on any field, keep pydantic's behaviour
+        self.full_validation = bool(
+            target.__pre_root_validators__ or target.__post_root_validators__
+        )
+
+
+plans: dict[tuple[type | None, type], ConversionPlan] = {}
+
+
+def convert(source: BaseModel | dict[str, Any], target: type[M], **values: Any) -> M:
+    """
+    A `target` instance from the fields of `source` plus `values`.
+
+    `source` is a validated model, or a dict from a trusted store (a database
+    row): its values are used as they are. Keyword `values` are trusted too.
+    """
+    source_model = type(source) if isinstance(source, BaseModel) else None
+    plan = plans.get((source_model, target))
+    if plan is None:
+        plan = plans[source_model, target] = ConversionPlan(source_model, target)
+    data = source.__dict__ if source_model is not None else source
+
+    if plan.full_validation:
+        return target.parse_obj({**data, **values})
+
+    fields = {name: data[name] for name in plan.copied if name in data}
+    errors = []
+    for name in plan.validated:
+        if name in data and name not in values:
+            field = target.__fields__[name]
+            value, error = field.validate(data[name], fields, loc=name, cls=target)
+            if error:
+                errors.append(error)
+            fields[name] = value
+    if errors:
+        raise ValidationError(errors, target)
+    fields.update(values)
+
+    missing = plan.required - fields.keys()
+    if missing:
+        raise TypeError(f"{target.__name__} needs {', '.join(sorted(missing))}")
+    if source_model is not None:
+        fields_set = (source.__fields_set__ | values.keys()) & target.__fields__.keys()
+    else:
+        fields_set = fields.keys() & target.__fields__.keys()
+    return target.construct(_fields_set=fields_set, **fields)
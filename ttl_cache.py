@@ -0,0 +1,115 @@
+# An in-memory cache with per-entry TTL, LRU eviction and a memory budget
+#
+# Thread-safe, sync endpoints and dependencies run in the threadpool. Entries
+# can carry tags so a group of them (e.g. every cached response for one path)
+# is dropped with one `invalidate_tag()` call.
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, NamedTuple
+
+
+class Entry(NamedTuple):
+    value: Any
+    size: int
+    stored_at: float
+    expires_at: float
+    tags: tuple[Hashable, ...]
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+
+class TTLCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int | None = None,
+        default_ttl: float = 60,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.entries: OrderedDict[Hashable, Entry] = OrderedDict()
+        self.tagged: dict[Hashable, set[Hashable]] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Entry | None:
+        """The live entry for `key`, marked as recently used, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self.remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        size: int = 1,
+        ttl: float | None = None,
+        tags: Iterable[Hashable] = (),
+    ) -> None:
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        now = time.monotonic()
+        ttl = self.default_ttl if ttl is None else ttl
+        entry = Entry(value, size, now, now + ttl, tuple(tags))
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = entry
+            self.size += size
+            for tag in entry.tags:
+                self.tagged.setdefault(tag, set()).add(key)
+            self.evict()
+
+    def evict(self) -> None:
+        # least recently used first, called with the lock held
+        while len(self.entries) > self.max_entries or (
+            self.max_bytes is not None and self.size > self.max_bytes
+        ):
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key: Hashable) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self.tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tagged[tag]
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            self.remove(key)
+
+    def invalidate_tag(self, tag: Hashable) -> int:
+        """Drop every entry stored with `tag`, returns how many were dropped."""
+        with self.lock:
+            keys = list(self.tagged.get(tag, ()))
+            for key in keys:
+                self.remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.tagged.clear()
+            self.size = 0
@@ -1,7 +1,12 @@
 from fastapi import FastAPI
 from pydantic import BaseModel, EmailStr
 
+from fast_serializers import CompiledResponseRoute
+from trusted_models import trusted
+
 app = FastAPI()
+# returns trusted(...) values, serialized without validating them again
+app.router.route_class = CompiledResponseRoute
 
 
 class UserIn(BaseModel):
@@ -19,4 +24,5 @@ class UserOut(BaseModel):
 
 @app.post("/user/", response_model=UserOut)
 async def create_user(user: UserIn):
-    return user
+    # validated as UserIn already, UserOut's fields are picked from it
+    return trusted(user)
@@ -1,8 +1,30 @@
-from fastapi import FastAPI
+import logging
+
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 
+import json_logging
+from fast_serializers import CompiledResponseRoute
+from job_queue import JobQueue, jobs_router
+from trusted_models import convert, trusted
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
+# returns trusted(...) values, serialized without validating them again
+app.router.route_class = CompiledResponseRoute
+# users are saved after the response, GET /jobs/{id} tells when
+jobs = JobQueue("jobs.db")
+app.include_router(jobs_router(jobs))
+
+
+# JSON logs, started with the app rather than at import
+@app.on_event("startup")
+def start_logging():
+    json_logging.start()
+
 
 class UserBase(BaseModel):
     username: str
@@ -28,12 +50,20 @@ def fake_password_hasher(raw_password: str):
 
 def fake_save_user(user_in: UserIn):
     hashed_password = fake_password_hasher(user_in.password)
-    user_in_db = UserInDB(**user_in.dict(), hashed_password=hashed_password)
-    print("User saved! ..not really")
+    # user_in is already valid, only hashed_password is new
+    user_in_db = convert(user_in, UserInDB, hashed_password=hashed_password)
+    logger.info("User saved! ..not really", extra={"username": user_in.username})
     return user_in_db
 
 
-@app.post("/user/", response_model=UserOut)
-async def create_user(user_in: UserIn):
-    user_saved = fake_save_user(user_in)
-    return user_saved
+# the password is in the job's arguments until it is done
+@jobs.task(max_attempts=5, secret=True)
+def save_user(user: dict):
+    fake_save_user(convert(user, UserIn))
+
+
+@app.post("/user/", response_model=UserOut, status_code=202)
+async def create_user(user_in: UserIn, response: Response):
+    job_id = await run_in_threadpool(jobs.enqueue, "save_user", user=user_in.dict())
+    response.headers["location"] = f"/jobs/{job_id}"
+    return trusted(user_in)
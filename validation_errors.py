@@ -0,0 +1,84 @@
+# Bounded 422 responses for invalid request bodies
+# https://fastapi.tiangolo.com/tutorial/handling-errors/#use-the-requestvalidationerror-body
+#
+# exc.errors() flattens every error of the body and echoing exc.body encodes
+# the whole input again: a 50 MB Offer with thousands of bad items turns into a
+# response as large as the request. bounded_validation_handler() reports the
+# first `max_errors` errors only (pydantic's flatten_errors is lazy, the rest
+# are never looked at), omits or truncates the body, and builds the JSON from
+# pre-encoded fragments.
+#
+#     app.add_exception_handler(RequestValidationError, bounded_validation_handler())
+from itertools import islice
+from typing import Any, Iterator
+
+import orjson
+from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic.error_wrappers import flatten_errors
+from starlette.status import HTTP_422_UNPROCESSABLE_ENTITY
+
+# '"msg":...,"type":...' for each (msg, type) seen, most errors repeat
+error_fragments: dict[tuple[str, str], bytes] = {}
+MAX_FRAGMENTS = 1024
+
+
+def errors(exc: RequestValidationError) -> Iterator[dict[str, Any]]:
+    """exc.errors(), one at a time."""
+    return flatten_errors(exc.raw_errors, exc.model.__config__)
+
+
+def encode_error(error: dict[str, Any]) -> bytes:
+    key = (error["msg"], error["type"])
+    fragment = error_fragments.get(key)
+    if fragment is None:
+        if len(error_fragments) >= MAX_FRAGMENTS:
+            error_fragments.clear()
+        fragment = orjson.dumps({"msg": key[0], "type": key[1]})[1:-1]
+        error_fragments[key] = fragment
+    parts = [b'{"loc":', orjson.dumps(error["loc"]), b",", fragment]
+    if "ctx" in error:
+        parts += [b',"ctx":', orjson.dumps(error["ctx"], default=str)]
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+def body_preview(body: Any, max_body_bytes: int) -> bytes | None:
+    if isinstance(body, str):
+        body = body.encode()
+    elif not isinstance(body, bytes):
+        body = orjson.dumps(body, default=str)
+    if len(body) <= max_body_bytes:
+        return orjson.dumps(body.decode(errors="replace"))
+    preview = body[:max_body_bytes].decode(errors="ignore")
+    return orjson.dumps(f"{preview}... ({len(body)} bytes)")
+
+
+def bounded_validation_handler(
+    max_errors: int = 20, echo_body: bool = False, max_body_bytes: int = 1024
+):
+    """
+    A RequestValidationError handler answering
+    {"detail": [first max_errors errors], "truncated": bool, "body": preview}.
+    The body is only echoed (as a string, truncated) with `echo_body=True`.
+    """
+
+    async def handler(request: Request, exc: RequestValidationError) -> Response:
+        first = list(islice(errors(exc), max_errors + 1))
+        truncated = len(first) > max_errors
+        parts = [
+            b'{"detail":[',
+            b",".join(encode_error(error) for error in first[:max_errors]),
+            b'],"truncated":',
+            b"true" if truncated else b"false",
+        ]
+        if echo_body and exc.body is not None:
+            parts += [b',"body":', body_preview(exc.body, max_body_bytes)]
+        parts.append(b"}")
+        return Response(
+            b"".join(parts),
+            status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+            media_type="application/json",
+        )
+
+    return handler